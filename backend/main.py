@@ -1,7 +1,7 @@
 import os
 import io
-import shutil
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, request, send_file, jsonify
 import google.generativeai as genai
 from google.generativeai.types import HarmCategory, HarmBlockThreshold
@@ -44,18 +44,20 @@ CORS(app, resources={
 genai.configure(api_key=api_key)
 model = genai.GenerativeModel(model_name="gemini-2.0-flash",tools=[add_to_database])
 
-# Directories
-TEMP_DIR = "temp_files"
-IMAGE_DIR = os.path.join(TEMP_DIR, "compressed_images")
-TEXT_DIR = os.path.join(TEMP_DIR, "alt_texts")
-ZIP_PATH = os.path.join(TEMP_DIR, "compressed_results.zip")
+# Images compressed in parallel per request. Pillow releases the GIL while
+# encoding and decoding, so threads spread this work across cores; run under
+# `gunicorn -w <cores> --threads <n>` for request-level parallelism on top.
+COMPRESS_WORKERS = int(os.getenv("COMPRESS_WORKERS", os.cpu_count() or 1))
 
-os.makedirs(IMAGE_DIR, exist_ok=True)
-os.makedirs(TEXT_DIR, exist_ok=True)
+# Everything below works on bytes in memory: no shared directories, so
+# concurrent requests in one process (threads) or many (workers) can't see
+# or delete each other's files.
 
 def extract_images_from_docx(docx_bytes):
-    """Extract images from DOCX while preserving their order in the document."""
-    extracted_images = []
+    """Extract and compress images from DOCX while preserving their order in the document.
+
+    Returns (name, bytes) pairs, e.g. ("compressed_001.jpg", b"...").
+    """
     image_rels = {}  # Map relationship IDs to image files
     image_order = []  # Store the order of images as they appear
 
@@ -94,69 +96,75 @@ def extract_images_from_docx(docx_bytes):
             image_order = [name.split('/')[-1] for name in docx_zip.namelist()
                           if name.startswith('word/media/')]
 
+        jobs = []
         for idx, img_name in enumerate(image_order, 1):
             try:
-                img_data = docx_zip.read(f'word/media/{img_name}')
-                file_path = os.path.join(IMAGE_DIR, img_name)
-
-                with open(file_path, "wb") as img_file:
-                    img_file.write(img_data)
-
-                base_name = f"{idx:03d}"
-                if img_name.lower().endswith(("jpeg", "jpg")):
-                    compressed_path = os.path.join(IMAGE_DIR, f"compressed_{base_name}.jpg")
-                elif img_name.lower().endswith("png"):
-                    compressed_path = os.path.join(IMAGE_DIR, f"compressed_{base_name}.jpg")  # Convert PNG to JPG
-                elif img_name.lower().endswith("gif"):
-                    compressed_path = os.path.join(IMAGE_DIR, f"compressed_{base_name}.gif")
-                else:
-                    compressed_path = os.path.join(IMAGE_DIR, f"compressed_{base_name}.jpg")  # Default to JPG
-
-                if img_name.lower().endswith(("jpeg", "jpg", "png")):
-                    compress_image(file_path, compressed_path, 100)
-                elif img_name.lower().endswith("gif"):
-                    compress_gif(file_path, compressed_path, 500)
-                else:
-                    try:
-                        img = Image.open(file_path)
-                        if img.mode == "RGBA":
-                            img = img.convert("RGB")
-                        img.save(compressed_path, "JPEG", quality=95)
-                    except Exception as e:
-                        print(f"Error converting unknown format: {e}")
-                        continue
-
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-
-                print(f"Processed image {idx}: {img_name}")
-                extracted_images.append(compressed_path)
-
+                jobs.append((idx, img_name, docx_zip.read(f'word/media/{img_name}')))
             except Exception as e:
                 print(f"Error processing image {img_name}: {e}")
 
-    return sorted(extracted_images)
+    with ThreadPoolExecutor(max_workers=COMPRESS_WORKERS) as pool:
+        results = pool.map(lambda job: process_image(*job), jobs)
+        return sorted(result for result in results if result is not None)
 
-def compress_image(image_path, output_path, max_size_kb):
-    """Compress an image (JPG/PNG) to a max size in KB."""
-    image = Image.open(image_path)
+def process_image(idx, img_name, img_data):
+    """Compress one image from the document. Returns (name, bytes), or None if it can't be used."""
+    try:
+        base_name = f"{idx:03d}"
+        if img_name.lower().endswith(("jpeg", "jpg", "png")):
+            compressed_name = f"compressed_{base_name}.jpg"  # Convert PNG to JPG
+            compressed = compress_image(img_data, 100)
+        elif img_name.lower().endswith("gif"):
+            compressed_name = f"compressed_{base_name}.gif"
+            compressed = compress_gif(img_data, 500)
+        else:
+            compressed_name = f"compressed_{base_name}.jpg"  # Default to JPG
+            try:
+                img = Image.open(io.BytesIO(img_data))
+                if img.mode == "RGBA":
+                    img = img.convert("RGB")
+                output = io.BytesIO()
+                img.save(output, "JPEG", quality=95)
+                compressed = output.getvalue()
+            except Exception as e:
+                print(f"Error converting unknown format: {e}")
+                return None
 
-    if image.mode == "RGBA":
+        if compressed is None:
+            return None
+        print(f"Processed image {idx}: {img_name}")
+        return compressed_name, compressed
+
+    except Exception as e:
+        print(f"Error processing image {img_name}: {e}")
+        return None
+
+def compress_image(image_data, max_size_kb):
+    """Compress an image (JPG/PNG) to a max size in KB. Returns the JPEG bytes."""
+    image = Image.open(io.BytesIO(image_data))
+
+    if image.mode in ("RGBA", "P", "LA"):
         image = image.convert("RGB")
 
     quality = 95
     while quality > 10:
-        image.save(output_path, "JPEG", quality=quality)
-        if os.path.getsize(output_path) <= max_size_kb * 1024:
+        output = io.BytesIO()
+        image.save(output, "JPEG", quality=quality)
+        if output.tell() <= max_size_kb * 1024:
             break
         quality -= 5
+    return output.getvalue()
+
+def compress_gif(image_data, max_size_kb, max_attempts=3):
+    """Compress a GIF while preserving animation.
 
-def compress_gif(image_path, output_path, max_size_kb, max_attempts=3):
-    """Compress a GIF while preserving animation."""
-    image = Image.open(image_path)
+    Returns the smallest attempt's bytes (even if still over the limit), or
+    None if the data isn't a GIF or couldn't be saved at all.
+    """
+    image = Image.open(io.BytesIO(image_data))
     if not isinstance(image, GifImagePlugin.GifImageFile):
-        print(f"Skipping {image_path}: Not a valid GIF")
-        return
+        print("Skipping image: Not a valid GIF")
+        return None
 
     original_width, original_height = image.size
     frames = []
@@ -174,6 +182,7 @@ def compress_gif(image_path, output_path, max_size_kb, max_attempts=3):
     attempt = 0
     scale_factor = 1.0
     current_colors = 256
+    compressed = None
 
     while attempt < max_attempts:
         new_width = max(50, int(original_width * scale_factor))
@@ -186,8 +195,9 @@ def compress_gif(image_path, output_path, max_size_kb, max_attempts=3):
             processed_frames.append(processed)
 
         try:
+            output = io.BytesIO()
             processed_frames[0].save(
-                output_path,
+                output,
                 format="GIF",
                 save_all=True,
                 append_images=processed_frames[1:],
@@ -196,14 +206,15 @@ def compress_gif(image_path, output_path, max_size_kb, max_attempts=3):
                 duration=durations,
                 disposal=2
             )
+            compressed = output.getvalue()
 
-            compressed_size_kb = os.path.getsize(output_path) / 1024
+            compressed_size_kb = len(compressed) / 1024
             print(f"Attempt {attempt + 1}: Compressed GIF size = {compressed_size_kb:.2f} KB")
             print(f"Current dimensions: {new_width}x{new_height}, Colors: {current_colors}")
 
             if compressed_size_kb <= max_size_kb:
                 print("✅ GIF compression successful")
-                return True
+                return compressed
 
         except Exception as e:
             print(f"Error during save attempt: {e}")
@@ -218,23 +229,21 @@ def compress_gif(image_path, output_path, max_size_kb, max_attempts=3):
         attempt += 1
 
     print("⚠️ GIF compression failed to reach the desired size limit.")
-    return False
+    return compressed
 
-def get_alt_texts(image_paths, batch_size=8):
-    """Processes images in batches and retrieves alt texts."""
+def get_alt_texts(images, batch_size=8):
+    """Processes (name, bytes) images in batches and retrieves alt texts, keyed by name."""
     alt_texts = {}
 
-    for i in range(0, len(image_paths), batch_size):
-        batch = image_paths[i:i + batch_size]
+    for i in range(0, len(images), batch_size):
+        batch = images[i:i + batch_size]
+        names = [name for name, _ in batch]
 
         try:
-            print(f"🖼️ Processing batch: {batch}")
+            print(f"🖼️ Processing batch: {names}")
 
-            image_data = []
-            for img_path in batch:
-                with open(img_path, "rb") as img_file:
-                    img_data = img_file.read()
-                    image_data.append({"inline_data": {"mime_type": "image/jpeg", "data": img_data}})
+            image_data = [{"inline_data": {"mime_type": "image/jpeg", "data": img_data}}
+                          for _, img_data in batch]
 
             response = model.generate_content(
                 contents=[
@@ -250,28 +259,29 @@ def get_alt_texts(image_paths, batch_size=8):
             fc = response.candidates[0].content.parts[0].function_call
             alt_text_list = type(fc).to_dict(fc)["args"]["alt_texts"]["texts"]
 
-            for img, alt_text in zip(batch, alt_text_list):
-                alt_texts[img] = alt_text
+            for name, alt_text in zip(names, alt_text_list):
+                alt_texts[name] = alt_text
 
             print(f"✅ Batch processed: {alt_text_list}")
 
         except Exception as e:
-            alt_texts[img_path] = f"Error: {str(e)}"
+            for name in names:
+                alt_texts[name] = f"Error: {str(e)}"
 
     return alt_texts
 
-def create_zip():
-    with zipfile.ZipFile(ZIP_PATH, "w", zipfile.ZIP_DEFLATED) as zipf:
-        for folder in [IMAGE_DIR, TEXT_DIR]:
-            for root, _, files in os.walk(folder):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    zipf.write(file_path, os.path.relpath(file_path, TEMP_DIR))
-
-def clean_temp_files():
-    shutil.rmtree(TEMP_DIR, ignore_errors=True)
-    os.makedirs(IMAGE_DIR, exist_ok=True)
-    os.makedirs(TEXT_DIR, exist_ok=True)
+def create_zip(images, alt_texts):
+    """Build the results archive in memory, laid out as before:
+    compressed_images/<name> and alt_texts/<stem>.txt."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
+        for name, img_data in images:
+            # Already compressed; deflating again only costs CPU
+            zipf.writestr(f"compressed_images/{name}", img_data, compress_type=zipfile.ZIP_STORED)
+        for name, alt_text in alt_texts.items():
+            zipf.writestr(f"alt_texts/{os.path.splitext(name)[0]}.txt", alt_text)
+    buffer.seek(0)
+    return buffer
 
 @app.route("/upload_pdf", methods=["POST"])
 def upload_pdf():
@@ -283,72 +293,25 @@ def upload_pdf():
         if file.filename == "":
             return jsonify({"error": "No file selected"}), 400
 
-        # Clean up before starting new process
-        if os.path.exists(ZIP_PATH):
-            try:
-                os.remove(ZIP_PATH)
-            except Exception as e:
-                print(f"Could not remove existing ZIP: {e}")
-
-        # Clean directories but keep the structure
-        for folder in [IMAGE_DIR, TEXT_DIR]:
-            if os.path.exists(folder):
-                for filename in os.listdir(folder):
-                    file_path = os.path.join(folder, filename)
-                    try:
-                        if os.path.isfile(file_path):
-                            os.unlink(file_path)
-                    except Exception as e:
-                        print(f"Error deleting {file_path}: {e}")
-
         # Process the file
         docx_bytes = file.read()
         print("READ FILE!")
-        image_paths = extract_images_from_docx(docx_bytes)
-        if not image_paths:
+        images = extract_images_from_docx(docx_bytes)
+        if not images:
             return jsonify({"error": "No images found in PDF."}), 400
         print("IMAGES GOTTED!")
 
         # Generate alt texts
-        alt_texts = get_alt_texts(image_paths)
+        alt_texts = get_alt_texts(images)
         print("ALT TEXT GOTTED!")
 
-        # Save alt texts to text files
-        for img_path, alt_text in alt_texts.items():
-            txt_filename = os.path.join(TEXT_DIR, f"{os.path.splitext(os.path.basename(img_path))[0]}.txt")
-            with open(txt_filename, "w") as txt_file:
-                txt_file.write(alt_text)
-
-        create_zip()
-
-        # Debug: Check if ZIP exists
-        if not os.path.exists(ZIP_PATH):
-            return jsonify({"error": f"ZIP file missing at {ZIP_PATH}"}), 500
-
-        try:
-            return send_file(
-                ZIP_PATH,
-                mimetype='application/zip',
-                as_attachment=True,
-                download_name='compressed_results.zip',
-                max_age=0,  # Prevent caching
-            )
-        finally:
-            # Clean up after sending the file
-            try:
-                for folder in [IMAGE_DIR, TEXT_DIR]:
-                    for filename in os.listdir(folder):
-                        file_path = os.path.join(folder, filename)
-                        try:
-                            if os.path.isfile(file_path):
-                                os.unlink(file_path)
-                        except Exception as e:
-                            print(f"Error during cleanup: {e}")
-
-                if os.path.exists(ZIP_PATH):
-                    os.unlink(ZIP_PATH)
-            except Exception as e:
-                print(f"Cleanup error: {e}")
+        return send_file(
+            create_zip(images, alt_texts),
+            mimetype='application/zip',
+            as_attachment=True,
+            download_name='compressed_results.zip',
+            max_age=0,  # Prevent caching
+        )
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -0,0 +1,107 @@
+import os
+import math
+import time
+import asyncio
+from metrics import JOBS_RUNNING, JOBS_WAITING
+
+# Per-worker limits; with `--workers N` the instance runs up to N times these
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", 2))
+MAX_QUEUED_JOBS = int(os.getenv("MAX_QUEUED_JOBS", 8))
+# Smoothing factor for the moving averages of wait and run time
+EWMA_ALPHA = 0.2
+
+
+class QueueFull(Exception):
+    """Raised when a job can't even wait for a slot. Carries a Retry-After hint in seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__("Too many jobs queued")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Caps how many jobs run at once and how many may wait for a slot.
+
+    `reserve()` is synchronous so the caller can turn a full queue into a fast
+    429 before accepting the request; the returned ticket is then used as an
+    async context manager around the job, waiting for a run slot on entry.
+    """
+
+    def __init__(self, max_jobs=MAX_CONCURRENT_JOBS, max_queue=MAX_QUEUED_JOBS):
+        self.max_jobs = max_jobs
+        self.max_queue = max_queue
+        self.slots = asyncio.Semaphore(max_jobs)
+        self.running = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.avg_wait = 0.0
+        self.avg_run = 0.0
+
+    def reserve(self):
+        if self.running + self.waiting >= self.max_jobs + self.max_queue:
+            self.rejected += 1
+            raise QueueFull(self.retry_after())
+        self.waiting += 1
+        JOBS_WAITING.inc()
+        return _Ticket(self)
+
+    def retry_after(self):
+        """Rough seconds until a queue position frees up: one running job finishing."""
+        if not self.avg_run:
+            return 5
+        return max(1, math.ceil(self.avg_run / self.max_jobs))
+
+    def saturated(self):
+        return self.running + self.waiting >= self.max_jobs + self.max_queue
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "waiting": self.waiting,
+            "max_jobs": self.max_jobs,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+            "avg_wait_seconds": round(self.avg_wait, 3),
+            "avg_run_seconds": round(self.avg_run, 3),
+        }
+
+    def _record(self, attr, seconds):
+        current = getattr(self, attr)
+        setattr(self, attr, seconds if not current else current + EWMA_ALPHA * (seconds - current))
+
+
+class _Ticket:
+    def __init__(self, controller):
+        self.controller = controller
+        self.entered = None
+        self.reserved = time.monotonic()
+        self.open = True
+
+    def cancel(self):
+        """Give back a reservation that will never be entered."""
+        if self.open:
+            self.open = False
+            self.controller.waiting -= 1
+            JOBS_WAITING.dec()
+
+    async def __aenter__(self):
+        controller = self.controller
+        try:
+            await controller.slots.acquire()
+        finally:
+            self.open = False
+            controller.waiting -= 1
+            JOBS_WAITING.dec()
+        self.entered = time.monotonic()
+        controller._record("avg_wait", self.entered - self.reserved)
+        controller.running += 1
+        JOBS_RUNNING.inc()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        controller = self.controller
+        controller.running -= 1
+        JOBS_RUNNING.dec()
+        controller.slots.release()
+        controller._record("avg_run", time.monotonic() - self.entered)
+        return False
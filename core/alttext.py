@@ -0,0 +1,148 @@
+import os
+import sys
+import json
+import asyncio
+import logging
+
+# Where alt texts come from: "http" posts each batch to the gemini service at
+# ALT_TEXT_URL; "inprocess" calls the same Gemini logic directly on in-memory
+# bytes, for deployments where both services share a host
+ALT_TEXT_BACKEND = os.getenv("ALT_TEXT_BACKEND", "http")
+ALT_TEXT_URL = os.getenv("ALT_TEXT_URL", "https://altgenerator.onrender.com/generate-alt-texts")
+# Ask the gemini service to stream one NDJSON record per image as its internal batches finish
+ALT_TEXT_STREAM = os.getenv("ALT_TEXT_STREAM", "1") == "1"
+GEMINI_DIR = os.getenv("GEMINI_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "gemini"))
+# The gemini service's plain JSON answer reports a failed model call as an alt text starting with this
+ERROR_PREFIX = "Error: "
+
+log = logging.getLogger()
+
+
+class AltTextBackend:
+    """Interface for captioning one batch of images.
+
+    `stream` takes (name, bytes) pairs and yields (name, alt text) pairs as
+    they become available; `generate` collects them into a dict. The alt
+    text is None for an image the model failed to caption, so an error
+    message is never mistaken for a caption. Both raise if the batch failed
+    or an image got no answer at all.
+    """
+
+    async def stream(self, images):
+        raise NotImplementedError
+        yield
+
+    async def generate(self, images):
+        return {name: alt_text async for name, alt_text in self.stream(images)}
+
+    def warm_up(self):
+        """Load whatever the first batch would otherwise wait for. Blocking."""
+
+    async def aclose(self):
+        pass
+
+
+def _failed(name, error):
+    log.warning(f"No alt text for {name}: {error}")
+    return name, None
+
+
+class HttpAltTextBackend(AltTextBackend):
+    """Posts batches as multipart uploads to a gemini service, reusing connections between batches."""
+
+    def __init__(self, url=ALT_TEXT_URL, stream=ALT_TEXT_STREAM):
+        self.url = url
+        self.streaming = stream
+        self.client = None
+        self.loop = None
+
+    def warm_up(self):
+        # httpx is imported on first use; it is a large share of cold-start time
+        import httpx
+        return httpx
+
+    def _client(self):
+        # A client is tied to the event loop it was first used on
+        loop = asyncio.get_running_loop()
+        if self.client is None or self.client.is_closed or self.loop is not loop:
+            self.client = self.warm_up().AsyncClient(timeout=None)
+            self.loop = loop
+        return self.client
+
+    async def stream(self, images):
+        files = [("files", (name, data, "image/jpeg")) for name, data in images]
+        missing = {name for _, (name, _, _) in files}
+        async for name, alt_text in self._answers(files):
+            missing.discard(name)
+            yield name, alt_text
+        if missing:
+            # The answer ended early, e.g. a proxy closed the stream cleanly mid-batch
+            raise Exception(f"Gemini service sent no alt text for {len(missing)} of {len(files)} images")
+
+    async def _answers(self, files):
+        params = {"stream": "true"} if self.streaming else None
+        async with self._client().stream("POST", self.url, files=files, params=params) as response:
+            if response.status_code >= 400:
+                await response.aread()
+                log.error(f"HTTP error getting alt texts: {response.status_code} - {response.text}")
+                raise Exception(f"Gemini service returned error: {response.status_code}")
+            if not response.headers.get("content-type", "").startswith("application/x-ndjson"):
+                # A service without streaming support answers with one JSON object
+                for name, alt_text in json.loads(await response.aread()).items():
+                    if isinstance(alt_text, str) and alt_text.startswith(ERROR_PREFIX):
+                        yield _failed(name, alt_text)
+                    else:
+                        yield name, alt_text
+                return
+            async for line in response.aiter_lines():
+                if line:
+                    record = json.loads(line)
+                    if record.get("error"):
+                        yield _failed(record["name"], record["alt_text"])
+                    else:
+                        yield record["name"], record["alt_text"]
+
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+
+class InProcessAltTextBackend(AltTextBackend):
+    """Calls the gemini service's captioner directly: no upload, no disk, no hop.
+
+    Needs the gemini service's dependencies (gemini/requirements.txt) and its
+    API_KEY in this process.
+    """
+
+    def __init__(self, gemini_dir=GEMINI_DIR):
+        self.gemini_dir = os.path.abspath(gemini_dir)
+
+    def _captioner(self):
+        if self.gemini_dir not in sys.path:
+            sys.path.append(self.gemini_dir)
+        import captioner
+        return captioner
+
+    def warm_up(self):
+        # The captioner builds its model on first use, and the Gemini SDK takes seconds to load
+        self._captioner().warm_up()
+
+    async def stream(self, images):
+        captioner = await asyncio.to_thread(self._captioner)
+        async for batch_texts in captioner.iter_caption_batches(list(images)):
+            for name, alt_text in batch_texts.items():
+                if isinstance(alt_text, captioner.CaptionError):
+                    yield _failed(name, alt_text)
+                else:
+                    yield name, alt_text
+
+
+def get_alt_text_backend():
+    """Build the alt-text backend selected by the ALT_TEXT_BACKEND environment variable."""
+    if ALT_TEXT_BACKEND == "http":
+        return HttpAltTextBackend()
+    if ALT_TEXT_BACKEND == "inprocess":
+        log.info("Captioning in-process with the gemini captioner")
+        return InProcessAltTextBackend()
+    raise ValueError(f"Unknown ALT_TEXT_BACKEND: {ALT_TEXT_BACKEND}")
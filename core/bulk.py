@@ -0,0 +1,356 @@
+import os
+import sys
+import glob
+import json
+import time
+import hashlib
+import asyncio
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import utils
+from utils import (log, iter_images_from_docx, _send_batch, _folder_entries, _manifest_entries, delete_path,
+                   temp_path, alt_text_scheduler, alt_text_backend, ALT_TEXT_BATCH_SIZE, ALT_TEXT_CONCURRENCY)
+from preflight import BudgetExceeded, apply_limits
+from alttext import ERROR_PREFIX
+from zipstream import write_archive
+
+# Offline bulk captioning, for backfills:
+#
+#     python bulk.py "archive/**/*.docx" -o captioned/
+#
+# Documents are unpacked and compressed across a process pool. The parent
+# pools every document's images into shared alt-text batches, so small
+# documents fill batches together, and caches alt texts by image content so
+# an image repeated across documents (logos, letterheads) is captioned once.
+# Each finished document is appended to <output>/manifest.jsonl; running
+# again with the same output directory skips those and reuses the cache.
+# Only real captions are cached: a document with any image the model failed
+# to caption is recorded as failed, and captioned again on the next run.
+
+# Seconds a part-filled batch waits for images from other documents before it is sent
+BULK_BATCH_LINGER = float(os.getenv("BULK_BATCH_LINGER", 0.5))
+# Seconds between throughput reports
+BULK_REPORT_INTERVAL = float(os.getenv("BULK_REPORT_INTERVAL", 10))
+
+MANIFEST_FILE = "manifest.jsonl"
+CACHE_FILE = "alt_text_cache.jsonl"
+WORK_DIR = ".work"
+
+
+def _init_worker(work_dir):
+    """Process-pool initializer: scratch space under the output directory
+    (never the service's temp_files), and no per-image chatter."""
+    utils.TEMP_DIR = work_dir
+    apply_limits()
+    log.setLevel(max(log.level, logging.WARNING))
+
+
+def prepare_document(docx_path, file_id):
+    """Unpack and compress one document's images. Runs in a pool worker.
+
+    Returns the image dicts from `iter_images_from_docx`, each compressed
+    one with its `size` and a `digest` of its content for the alt-text cache.
+    """
+    async def collect():
+        return [image async for image in iter_images_from_docx(docx_path, file_id)]
+
+    images = asyncio.run(collect())
+    for image in images:
+        if image["path"]:
+            with open(image["path"], "rb") as f:
+                data = f.read()
+            image["size"] = len(data)
+            image["digest"] = hashlib.sha256(data).hexdigest()
+    return images
+
+
+def _read_jsonl(path):
+    """Entries of a JSON-lines file, skipping a line torn by an interrupted run."""
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def source_key(path):
+    """Identifies one version of a source document: a changed file is processed again."""
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_size, stat.st_mtime_ns
+
+
+def load_completed(manifest_path):
+    return {(entry["source"], entry["bytes"], entry["mtime_ns"])
+            for entry in _read_jsonl(manifest_path) if entry.get("status") == "completed"}
+
+
+def expand_inputs(patterns):
+    """DOCX files named by paths, directories (searched recursively) and glob patterns."""
+    sources = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "**", "*.docx")
+        for path in glob.glob(pattern, recursive=True):
+            if path.lower().endswith(".docx") and os.path.isfile(path):
+                sources.add(os.path.abspath(path))
+    return sorted(sources)
+
+
+def write_result(file_id, manifest, target, txt_files=False):
+    """Write a document's results ZIP, in the same layout the service's download has."""
+    entries = _folder_entries(temp_path(file_id), "compressed_images") + _manifest_entries(manifest, txt_files)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    write_archive(entries, time.time(), target + ".tmp")
+    os.replace(target + ".tmp", target)  # An interrupted run never leaves a partial ZIP
+
+
+class AltTextCache:
+    """Alt texts by image content hash, appended to a JSON-lines file so a
+    resumed run doesn't caption anything twice."""
+
+    def __init__(self, path):
+        # Earlier versions cached the gemini service's error messages as captions
+        self.texts = {entry["digest"]: entry["alt_text"] for entry in _read_jsonl(path)
+                      if not entry["alt_text"].startswith(ERROR_PREFIX)}
+        self.file = open(path, "a", encoding="utf-8")
+
+    def get(self, digest):
+        return self.texts.get(digest)
+
+    def put(self, digest, alt_text):
+        self.texts[digest] = alt_text
+        self.file.write(json.dumps({"digest": digest, "alt_text": alt_text}, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class SharedBatcher:
+    """Gathers images from every document in flight into full alt-text batches.
+
+    `caption(image)` answers from the cache, or joins a request already in
+    flight for the same content, or queues the image. A batch goes out as
+    soon as `batch_size` images are queued, or `linger` seconds after the
+    first one if no more arrive. Batches share the gemini service through
+    the same scheduler the HTTP service uses.
+    """
+
+    def __init__(self, cache, batch_size=ALT_TEXT_BATCH_SIZE, linger=BULK_BATCH_LINGER):
+        self.cache = cache
+        self.batch_size = batch_size
+        self.linger = linger
+        self.queue = []
+        self.waiting = {}  # digest -> future of its alt text, for queued and in-flight images
+        self.timer = None
+        self.sending = set()
+        self.batches = 0
+        self.cache_hits = 0
+
+    async def caption(self, image):
+        digest = image["digest"]
+        cached = self.cache.get(digest)
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+        if digest in self.waiting:
+            self.cache_hits += 1
+        else:
+            self.waiting[digest] = asyncio.get_running_loop().create_future()
+            name = digest[:32] + os.path.splitext(image["path"])[1]
+            self.queue.append({"path": image["path"], "upload_name": name, "digest": digest})
+            if len(self.queue) >= self.batch_size:
+                self._flush()
+            elif self.timer is None:
+                self.timer = asyncio.get_running_loop().call_later(self.linger, self._flush)
+        # Shielded: one document giving up mustn't cancel a caption others wait on
+        return await asyncio.shield(self.waiting[digest])
+
+    def _flush(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        while self.queue:
+            batch, self.queue = self.queue[:self.batch_size], self.queue[self.batch_size:]
+            self.batches += 1
+            task = asyncio.create_task(self._send(batch, self.batches))
+            self.sending.add(task)
+            task.add_done_callback(self.sending.discard)
+
+    async def _send(self, batch, batch_no):
+        try:
+            await _send_batch(batch, batch_no, "bulk")
+            error = None
+        except Exception as e:
+            error = e
+        for image in batch:
+            # None is a failed caption: never cached, so a later run asks again
+            alt_text = image.get("alt_text")
+            if alt_text is not None:
+                self.cache.put(image["digest"], alt_text)
+                self.waiting.pop(image["digest"]).set_result(alt_text)
+            elif error is not None:
+                self.waiting.pop(image["digest"]).set_exception(error)
+            else:
+                self.waiting.pop(image["digest"]).set_result(None)
+
+
+class BulkRun:
+    """Captions a list of documents into `output_dir`, resuming where an earlier run stopped."""
+
+    def __init__(self, sources, output_dir, workers=None, txt_files=False):
+        self.sources = sources
+        self.output_dir = output_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.txt_files = txt_files
+        self.work_dir = os.path.join(output_dir, WORK_DIR)
+        # Documents are only prepared a little ahead of captioning, to bound scratch space
+        self.slots = asyncio.Semaphore(self.workers * 2)
+        base = os.path.commonpath([os.path.dirname(source) for source in sources]) if sources else ""
+        self.base_dir = base
+        self.total = self.done = self.failed = self.images = 0
+        self.started = time.monotonic()
+        self.batcher = None
+
+    def target_for(self, source):
+        relative = os.path.relpath(source, self.base_dir)
+        return os.path.join(self.output_dir, os.path.splitext(relative)[0] + ".zip")
+
+    async def run(self):
+        """Process every pending document. Returns the number that failed."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        utils.TEMP_DIR = self.work_dir
+        manifest_path = os.path.join(self.output_dir, MANIFEST_FILE)
+        completed = load_completed(manifest_path)
+        pending = [source for source in self.sources if source_key(source) not in completed]
+        if len(pending) < len(self.sources):
+            log.info(f"Skipping {len(self.sources) - len(pending)} documents already in {manifest_path}")
+        self.total = len(pending)
+        log.info(f"Processing {self.total} documents with {self.workers} workers")
+
+        cache = AltTextCache(os.path.join(self.output_dir, CACHE_FILE))
+        self.manifest = open(manifest_path, "a", encoding="utf-8")
+        try:
+            with ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(self.work_dir,)) as pool:
+                self.batcher = SharedBatcher(cache)
+                self.started = time.monotonic()
+                reporter = asyncio.create_task(self._report_forever())
+                try:
+                    await asyncio.gather(*(self._document(pool, source) for source in pending))
+                finally:
+                    reporter.cancel()
+        finally:
+            await alt_text_backend.aclose()
+            self.manifest.close()
+            cache.close()
+            await delete_path(self.work_dir)
+        self.report(final=True)
+        return self.failed
+
+    async def _document(self, pool, source):
+        file_id = "bulk-" + hashlib.sha1(source.encode("utf-8")).hexdigest()[:16]
+        source_path, size, mtime_ns = source_key(source)
+        entry = {"source": source_path, "bytes": size, "mtime_ns": mtime_ns}
+        async with self.slots:
+            started = time.monotonic()
+            try:
+                images = await asyncio.get_running_loop().run_in_executor(pool, prepare_document, source, file_id)
+                captions = await asyncio.gather(*(self.batcher.caption(image) for image in images if image["path"]))
+
+                captions = iter(captions)
+                manifest = []
+                for image in images:
+                    if image["path"]:
+                        alt_text = next(captions)
+                        status = "ok" if alt_text is not None else "error"
+                    elif image.get("decorative"):
+                        alt_text, status = "", "decorative"
+                    elif image.get("skipped"):
+                        alt_text, status = None, "skipped"
+                    else:
+                        continue
+                    manifest.append({
+                        "index": image["index"],
+                        "media_name": image["media_name"],
+                        "image_name": os.path.basename(image["path"]) if image["path"] else None,
+                        "size": image.get("size"),
+                        "alt_text": alt_text,
+                        "status": status,
+                    })
+                if all(row["status"] == "skipped" for row in manifest):
+                    raise ValueError("No images found in document")
+
+                target = self.target_for(source)
+                await asyncio.to_thread(write_result, file_id, manifest, target, self.txt_files)
+                errors = sum(1 for row in manifest if row["status"] == "error")
+                entry.update(status="completed", output=os.path.abspath(target), images=len(images),
+                             captioned=sum(1 for row in manifest if row["alt_text"]),
+                             decorative=sum(1 for image in images if image.get("decorative")),
+                             skipped=sum(1 for image in images if image.get("skipped")))
+                self.images += len(images)
+                if errors:
+                    # The ZIP lists them with status "error"; the next run retries the document
+                    log.error(f"Failed {source}: {errors} images could not be captioned")
+                    entry.update(status="failed", error=f"{errors} images could not be captioned", errors=errors)
+                    self.failed += 1
+                else:
+                    self.done += 1
+            except BudgetExceeded as e:
+                log.warning(f"Rejected {source}: {e}")
+                entry.update(status="failed", error=str(e))
+                self.failed += 1
+            except Exception as e:
+                log.error(f"Failed {source}: {e}")
+                entry.update(status="failed", error=str(e))
+                self.failed += 1
+            finally:
+                await delete_path(temp_path(file_id))
+            entry.update(seconds=round(time.monotonic() - started, 3), finished_at=time.time())
+            self.manifest.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.manifest.flush()
+
+    async def _report_forever(self):
+        while True:
+            await asyncio.sleep(BULK_REPORT_INTERVAL)
+            self.report()
+
+    def report(self, final=False):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        finished = self.done + self.failed
+        line = (f"{finished}/{self.total} documents ({self.failed} failed), {self.images} images in {elapsed:.0f}s: "
+                f"{self.done / elapsed:.2f} documents/s, {self.images / elapsed:.1f} images/s, "
+                f"{self.batcher.batches if self.batcher else 0} alt-text calls, "
+                f"{self.batcher.cache_hits if self.batcher else 0} cache hits")
+        if not final and finished:
+            line += f", about {(self.total - finished) * elapsed / finished:.0f}s left"
+        log.info(("Done: " if final else "Progress: ") + line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Caption every image in a set of DOCX files, offline.")
+    parser.add_argument("inputs", nargs="+",
+                        help="DOCX files, directories (searched recursively) or quoted glob patterns; ** recurses")
+    parser.add_argument("-o", "--output", required=True,
+                        help="Directory for the result ZIPs, manifest.jsonl and the alt-text cache")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="Processes unpacking and compressing documents (default: CPU count)")
+    parser.add_argument("--concurrency", type=int, default=ALT_TEXT_CONCURRENCY,
+                        help="Alt-text batches in flight at once")
+    parser.add_argument("--txt-files", action="store_true", help="Also write one alt_texts/*.txt per image")
+    args = parser.parse_args(argv)
+
+    sources = expand_inputs(args.inputs)
+    if not sources:
+        parser.error("no .docx files matched")
+    alt_text_scheduler.concurrency = args.concurrency
+    apply_limits()
+    failed = asyncio.run(BulkRun(sources, args.output, args.workers, args.txt_files).run())
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+import os
+import math
+from PIL import Image
+from preflight import open_image
+
+# Decorative-image filter: spacers, rules, solid blocks and near-blank images
+# get an empty alt text instead of a compression pass and a model call
+DECORATIVE_FILTER = os.getenv("DECORATIVE_FILTER", "1") == "1"
+# Either side shorter than this many pixels (spacers, divider lines, bullets)
+DECORATIVE_MIN_SIDE = int(os.getenv("DECORATIVE_MIN_SIDE", 16))
+# Largest per-channel standard deviation (0-255) still considered uniform
+DECORATIVE_MAX_STD = float(os.getenv("DECORATIVE_MAX_STD", 4.0))
+# Largest gap between the darkest and lightest 0.1% of pixels still considered
+# uniform, measured at up to CONTRAST_SIDE. Thin strokes vanish in a
+# thumbnail's spread but not here, so line charts, diagrams and text are
+# always captioned
+DECORATIVE_MAX_CONTRAST = int(os.getenv("DECORATIVE_MAX_CONTRAST", 32))
+# Colour entropy in bits below which a low-contrast image carries too little
+# to describe. Off by default
+DECORATIVE_MAX_ENTROPY = float(os.getenv("DECORATIVE_MAX_ENTROPY", 0))
+THUMBNAIL_SIDE = 64
+# Contrast is measured on a box-reduced copy at most this many pixels on a
+# side. Up to 4x reduction a one-pixel stroke keeps a quarter of its contrast,
+# well over DECORATIVE_MAX_CONTRAST
+CONTRAST_SIDE = 1024
+
+
+def _first_frame(image):
+    """RGB copy of the first frame, at most CONTRAST_SIDE on a side, with
+    transparency flattened onto white. JPEGs are decoded at reduced size, but
+    never below the thumbnail; other formats are reduced before any conversion."""
+    image.draft("RGB", (THUMBNAIL_SIDE, THUMBNAIL_SIDE))
+    image.seek(0)
+    frame = image
+    if frame.mode not in ("L", "LA", "RGB", "RGBA"):
+        frame = frame.convert("RGBA" if frame.mode == "P" else "RGB")
+    factor = math.ceil(max(frame.size) / CONTRAST_SIDE)
+    if factor > 1:
+        frame = frame.reduce(factor)
+    if frame.mode in ("LA", "RGBA"):
+        frame = frame.convert("RGBA")
+        background = Image.new("RGB", frame.size, (255, 255, 255))
+        background.paste(frame, mask=frame.getchannel("A"))
+        return background
+    return frame.convert("RGB")
+
+
+def _contrast(frame):
+    """Gap in grey level between the darkest and lightest 0.1% of pixels."""
+    histogram = frame.convert("L").histogram()
+    cutoff = sum(histogram) * 0.001
+    levels = []
+    for order in (range(256), reversed(range(256))):
+        seen = 0
+        for level in order:
+            seen += histogram[level]
+            if seen > cutoff:
+                levels.append(level)
+                break
+    return levels[1] - levels[0]
+
+
+def _numpy():
+    import numpy
+    return numpy
+
+
+def warm_up():
+    """Import numpy now rather than in the first job; it is a large share of cold-start time."""
+    _numpy()
+
+
+def image_stats(image_path):
+    """Size of an image, its contrast from a copy reduced to CONTRAST_SIDE, and
+    per-channel spread and colour entropy from a THUMBNAIL_SIDE thumbnail."""
+    np = _numpy()
+    with open_image(image_path) as image:
+        width, height = image.size
+        frame = _first_frame(image)
+        contrast = _contrast(frame)
+        frame.thumbnail((THUMBNAIL_SIDE, THUMBNAIL_SIDE), Image.Resampling.BILINEAR)
+        pixels = np.asarray(frame, dtype=np.uint8).reshape(-1, 3)
+
+    spread = float(pixels.std(axis=0).max())
+    # Entropy over colours quantised to 4 bits per channel
+    codes = (pixels[:, 0] >> 4).astype(np.int32) << 8 | (pixels[:, 1] >> 4).astype(np.int32) << 4 | pixels[:, 2] >> 4
+    counts = np.bincount(codes, minlength=4096)
+    p = counts[counts > 0] / len(codes)
+    entropy = float((p * np.log2(1 / p)).sum())
+    return {"width": width, "height": height, "contrast": contrast, "std": spread, "entropy": entropy}
+
+
+def classify_decorative(image_path):
+    """Return why an image looks decorative ("tiny", "uniform", "low_entropy"),
+    or None if it should be captioned."""
+    stats = image_stats(image_path)
+    if min(stats["width"], stats["height"]) < DECORATIVE_MIN_SIDE:
+        return "tiny"
+    if stats["contrast"] > DECORATIVE_MAX_CONTRAST:
+        return None
+    if stats["std"] <= DECORATIVE_MAX_STD:
+        return "uniform"
+    if stats["entropy"] < DECORATIVE_MAX_ENTROPY:
+        return "low_entropy"
+    return None
+
+
+def calls_saved(sent, decorative, batch_size):
+    """Alt-text requests avoided by not sending `decorative` images alongside `sent` ones."""
+    return math.ceil((sent + decorative) / batch_size) - math.ceil(sent / batch_size)
@@ -0,0 +1,136 @@
+import os
+import time
+import asyncio
+from utils import log, delete_path, UPLOADS_DIR, RESULTS_DIR, TEMP_DIR, ZIP_PATH
+from store import QUEUED, PROCESSING
+
+# Storage limits for uploads/, results/ and temp_files/ combined
+STORAGE_TTL_SECONDS = int(os.getenv("STORAGE_TTL_SECONDS", 6 * 3600))
+STORAGE_QUOTA_MB = int(os.getenv("STORAGE_QUOTA_MB", 2048))
+JANITOR_INTERVAL_SECONDS = int(os.getenv("JANITOR_INTERVAL_SECONDS", 60))
+# How long finished results stay downloadable (retries, resumed downloads)
+RESULT_RETENTION_SECONDS = int(os.getenv("RESULT_RETENTION_SECONDS", 3600))
+
+ZIP_PREFIX = os.path.basename(ZIP_PATH).split(".")[0] + "_"
+
+
+def _file_id(directory, name):
+    """Work out which job a top-level storage entry belongs to."""
+    if directory == UPLOADS_DIR:
+        return name.split("_", 1)[0]  # "<file_id>_<original name>"
+    if name.startswith(ZIP_PREFIX) and name.endswith(".zip"):
+        return name[len(ZIP_PREFIX):-len(".zip")]
+    return name
+
+
+def _measure(path):
+    """Total size and newest mtime of a file or directory tree."""
+    if not os.path.isdir(path):
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime
+    size = 0
+    mtime = os.stat(path).st_mtime
+    for root, _, files in os.walk(path):
+        for file in files:
+            try:
+                stat = os.stat(os.path.join(root, file))
+            except FileNotFoundError:
+                continue  # Deleted while we were walking
+            size += stat.st_size
+            mtime = max(mtime, stat.st_mtime)
+    return size, mtime
+
+
+def scan_storage():
+    """List every job's files across the storage directories, oldest first."""
+    entries = []
+    for directory in (UPLOADS_DIR, RESULTS_DIR, TEMP_DIR):
+        if not os.path.isdir(directory):
+            continue
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            try:
+                size, mtime = _measure(path)
+            except FileNotFoundError:
+                continue
+            entries.append({"path": path, "file_id": _file_id(directory, name), "size": size, "mtime": mtime})
+    return sorted(entries, key=lambda entry: entry["mtime"])
+
+
+class Janitor:
+    """Keeps uploads/, results/ and temp_files/ within a TTL and a disk quota.
+
+    Results are additionally dropped once their retention window has passed.
+
+    Entries are evicted oldest-first. Anything belonging to a job that is
+    queued or processing is left alone; at startup, leftover temp dirs and
+    files whose job is gone from the store are reclaimed as orphans.
+    """
+
+    def __init__(self, store, ttl=STORAGE_TTL_SECONDS, quota_bytes=STORAGE_QUOTA_MB * 1024 * 1024,
+                 interval=JANITOR_INTERVAL_SECONDS, retention=RESULT_RETENTION_SECONDS):
+        self.store = store
+        self.ttl = ttl
+        self.retention = retention
+        self.quota_bytes = quota_bytes
+        self.interval = interval
+
+    async def _is_active(self, file_id):
+        job = await self.store.get(file_id)
+        # A queued job may be waiting for an admission slot; its upload is still needed
+        return job is not None and job["status"] in (QUEUED, PROCESSING)
+
+    async def sweep(self, startup=False):
+        """Run one eviction pass and return what was reclaimed."""
+        entries = await asyncio.to_thread(scan_storage)
+        now = time.time()
+        evicted = []
+        kept = []
+
+        for entry in entries:
+            active = await self._is_active(entry["file_id"])
+            if active:
+                kept.append(entry)
+            elif now - entry["mtime"] > self.ttl:
+                evicted.append((entry, "expired"))
+            elif entry["path"].startswith(RESULTS_DIR + os.sep) and now - entry["mtime"] > self.retention:
+                evicted.append((entry, "retention"))
+            elif startup and entry["path"].startswith(TEMP_DIR + os.sep):
+                # Temp dirs only exist while a job runs; any left over are from a crash
+                evicted.append((entry, "orphaned"))
+            elif startup and await self.store.get(entry["file_id"]) is None:
+                evicted.append((entry, "orphaned"))
+            else:
+                kept.append(entry)
+
+        # Over quota: drop the oldest remaining entries, never an active job's
+        total = sum(entry["size"] for entry in kept)
+        for entry in kept:
+            if total <= self.quota_bytes:
+                break
+            if await self._is_active(entry["file_id"]):
+                continue
+            evicted.append((entry, "quota"))
+            total -= entry["size"]
+
+        for entry, reason in evicted:
+            log.info(f"Janitor evicting {entry['path']} ({reason}, {entry['size'] // 1024} KB)")
+            await delete_path(entry["path"])
+
+        expired_jobs = await self.store.evict_expired()
+        return {
+            "evicted": len(evicted),
+            "freed_bytes": sum(entry["size"] for entry, _ in evicted),
+            "used_bytes": total,
+            "expired_jobs": expired_jobs,
+        }
+
+    async def run_forever(self):
+        startup = True
+        while True:
+            try:
+                await self.sweep(startup)
+            except Exception as e:
+                log.error(f"Janitor sweep failed: {e}")
+            startup = False
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,62 @@
+import time
+import logging
+from contextlib import contextmanager
+from memtrack import tracker
+
+log = logging.getLogger("trace")
+
+
+class JobTrace:
+    """Timeline of one job's stages, for debugging individual slow documents.
+
+    Spans are plain dicts with `name`, `start` (seconds since the job began)
+    and `duration`, plus whatever the stage records on them. Each finished
+    span is also logged as a structured DEBUG record, so nothing is formatted
+    unless DEBUG logging is on.
+
+    Spans and the job as a whole also carry their peak memory (see memtrack).
+    """
+
+    def __init__(self, file_id=None):
+        self.file_id = file_id
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.spans = []
+        self.memory_watch = tracker.watch()
+        self.memory = None
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """Time a stage. Yields the span dict so the stage can add attributes."""
+        began = time.perf_counter()
+        span = {"name": name, "start": round(began - self.started, 6), **attrs}
+        watch = tracker.watch()
+        try:
+            yield span
+        except BaseException as e:
+            span["error"] = type(e).__name__
+            raise
+        finally:
+            span["duration"] = round(time.perf_counter() - began, 6)
+            span.update(tracker.finish(watch, name))
+            self.spans.append(span)
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug(name, extra={"fields": dict(span, file_id=self.file_id)})
+
+    def finish(self):
+        """Close the job's memory watch; its peak goes into the metrics once."""
+        if self.memory is None:
+            self.memory = tracker.finish(self.memory_watch, "job")
+        return self.memory
+
+    def to_dict(self):
+        memory = self.memory if self.memory is not None else (
+            self.memory_watch.to_dict() if self.memory_watch else {})
+        return {
+            "file_id": self.file_id,
+            "started_at": self.started_at,
+            "duration": round(time.perf_counter() - self.started, 6),
+            "memory": memory,
+            # Spans finish out of order when stages overlap
+            "spans": sorted(self.spans, key=lambda span: span["start"]),
+        }
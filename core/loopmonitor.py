@@ -0,0 +1,93 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+import traceback
+from collections import Counter
+from utils import log
+from metrics import LOOP_LAG_SECONDS, LOOP_STALLS
+
+# How often the event loop is probed, and how late a probe may run before
+# the loop counts as blocked and the blocking code is reported
+LOOP_PROBE_INTERVAL = float(os.getenv("LOOP_PROBE_INTERVAL", 0.1))
+LOOP_STALL_THRESHOLD = float(os.getenv("LOOP_STALL_THRESHOLD", 0.25))
+
+CORE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _stage(frame):
+    """Name the innermost service function in a stack, e.g. "utils.py:find_images_in_docx"."""
+    fallback = None
+    while frame is not None:
+        code = frame.f_code
+        filename = os.path.abspath(code.co_filename)
+        if fallback is None:
+            fallback = f"{os.path.basename(filename)}:{code.co_name}"
+        if os.path.dirname(filename) == CORE_DIR and filename != os.path.abspath(__file__):
+            return f"{os.path.basename(filename)}:{code.co_name}"
+        frame = frame.f_back
+    return fallback or "unknown"
+
+
+class LoopMonitor:
+    """Measures event-loop scheduling delay and names whatever blocks the loop.
+
+    A probe task on the loop sleeps for `interval` and records how late it
+    woke up. A watchdog thread checks that the probe keeps ticking; if it
+    falls more than `threshold` behind, the loop thread's current stack is
+    captured — while the blocking call is still running — and logged with
+    the service function it was in.
+    """
+
+    def __init__(self, interval=LOOP_PROBE_INTERVAL, threshold=LOOP_STALL_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.last_tick = time.monotonic()
+        self.max_lag = 0.0
+        self.stalls = Counter()
+        self.stopped = threading.Event()
+        self.task = None
+
+    def start(self):
+        self.stopped.clear()
+        self.last_tick = time.monotonic()
+        self.task = asyncio.create_task(self._probe())
+        threading.Thread(target=self._watch, args=(threading.get_ident(),),
+                         name="loop-watchdog", daemon=True).start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.task:
+            self.task.cancel()
+
+    async def _probe(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            before = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - before - self.interval)
+            LOOP_LAG_SECONDS.observe(lag)
+            self.max_lag = max(self.max_lag, lag)
+            self.last_tick = time.monotonic()
+
+    def _watch(self, loop_thread):
+        reported = None
+        while not self.stopped.wait(self.interval):
+            tick = self.last_tick
+            blocked = time.monotonic() - tick - self.interval
+            if blocked < self.threshold or reported == tick:
+                continue
+            reported = tick  # One report per stall
+            frame = sys._current_frames().get(loop_thread)
+            stage = _stage(frame)
+            self.stalls[stage] += 1
+            LOOP_STALLS.labels(stage).inc()
+            stack = "".join(traceback.format_stack(frame, limit=8)) if frame else ""
+            log.warning(f"Event loop blocked for over {blocked:.2f}s in {stage}\n{stack}")
+
+    def stats(self):
+        return {
+            "max_lag_seconds": round(self.max_lag, 3),
+            "stalls": dict(self.stalls),
+        }
@@ -1,15 +1,53 @@
-from fastapi import FastAPI, UploadFile, HTTPException,BackgroundTasks
+from fastapi import FastAPI, UploadFile, HTTPException, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, Response
 import os
+import json
+import time
 import uuid
 from utils import *
+from store import get_job_store, QUEUED, PROCESSING, COMPLETED, FAILED
+from progress import ProgressBus, format_sse
+from zipstream import iter_archive
+from janitor import Janitor
+from admission import AdmissionController, QueueFull
+from preflight import check_docx, apply_limits, BudgetExceeded
+from decorative import calls_saved
+import metrics
+import profiling
+from jobtrace import JobTrace
+from memtrack import tracker as memory_tracker
+from loopmonitor import LoopMonitor
+import zipfile
 import asyncio
+from contextlib import asynccontextmanager
 
 from fastapi.middleware.cors import CORSMiddleware
 
+@asynccontextmanager
+async def lifespan(app):
+    # Pillow's decompression-bomb guard follows the pre-flight pixel budget
+    apply_limits()
+    # Blocking work goes through asyncio.to_thread; count how busy that pool is
+    asyncio.get_running_loop().set_default_executor(metrics.InstrumentedThreadPool())
+    # Catch anything that blocks the event loop, and say where it was
+    loop_monitor.start()
+    # Peak memory of every job and stage, for the job traces and /metrics
+    memory_tracker.start()
+    # Reclaim orphans from previous runs, then keep disk usage bounded
+    janitor_task = asyncio.create_task(janitor.run_forever())
+    # Heavy dependencies load lazily; start loading them now in the background,
+    # while uvicorn binds the port, instead of in the first job
+    warm_up_task = asyncio.create_task(asyncio.to_thread(warm_up))
+    yield
+    warm_up_task.cancel()
+    janitor_task.cancel()
+    loop_monitor.stop()
+    memory_tracker.stop()
+    await alt_text_backend.aclose()
+
 # Add CORS middleware
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Change this to specific origins in production
@@ -21,7 +59,15 @@ app.add_middleware(
 UPLOAD_FOLDER = "uploads"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-tasks = {}
+# Job state lives in a shared store so any worker can serve any request
+jobs = get_job_store()
+progress = ProgressBus(jobs)
+janitor = Janitor(jobs)
+admission = AdmissionController()
+loop_monitor = LoopMonitor()
+sampler = profiling.SamplingProfiler()
+# Strong references to detached jobs so they aren't garbage collected mid-run
+background_jobs = set()
 
 @app.get("/wakeup")
 async def wakeup():
@@ -32,7 +78,8 @@ async def upload_file(file: UploadFile):
     """ Uploads a file and returns a file ID """
     file_id = str(uuid.uuid4())
     file_path = os.path.join(UPLOAD_FOLDER, file_id + "_" + file.filename)
-    
+    upload_started = time.perf_counter()
+
     try:
         # Read file content asynchronously
         content = await file.read()
@@ -40,94 +87,476 @@ async def upload_file(file: UploadFile):
         # Write to disk using an async thread pool
         await asyncio.to_thread(lambda: open(file_path, "wb").write(content))
 
-        tasks[file_id] = {"status": "queued", "progress": 0, "file_path": file_path}
+        # Central directory only: turn away zip bombs before a worker ever unpacks them
+        await asyncio.to_thread(check_docx, file_path)
+
+        await jobs.create(file_id, status=QUEUED, progress=0, file_path=file_path)
+        metrics.UPLOAD_SECONDS.observe(time.perf_counter() - upload_started)
         return {"file_id": file_id, "message": "File uploaded successfully"}
 
+    except BudgetExceeded as e:
+        await delete_path(file_path)
+        raise HTTPException(status_code=413, detail=str(e))
+
+    except zipfile.BadZipFile:
+        await delete_path(file_path)
+        raise HTTPException(status_code=400, detail="Not a valid DOCX file")
+
     except Exception as e:
         log.error(f"File upload failed: {e}")
         raise HTTPException(status_code=500, detail="File upload failed")
 
-@app.post("/process/{file_id}")
-async def process_file(file_id: str):
-    """ Processes a previously uploaded file and returns download URL """
-    if file_id not in tasks:
-        raise HTTPException(status_code=404, detail="Invalid file ID")
+async def fail_job(file_id, detail, file_path=None, trace=None):
+    """Record a failed job, drop its files and notify anyone following its progress."""
+    fields = {"trace": trace.to_dict()} if trace else {}
+    await jobs.update(file_id, status=FAILED, error=detail, **fields)
+    await clean_temp_files(file_id)
+    if file_path:
+        await delete_path(file_path)
+    await progress.publish(file_id, "failed", error=detail)
 
-    try:
-        file_path = tasks[file_id]["file_path"]
+def status_of(image):
+    if image.get("skipped"):
+        return "skipped"
+    if image.get("decorative"):
+        return "decorative"
+    return "ok" if image["alt_text"] is not None else "error"
+
+def caption_record(image, captions_only=False):
+    """ The NDJSON record streamed to clients for one image. `image_name` is its
+    name in the ZIP, so captions-only jobs, which have no ZIP, set it to None """
+    return {
+        "index": image["index"],
+        "media_name": image["media_name"],
+        "image_name": os.path.basename(image["path"]) if image["path"] and not captions_only else None,
+        "alt_text": image["alt_text"],
+        "size": image["size"],
+        "status": status_of(image),
+    }
+
+def manifest_row(image):
+    """ One image's entry in the alt_texts.json/.csv manifest inside the ZIP """
+    return {
+        "index": image["index"],
+        "media_name": image["media_name"],
+        "image_name": os.path.basename(image["path"]) if image["path"] else None,
+        "size": image["size"],
+        "alt_text": image["alt_text"],
+        "status": status_of(image),
+    }
+
+async def run_job(file_id, file_path, on_record=None, captions_only=False, txt_files=False, trace=False,
+                  profile=False):
+    """ Runs the full pipeline for a claimed job and returns the completion payload.
 
+    `on_record(record)` is awaited with each image's caption, in document
+    order, as soon as its batch comes back from the gemini service. With
+    `captions_only` the job stops after captioning and returns the records
+    as a JSON manifest; no deliverable images or ZIP are produced. The ZIP
+    carries an alt_texts.json/.csv manifest, plus one .txt per image if
+    `txt_files` is set.
+
+    A trace of the job's stages is always stored on the job; with `trace`
+    it is also returned and written into the ZIP as trace.json.
+
+    With `profile` the job runs under cProfile and the profile is saved in
+    its result directory (not in the ZIP), whether or not the job succeeds.
+    """
+    if profile:
+        async with profiling.profile_job(file_id, result_dir(file_id)) as job_profile:
+            result = await run_job(file_id, file_path, on_record, captions_only, txt_files, trace)
+        if job_profile:
+            result["profile_url"] = f"/admin/profile/{file_id}"
+        return result
+
+    on_progress = progress.publisher(file_id)
+    job_trace = JobTrace(file_id)
+    try:
         # Check if file exists
         if not os.path.exists(file_path):
             raise HTTPException(status_code=404, detail="File not found")
 
-        # Extract images directly from the file on disk (avoids loading entire DOCX into memory)
+        # Extract images directly from the file on disk (avoids loading entire DOCX into memory).
+        # Batches go out to the gemini service while later images are still compressing.
         log.debug(f"Processing file {os.path.basename(file_path)}")
-        image_paths = await extract_images_from_docx(file_path, file_id)
+        images = iter_images_from_docx(file_path, file_id, on_progress=on_progress, captions_only=captions_only,
+                                       trace=job_trace)
+        manifest = []
+        records = []
+        sent = decorative = skipped = 0
+        async for batch in iter_alt_texts(images, file_id, on_progress=on_progress, trace=job_trace):
+            for image in batch:
+                if image["path"]:
+                    sent += 1
+                elif image.get("decorative"):
+                    decorative += 1
+                elif image.get("skipped"):
+                    skipped += 1
+                if image["path"] or image.get("decorative") or image.get("skipped"):
+                    manifest.append(manifest_row(image))
+                records.append(caption_record(image, captions_only))
+                if on_record:
+                    await on_record(records[-1])
         await delete_path(file_path)
-        if not image_paths:
+        if len(manifest) == skipped:
             raise HTTPException(status_code=400, detail="No images found in document")
-        
-        # Update task status
-        tasks[file_id]["status"] = "processing"
-        tasks[file_id]["progress"] = 33
+        if decorative:
+            saved = calls_saved(sent, decorative, ALT_TEXT_BATCH_SIZE)
+            log.info(f"Job {file_id}: {decorative} decorative images not captioned, {saved} alt-text calls saved")
+            await jobs.update(file_id, decorative_images=decorative, alt_text_calls_saved=saved)
+        if skipped:
+            # Also listed in the ZIP manifest with status "skipped"
+            log.warning(f"Job {file_id}: {skipped} images over the pre-flight budgets were not processed")
+            await jobs.update(file_id, skipped_images=skipped)
 
-        # Get alt texts asynchronously
-        alt_texts = await get_alt_texts(image_paths, file_id)
         log.debug("Extracted alt texts")
-        tasks[file_id]["progress"] = 66
-
-        # Write alt texts to files asynchronously
-        write_tasks = []
-        for img_path in image_paths:
-            img_name = os.path.basename(img_path)
-            if img_name in alt_texts:
-                alt_text = alt_texts[img_name]
-                txt_filename = os.path.join(TEXT_DIR(file_id), f"{os.path.splitext(img_name)[0]}.txt")
-                
-                # Create a task to write each alt text file
-                async def write_alt_text(filename, text):
-                    await asyncio.to_thread(lambda: open(filename, "w").write(text))
-                
-                write_tasks.append(write_alt_text(txt_filename, alt_text))
-        
-        # Wait for all text files to be written
-        await asyncio.gather(*write_tasks)
+        if captions_only:
+            await clean_temp_files(file_id)
+            await jobs.update(file_id, status=COMPLETED, progress=100, captions=records, trace=job_trace.to_dict())
+            await on_progress("captions_ready", count=len(records))
+            result = {"status": COMPLETED, "images": records}
+            if skipped:
+                result["skipped_images"] = skipped
+            if trace:
+                result["trace"] = job_trace.to_dict()
+            return result
+
+        await jobs.update(file_id, progress=66)
 
-        # Create zip file asynchronously
-        await create_zip(file_id)
-        log.debug("Created ZIP file")
-        tasks[file_id]["progress"] = 90
+        # Index the results with the caption manifest; the ZIP itself is streamed at download time
+        await publish_results(file_id, manifest, txt_files, trace=job_trace, trace_file=trace)
+        log.debug("Results ready for download")
+        await jobs.update(file_id, progress=90)
 
         # Processing complete
-        tasks[file_id]["status"] = "completed"
-        tasks[file_id]["progress"] = 100
         download_url = f"/download/{file_id}"
+        await jobs.update(file_id, status=COMPLETED, progress=100, download_url=download_url,
+                          trace=job_trace.to_dict())
+        await on_progress("zip_ready", download_url=download_url)
         
         await clean_temp_files(file_id)
-        return {"status": "completed", "download_url": download_url}
+        result = {"status": "completed", "download_url": download_url}
+        if skipped:
+            result["skipped_images"] = skipped
+        if trace:
+            result["trace"] = job_trace.to_dict()
+        return result
+
+    except HTTPException as e:
+        await fail_job(file_id, e.detail, file_path, job_trace)
+        raise
+
+    except BudgetExceeded as e:
+        log.warning(f"Rejected {os.path.basename(file_path)}: {e}")
+        await fail_job(file_id, str(e), file_path, job_trace)
+        raise HTTPException(status_code=413, detail=str(e))
 
     except FileNotFoundError as e:
         log.error(f"File error: {e}")
+        await fail_job(file_id, "File not found", file_path, job_trace)
         raise HTTPException(status_code=404, detail="File not found")
     
     except Exception as e:
         log.error(f"Unexpected error: {e}")
+        await fail_job(file_id, str(e), file_path, job_trace)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+    finally:
+        job_trace.finish()
+
+async def run_admitted_job(ticket, file_id, file_path, on_record=None, **options):
+    """ Waits for a run slot, then claims the job and runs it. The job stays queued
+    while it waits, so a request that gives up never leaves it marked as processing """
+    async with ticket:
+        # Claim the job atomically so two workers never process the same upload
+        if not await jobs.transition(file_id, [QUEUED], PROCESSING, progress=0):
+            job = await jobs.get(file_id)
+            raise HTTPException(status_code=409, detail=f"Job is {job['status'] if job else 'gone'}")
+        return await run_job(file_id, file_path, on_record, **options)
+
+async def run_job_in_background(ticket, file_id, file_path, on_record=None, **options):
+    try:
+        return await run_admitted_job(ticket, file_id, file_path, on_record, **options)
+    except HTTPException as e:
+        # Recorded on the job and published as a "failed" event, unless another request claimed it first
+        return {"status": FAILED, "error": e.detail}
+
+def start_background_job(ticket, file_id, file_path, on_record=None, **options):
+    task = asyncio.create_task(run_job_in_background(ticket, file_id, file_path, on_record, **options))
+    background_jobs.add(task)
+    task.add_done_callback(background_jobs.discard)
+    return task
+
+def require_admin(request):
+    if not profiling.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Profiling is disabled, set ADMIN_TOKEN to enable it")
+    if not profiling.is_admin(request.headers.get("X-Admin-Token")):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@app.post("/process/{file_id}")
+async def process_file(file_id: str, request: Request, background: bool = False, stream: bool = False,
+                       captions_only: bool = False, txt_files: bool = False, trace: bool = False,
+                       profile: bool = False):
+    """ Processes a previously uploaded file and returns download URL.
+
+    With `?background=true` the job runs detached and the response points at
+    the `/events` stream instead of blocking until the ZIP exists.
+
+    With `?stream=true` the response is NDJSON: one caption record per image,
+    in document order, as each batch completes, then a final line with the
+    job status and download URL.
+
+    With `?captions_only=true` only caption-sized copies are made and the
+    result is a JSON manifest of alt texts instead of a ZIP.
+
+    With `?txt_files=true` the ZIP also gets one alt-text .txt per image
+    next to the alt_texts.json/.csv manifest.
+
+    With `?trace=true` the response carries the job's stage timings and the
+    ZIP gets them as trace.json.
+
+    With `?profile=true` (admin only) the job runs under cProfile; the
+    profile is served by `/admin/profile/{file_id}`.
+    """
+    if profile:
+        require_admin(request)
+        if profiling.profile_busy():
+            raise HTTPException(status_code=409, detail="Another job is being profiled, retry later")
+    options = {"captions_only": captions_only, "txt_files": txt_files, "trace": trace, "profile": profile}
+    job = await jobs.get(file_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Invalid file ID")
+
+    if job["status"] != QUEUED:
+        if job["status"] == COMPLETED:
+            result = {"status": COMPLETED}
+            if "captions" in job:
+                result["images"] = job["captions"]
+            else:
+                result["download_url"] = f"/download/{file_id}"
+            if "skipped_images" in job:
+                result["skipped_images"] = job["skipped_images"]
+            if trace and "trace" in job:
+                result["trace"] = job["trace"]
+            return result
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+
+    # Reserve a place first so an overloaded worker turns requests away fast
+    try:
+        ticket = admission.reserve()
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail="Too many jobs in progress, retry later",
+                            headers={"Retry-After": str(e.retry_after)})
+
+    if stream:
+        records = asyncio.Queue()
+        # The job runs detached so it still finishes if the client disconnects
+        task = start_background_job(ticket, file_id, job["file_path"], records.put, **options)
+
+        def finish(task):
+            # Always end the stream with a status line, or the client waits forever
+            try:
+                # Records were already streamed, so the final line leaves out the manifest
+                result = dict(task.result())
+                result.pop("images", None)
+            except asyncio.CancelledError:
+                result = {"status": FAILED, "error": "Job was cancelled"}
+            except Exception as e:
+                log.error(f"Streamed job {file_id} failed: {e}")
+                result = {"status": FAILED, "error": str(e)}
+            records.put_nowait(result)
+            records.put_nowait(None)
+        task.add_done_callback(finish)
+
+        async def ndjson():
+            while True:
+                record = await records.get()
+                if record is None:
+                    break
+                yield json.dumps(record) + "\n"
+
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+    if background:
+        start_background_job(ticket, file_id, job["file_path"], **options)
+        return JSONResponse(status_code=202, content={
+            "status": PROCESSING,
+            "events_url": f"/events/{file_id}",
+            "status_url": f"/status/{file_id}",
+        })
+
+    return await run_admitted_job(ticket, file_id, job["file_path"], **options)
+
+@app.get("/load")
+async def load():
+    """ Admission queue depth and wait times for load balancer routing; 503 when saturated """
+    return JSONResponse(status_code=503 if admission.saturated() else 200,
+                        content=dict(admission.stats(), alt_text=alt_text_scheduler.stats(),
+                                     event_loop=loop_monitor.stats()))
+
+@app.get("/metrics")
+async def get_metrics():
+    """ Per-stage latency histograms and load gauges in the Prometheus text format """
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
+
+@app.get("/admin/profile/{file_id}")
+async def job_profile(file_id: str, request: Request, format: str = "text"):
+    """ A profiled job's cProfile: a text summary, or `?format=pstats` for snakeviz/pstats """
+    require_admin(request)
+    if format not in ("text", "pstats"):
+        raise HTTPException(status_code=400, detail="format must be text or pstats")
+    name = profiling.PROFILE_FILE if format == "pstats" else profiling.PROFILE_TEXT_FILE
+    path = os.path.join(result_dir(file_id), name)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="No profile for this job")
+    if format == "pstats":
+        return FileResponse(path, media_type="application/octet-stream", filename=f"{file_id}.prof")
+    return FileResponse(path, media_type="text/plain")
+
+@app.post("/admin/sampler")
+async def start_sampler(request: Request, seconds: float = 30):
+    """ Sample every thread's stack in this worker for `seconds`, without a restart """
+    require_admin(request)
+    try:
+        sampler.start(seconds)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    log.info(f"Sampling profiler running for {sampler.seconds}s")
+    return JSONResponse(status_code=202, content=sampler.report())
+
+@app.delete("/admin/sampler")
+async def stop_sampler(request: Request):
+    require_admin(request)
+    sampler.stop()
+    return sampler.report()
+
+@app.get("/admin/sampler")
+async def sampler_report(request: Request, format: str = "json"):
+    """ The current or last sampling run; `?format=collapsed` gives flamegraph input """
+    require_admin(request)
+    if format == "collapsed":
+        return Response(sampler.collapsed(), media_type="text/plain")
+    return sampler.report()
+
+@app.get("/events/{file_id}")
+async def job_events(file_id: str, request: Request):
+    """ Streams a job's progress as Server-Sent Events until the ZIP is ready or the job fails """
+    if await jobs.get(file_id) is None:
+        raise HTTPException(status_code=404, detail="Invalid file ID")
+
+    # Resume after the last event the client saw when the browser reconnects
+    last_seq = int(request.headers.get("last-event-id", 0) or 0)
+
+    async def stream():
+        async for seq, event in progress.subscribe(file_id, last_seq):
+            if await request.is_disconnected():
+                break
+            yield format_sse(seq, event)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # Stop nginx from buffering the stream
+    })
+
+@app.get("/status/{file_id}")
+async def job_status(file_id: str, trace: bool = False):
+    """ Reports the state of a job from the shared store; `?trace=true` adds
+    the stage timings of a finished job """
+    job = await jobs.get(file_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Invalid file ID")
+    job.pop("file_path", None)
+    job.pop("captions", None)  # Keep polling cheap; the manifest comes from /process
+    if not trace:
+        job.pop("trace", None)
+    return job
+
+def parse_range(header, size):
+    """ Parse a single-range `Range: bytes=...` header into (start, end), end exclusive.
+
+    Returns None when the whole file should be sent (no header, or a form we
+    don't serve such as multiple ranges). Raises 416 if it can't be satisfied.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = int(last) + 1 if last else size
+        else:
+            start = max(size - int(last), 0)  # Suffix range: the last N bytes
+            end = size
+    except ValueError:
+        return None
+    if start >= size or start >= end:
+        raise HTTPException(status_code=416, detail="Range not satisfiable",
+                            headers={"Content-Range": f"bytes */{size}"})
+    return start, min(end, size)
+
+def download_headers(index):
+    return {
+        "ETag": index["etag"],
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'attachment; filename="{index["filename"]}"',
+    }
+
+@app.head("/download/{file_id}")
+async def download_ready(file_id: str):
+    """ Reports whether the result is ready, and its size, without sending it """
+    job = await jobs.get(file_id)
+    index = await asyncio.to_thread(load_archive_index, file_id)
+    if job and index:
+        return Response(status_code=200, media_type="application/zip", headers=dict(
+            download_headers(index), **{"Content-Length": str(index["size"]), "X-Job-Status": job["status"]}))
+    if job and job["status"] in (QUEUED, PROCESSING):
+        return Response(status_code=202, headers={"X-Job-Status": job["status"]})
+    return Response(status_code=404, headers={"X-Job-Status": job["status"] if job else "unknown"})
+
 @app.get("/download/{file_id}")
-async def download_file(file_id: str, background_tasks: BackgroundTasks):
-    """ Allows the client to download the processed file """
+async def download_file(file_id: str, request: Request):
+    """ Allows the client to download the processed file.
+
+    Results stay available for the retention window, so retries and
+    `Range` resumes are served without reprocessing.
+    """
     try:
-        zip_file = zip_path(file_id)
-        if file_id in tasks and os.path.exists(zip_file):
-            background_tasks.add_task(delete_path, zip_file)
-            return FileResponse(zip_file, filename=os.path.basename(zip_file))
-        raise FileNotFoundError(f"ZIP file {zip_file} not found")
+        index = await asyncio.to_thread(load_archive_index, file_id)
+        if not (await jobs.get(file_id) and index):
+            raise FileNotFoundError(f"Results for {file_id} not found")
+
+        headers = download_headers(index)
+        if_none_match = request.headers.get("if-none-match", "")
+        if if_none_match.strip() == "*" or index["etag"] in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers={"ETag": index["etag"]})
+
+        # Only honour the range if the client's copy is of this exact archive
+        byte_range = None
+        if request.headers.get("if-range", index["etag"]) == index["etag"]:
+            byte_range = parse_range(request.headers.get("range"), index["size"])
+
+        # Build the ZIP on the fly from the result files; its size is known up front
+        if byte_range is None:
+            headers["Content-Length"] = str(index["size"])
+            chunks = iter_archive(index["entries"], index["timestamp"])
+            return StreamingResponse(metrics.timed_iter(metrics.DOWNLOAD_SECONDS, chunks),
+                                     media_type="application/zip", headers=headers)
+
+        start, end = byte_range
+        headers["Content-Length"] = str(end - start)
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{index['size']}"
+        chunks = iter_archive(index["entries"], index["timestamp"], start, end)
+        return StreamingResponse(metrics.timed_iter(metrics.DOWNLOAD_SECONDS, chunks),
+                                 status_code=206, media_type="application/zip", headers=headers)
         
     except FileNotFoundError as e:
         log.error(e)
         raise HTTPException(status_code=404, detail="File not found")
 
+    except HTTPException:
+        raise
+
     except Exception as e:
         log.error(f"File download failed: {e}")
-        raise HTTPException(status_code=500, detail="Internal Server Error")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Internal Server Error")
@@ -0,0 +1,136 @@
+import os
+import sys
+import threading
+import tracemalloc
+import weakref
+from metrics import PROCESS_RSS_BYTES, JOB_PEAK_RSS_BYTES, STAGE_MEMORY_GROWTH_BYTES
+
+# Peak memory of jobs and their stages. A sampler thread reads the process
+# RSS every MEMORY_SAMPLE_INTERVAL seconds and raises the peak of every stage
+# running at that moment. RSS covers Pillow's image buffers, which Python's
+# allocator never sees; MEMORY_TRACKING=tracemalloc adds peak Python
+# allocations on top, at a noticeable CPU cost. "off" disables both.
+MEMORY_TRACKING = os.getenv("MEMORY_TRACKING", "rss")
+MEMORY_SAMPLE_INTERVAL = float(os.getenv("MEMORY_SAMPLE_INTERVAL", 0.02))
+
+try:
+    PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    PAGE_SIZE = 4096
+
+
+def rss_bytes():
+    """Resident set size of this process. Outside Linux this is the peak so far."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Watch:
+    """Memory readings over one job or stage. Since memory is per process, the
+    peak includes whatever else the process was doing at the time."""
+
+    def __init__(self, rss, traced):
+        self.start_rss = self.peak_rss = rss
+        self.start_traced = self.peak_traced = traced
+
+    def observe(self, rss, traced):
+        self.peak_rss = max(self.peak_rss, rss)
+        if traced is not None:
+            self.peak_traced = max(self.peak_traced, traced)
+
+    def to_dict(self):
+        fields = {"peak_rss_bytes": self.peak_rss, "rss_growth_bytes": self.peak_rss - self.start_rss}
+        if self.start_traced is not None:
+            fields.update(peak_traced_bytes=self.peak_traced, traced_growth_bytes=self.peak_traced - self.start_traced)
+        return fields
+
+
+class MemoryTracker:
+    """Samples process memory into every open Watch."""
+
+    def __init__(self, mode=MEMORY_TRACKING, interval=MEMORY_SAMPLE_INTERVAL):
+        self.mode = mode
+        self.interval = interval
+        self.watches = weakref.WeakSet()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.started_tracemalloc = False
+
+    @property
+    def enabled(self):
+        return self.mode != "off"
+
+    def start(self):
+        if not self.enabled or (self.thread and self.thread.is_alive()):
+            return
+        if self.mode == "tracemalloc" and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracemalloc = True
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._run, name="memory-sampler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+            self.started_tracemalloc = False
+
+    def _readings(self):
+        """Current RSS, and peak traced memory since the last reading (None unless tracing)."""
+        if not tracemalloc.is_tracing():
+            return rss_bytes(), None
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        return rss_bytes(), peak
+
+    def sample(self):
+        rss, traced = self._readings()
+        PROCESS_RSS_BYTES.set(rss)
+        with self.lock:
+            watches = list(self.watches)
+        for watch in watches:
+            watch.observe(rss, traced)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def watch(self):
+        """Start a Watch, or None if tracking is off."""
+        if not self.enabled:
+            return None
+        # Peaks from before this point belong to whoever was running then
+        self.sample()
+        watch = Watch(rss_bytes(), tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None)
+        with self.lock:
+            self.watches.add(watch)
+        return watch
+
+    def finish(self, watch, stage=None):
+        """Close `watch` and return its fields for a trace span ({} if tracking is off).
+        `stage` labels its growth in the metrics; "job" records the job's peak instead."""
+        if watch is None:
+            return {}
+        self.sample()
+        with self.lock:
+            self.watches.discard(watch)
+        fields = watch.to_dict()
+        if stage == "job":
+            JOB_PEAK_RSS_BYTES.observe(fields["peak_rss_bytes"])
+        elif stage:
+            STAGE_MEMORY_GROWTH_BYTES.labels(stage).observe(fields["rss_growth_bytes"])
+        return fields
+
+
+tracker = MemoryTracker()
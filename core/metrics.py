@@ -0,0 +1,110 @@
+import os
+import time
+import profiling
+from concurrent.futures import ThreadPoolExecutor
+from prometheus_client import (Histogram, Gauge, Counter, CollectorRegistry, REGISTRY, CONTENT_TYPE_LATEST,
+                               generate_latest, multiprocess)
+
+# Prometheus metrics for the core service, served by GET /metrics.
+#
+# With `--workers N`, set PROMETHEUS_MULTIPROC_DIR to an empty directory
+# before starting uvicorn so every worker's samples are merged on scrape.
+
+# Long-running stages (network round trips, whole documents)
+SLOW_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+UPLOAD_SECONDS = Histogram(
+    "core_upload_seconds", "Receiving an upload and writing it to disk", buckets=SLOW_BUCKETS)
+EXTRACTION_SECONDS = Histogram(
+    "core_extraction_seconds", "Pre-flight, image discovery and unpacking of one DOCX", buckets=SLOW_BUCKETS)
+COMPRESSION_SECONDS = Histogram(
+    "core_compression_seconds", "Compressing one image", ["format"])
+ALT_TEXT_BATCH_SECONDS = Histogram(
+    "core_alt_text_batch_seconds", "Round trip of one alt-text batch to the gemini service",
+    ["outcome"], buckets=SLOW_BUCKETS)
+ZIP_SECONDS = Histogram(
+    "core_zip_seconds", "Indexing or writing a job's result archive", buckets=SLOW_BUCKETS)
+DOWNLOAD_SECONDS = Histogram(
+    "core_download_seconds", "Streaming a result archive to the client", buckets=SLOW_BUCKETS)
+
+LOOP_LAG_SECONDS = Histogram(
+    "core_event_loop_lag_seconds", "How late the event loop ran a scheduled probe",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+LOOP_STALLS = Counter(
+    "core_event_loop_stalls", "Times the event loop was blocked past the stall threshold", ["stage"])
+
+JOBS_RUNNING = Gauge(
+    "core_jobs_running", "Jobs holding a run slot", multiprocess_mode="livesum")
+JOBS_WAITING = Gauge(
+    "core_jobs_waiting", "Jobs queued for a run slot", multiprocess_mode="livesum")
+THREAD_POOL_SIZE = Gauge(
+    "core_thread_pool_size", "Threads available for blocking work", multiprocess_mode="livesum")
+THREAD_POOL_BUSY = Gauge(
+    "core_thread_pool_busy", "Threads currently running blocking work", multiprocess_mode="livesum")
+THREAD_POOL_QUEUED = Gauge(
+    "core_thread_pool_queued", "Blocking calls waiting for a free thread", multiprocess_mode="livesum")
+
+MEMORY_BUCKETS = tuple(mb * 1024 * 1024 for mb in (1, 4, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096))
+PROCESS_RSS_BYTES = Gauge(
+    "core_process_rss_bytes", "Resident memory of the worker", multiprocess_mode="livesum")
+JOB_PEAK_RSS_BYTES = Histogram(
+    "core_job_peak_rss_bytes", "Peak resident memory of the worker while a job ran", buckets=MEMORY_BUCKETS)
+STAGE_MEMORY_GROWTH_BYTES = Histogram(
+    "core_stage_memory_growth_bytes", "Peak resident memory above where a job stage started",
+    ["stage"], buckets=MEMORY_BUCKETS)
+
+
+def image_format(img_name):
+    """Histogram label for an image, from its name inside the DOCX."""
+    extension = os.path.splitext(img_name)[1].lower().lstrip(".")
+    if extension == "jpg":
+        return "jpeg"
+    return extension if extension in ("jpeg", "png", "gif") else "other"
+
+
+def timed_iter(histogram, chunks):
+    """Yield from `chunks`, observing how long it took to hand out all of them
+    (or until the consumer went away)."""
+    start = time.perf_counter()
+    try:
+        yield from chunks
+    finally:
+        histogram.observe(time.perf_counter() - start)
+
+
+class InstrumentedThreadPool(ThreadPoolExecutor):
+    """Default executor for the event loop (and so for `asyncio.to_thread`)
+    that reports how busy it is."""
+
+    def __init__(self, max_workers=None, **kwargs):
+        super().__init__(max_workers, **kwargs)
+        THREAD_POOL_SIZE.inc(self._max_workers)
+
+    def submit(self, fn, /, *args, **kwargs):
+        THREAD_POOL_QUEUED.inc()
+        # Submitted from the caller's context, so a profiled job's calls are profiled too
+        fn = profiling.bind(fn)
+
+        def run(*args, **kwargs):
+            THREAD_POOL_QUEUED.dec()
+            THREAD_POOL_BUSY.inc()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                THREAD_POOL_BUSY.dec()
+        return super().submit(run, *args, **kwargs)
+
+    def shutdown(self, wait=True, **kwargs):
+        if not self._shutdown:
+            THREAD_POOL_SIZE.dec(self._max_workers)
+        super().shutdown(wait, **kwargs)
+
+
+def render():
+    """Current metrics in the Prometheus text format, and its content type."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,183 @@
+import os
+import struct
+import importlib
+import zipfile
+import logging
+import posixpath
+from PIL import Image, UnidentifiedImageError
+
+# Pre-flight budgets, checked from the zip central directory and image
+# headers before anything is decompressed to disk or decoded
+MAX_UNCOMPRESSED_MB = int(os.getenv("MAX_UNCOMPRESSED_MB", 512))
+MAX_COMPRESSION_RATIO = int(os.getenv("MAX_COMPRESSION_RATIO", 200))
+MAX_IMAGES = int(os.getenv("MAX_IMAGES", 2000))
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", 50_000_000))
+MAX_GIF_FRAMES = int(os.getenv("MAX_GIF_FRAMES", 300))
+# Members smaller than this are never treated as zip bombs, however well they compress
+RATIO_MIN_BYTES = 1024 * 1024
+
+# Image formats PIL may open, by plugin module (PIL.<name>ImagePlugin), whose
+# format is the upper-cased name. Anything else in a document is reported as
+# unreadable instead of being handed to one of PIL's ~40 other decoders,
+# which are then never imported either.
+PIL_PLUGINS = [plugin.strip() for plugin in os.getenv("PIL_PLUGINS", "Jpeg,Png,Gif,Bmp,Tiff,WebP").split(",")]
+PIL_FORMATS = tuple(plugin.upper() for plugin in PIL_PLUGINS)
+
+
+
+def apply_limits():
+    """Make Pillow's own decompression-bomb guard agree with the pixel budget
+    at decode time. Pillow-wide, so the app and the bulk CLI call it at startup."""
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+
+def load_pil_plugins(plugins=PIL_PLUGINS):
+    """Import the decoders in PIL_PLUGINS. The warm-up does this at startup."""
+    for plugin in plugins:
+        importlib.import_module(f"PIL.{plugin}ImagePlugin")
+
+
+def open_image(fp):
+    """Image.open, trying only PIL_FORMATS: any other format raises
+    UnidentifiedImageError, like an unreadable file.
+
+    With `formats` given, Pillow never falls back to importing every plugin
+    to identify a file, as long as the formats listed are registered.
+    """
+    load_pil_plugins()
+    return Image.open(fp, formats=PIL_FORMATS)
+
+
+log = logging.getLogger()
+
+# Per-image pre-flight decisions
+OK = "ok"
+STILL = "still"  # Animated GIF over the frame budget: only the first frame is kept
+SKIP = "skip"
+
+
+class BudgetExceeded(Exception):
+    """The upload as a whole is over budget and must not be processed."""
+
+
+def check_archive(docx_zip):
+    """Reject archives whose central directory promises too much data.
+
+    Only reads sizes recorded in the central directory; `ZipFile.open` stops
+    at the recorded size, so a member can't inflate past what is checked here.
+    """
+    total = 0
+    for info in docx_zip.infolist():
+        total += info.file_size
+        if info.file_size > RATIO_MIN_BYTES and info.file_size > MAX_COMPRESSION_RATIO * max(info.compress_size, 1):
+            raise BudgetExceeded(f"{info.filename} expands {info.file_size // max(info.compress_size, 1)}x when unpacked")
+    if total > MAX_UNCOMPRESSED_MB * 1024 * 1024:
+        raise BudgetExceeded(f"Document unpacks to {total // (1024 * 1024)} MB, over the {MAX_UNCOMPRESSED_MB} MB limit")
+    return total
+
+
+def check_docx(docx_file_path):
+    """Pre-flight check of an uploaded file on disk. Raises BudgetExceeded or
+    zipfile.BadZipFile."""
+    with zipfile.ZipFile(docx_file_path, "r") as docx_zip:
+        return check_archive(docx_zip)
+
+
+def _skip_sub_blocks(stream):
+    while True:
+        size = stream.read(1)
+        if not size or size == b"\x00":
+            return
+        stream.read(size[0])
+
+
+def gif_header(stream, max_frames=MAX_GIF_FRAMES):
+    """Read a GIF's logical size and frame count by walking its block structure.
+
+    Nothing is decoded; counting stops once `max_frames` is exceeded so a
+    GIF with a huge number of frames can't stall the check.
+    """
+    header = stream.read(13)
+    if len(header) < 13 or header[:3] != b"GIF":
+        raise ValueError("Not a GIF file")
+    width, height, flags = struct.unpack("<HHB", header[6:11])
+    if flags & 0x80:
+        stream.read(3 << ((flags & 0x07) + 1))  # Global color table
+
+    frames = 0
+    while frames <= max_frames:
+        block = stream.read(1)
+        if block == b"\x21":  # Extension: label, then data sub-blocks
+            stream.read(1)
+            _skip_sub_blocks(stream)
+        elif block == b"\x2c":  # Image descriptor
+            frames += 1
+            descriptor = stream.read(9)
+            if len(descriptor) < 9:
+                break
+            if descriptor[8] & 0x80:
+                stream.read(3 << ((descriptor[8] & 0x07) + 1))  # Local color table
+            stream.read(1)  # LZW minimum code size
+            _skip_sub_blocks(stream)
+        else:  # Trailer, end of data or garbage
+            break
+    return width, height, frames
+
+
+def image_header(docx_zip, media_path):
+    """(width, height, frames) of a media member, read from its header only.
+
+    Returns None if PIL doesn't recognise the format; processing decides
+    what to do with those, as before.
+    """
+    with docx_zip.open(media_path) as stream:
+        if stream.read(3) == b"GIF":
+            stream.seek(0)
+            return gif_header(stream)
+        stream.seek(0)
+        try:
+            with open_image(stream) as image:
+                width, height = image.size
+        except UnidentifiedImageError:
+            return None
+    return width, height, 1
+
+
+def plan_images(docx_zip, media_paths):
+    """Decide, per image reference, whether to process it as is, as a still, or not at all.
+
+    Returns one dict per entry in `media_paths` with `action`, `frames`
+    (the frame count to assume, when known) and a `reason` for anything
+    other than OK. Raises BudgetExceeded if there are more than MAX_IMAGES.
+    """
+    if len(media_paths) > MAX_IMAGES:
+        # Processing only the first N would return a silently incomplete result
+        raise BudgetExceeded(f"Document has {len(media_paths)} images, over the {MAX_IMAGES} image limit")
+    headers = {}
+    plan = []
+    for media_path in media_paths:
+        if media_path not in headers:
+            try:
+                headers[media_path] = image_header(docx_zip, media_path)
+            except Image.DecompressionBombError:
+                # PIL refuses to even open it: far over the pixel budget
+                headers[media_path] = (MAX_IMAGE_PIXELS + 1, 1, 1)
+            except Exception as e:
+                log.warning(f"Could not read header of {media_path}: {e}")
+                headers[media_path] = None
+        header = headers[media_path]
+        if header is None:
+            plan.append({"action": OK, "frames": None, "reason": None})
+            continue
+
+        width, height, frames = header
+        name = posixpath.basename(media_path)
+        if width * height > MAX_IMAGE_PIXELS:
+            log.warning(f"Skipping {name}: over the {MAX_IMAGE_PIXELS} pixel limit")
+            plan.append({"action": SKIP, "frames": None, "reason": f"over the {MAX_IMAGE_PIXELS} pixel limit"})
+        elif frames > MAX_GIF_FRAMES:
+            log.warning(f"{name} has over {MAX_GIF_FRAMES} frames, keeping the first frame only")
+            plan.append({"action": STILL, "frames": 1, "reason": f"over the {MAX_GIF_FRAMES} frame limit"})
+        else:
+            plan.append({"action": OK, "frames": frames, "reason": None})
+    return plan
@@ -0,0 +1,216 @@
+import io
+import os
+import sys
+import hmac
+import time
+import asyncio
+import pstats
+import cProfile
+import logging
+import threading
+import contextvars
+from collections import Counter
+from contextlib import asynccontextmanager
+
+# Admin-only profiling of a running service, without a restart:
+#  - a cProfile of one job (POST /process/{id}?profile=true), saved next to its result
+#  - a sampling profiler over every thread, switched on for N seconds
+# Both require an X-Admin-Token header matching ADMIN_TOKEN; unset disables them.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", 0.005))
+PROFILE_MAX_SECONDS = int(os.getenv("PROFILE_MAX_SECONDS", 300))
+
+PROFILE_FILE = "profile.prof"
+PROFILE_TEXT_FILE = "profile.txt"
+
+log = logging.getLogger()
+
+_job_profile = contextvars.ContextVar("job_profile", default=None)
+
+# From Python 3.12 cProfile runs on sys.monitoring: one profiler per process,
+# and it sees every thread. A job's profile then covers the whole process
+# while the job runs, instead of the loop plus the job's own pool calls.
+PROCESS_WIDE = sys.version_info >= (3, 12)
+
+
+def is_admin(token):
+    return bool(ADMIN_TOKEN) and token is not None and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+class JobProfile:
+    """cProfile of one job.
+
+    The event loop thread is profiled for as long as the job runs (so
+    anything else the loop does meanwhile shows up too), and every blocking
+    call the job hands to the thread pool is profiled in its worker thread.
+    With PROCESS_WIDE, the one profile records every thread in the process,
+    other jobs included. Only one job is profiled at a time per process.
+    """
+
+    running = threading.Lock()
+
+    def __init__(self, file_id):
+        self.file_id = file_id
+        self.loop_profile = cProfile.Profile()
+        self.thread_profiles = []
+        self.lock = threading.Lock()
+
+    def wrap(self, fn):
+        """`fn` profiled in whatever thread ends up running it."""
+        def run(*args, **kwargs):
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:  # Another profiler owns this thread
+                return fn(*args, **kwargs)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                profile.disable()
+                with self.lock:
+                    self.thread_profiles.append(profile)
+        return run
+
+    def stats(self):
+        stats = pstats.Stats(self.loop_profile)
+        for profile in self.thread_profiles:
+            stats.add(profile)
+        return stats
+
+    def save(self, target_dir):
+        """Write profile.prof (for snakeviz, pstats, ...) and a text summary into `target_dir`."""
+        os.makedirs(target_dir, exist_ok=True)
+        stats = self.stats()
+        stats.dump_stats(os.path.join(target_dir, PROFILE_FILE))
+        text = io.StringIO()
+        stats.stream = text
+        stats.sort_stats("cumulative").print_stats(60)
+        with open(os.path.join(target_dir, PROFILE_TEXT_FILE), "w") as f:
+            if PROCESS_WIDE:
+                f.write(f"Profile of job {self.file_id}: every thread in the process while the job ran\n")
+            else:
+                f.write(f"Profile of job {self.file_id}: event loop thread plus {len(self.thread_profiles)} "
+                        f"blocking calls in the thread pool\n")
+            f.write(text.getvalue())
+
+
+def profile_busy():
+    return JobProfile.running.locked()
+
+
+@asynccontextmanager
+async def profile_job(file_id, target_dir):
+    """Profile the enclosed job and save the result into `target_dir`, even if the job fails.
+    If another job is being profiled, the job runs unprofiled."""
+    if not JobProfile.running.acquire(blocking=False):
+        log.warning(f"Not profiling job {file_id}: another profile is running")
+        yield None
+        return
+    profile = JobProfile(file_id)
+    try:
+        profile.loop_profile.enable()
+    except ValueError as e:
+        # Another profiler, debugger or coverage tool owns sys.monitoring
+        JobProfile.running.release()
+        log.error(f"Not profiling job {file_id}: {e}")
+        yield None
+        return
+    token = _job_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        profile.loop_profile.disable()
+        _job_profile.reset(token)
+        try:
+            await asyncio.to_thread(profile.save, target_dir)
+            log.info(f"Saved profile of job {file_id} to {target_dir}")
+        except Exception as e:
+            log.error(f"Could not save profile of job {file_id}: {e}")
+        finally:
+            JobProfile.running.release()
+
+
+def bind(fn):
+    """Hook for the thread pool: profile `fn` if it was submitted from a profiled job."""
+    profile = _job_profile.get()
+    # A process-wide profile already sees the pool threads
+    return profile.wrap(fn) if profile and not PROCESS_WIDE else fn
+
+
+# Leaf frames of threads that are only waiting
+IDLE_FRAMES = {"threading.py:wait", "selectors.py:select", "thread.py:_worker", "queue.py:get"}
+
+
+def _collapse(frame, thread_name):
+    """One sample as a collapsed stack, root first: "thread;file.py:func;..."."""
+    stack = []
+    while frame is not None:
+        stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+        frame = frame.f_back
+    stack.append(thread_name)
+    return ";".join(reversed(stack))
+
+
+class SamplingProfiler:
+    """Samples every thread's stack at a fixed interval for a limited time.
+
+    Nothing is installed in the profiled threads, so it can be switched on
+    in a busy process; the report is collapsed stacks (flamegraph.pl,
+    speedscope) plus the functions most often on top of a busy stack.
+    """
+
+    def __init__(self, interval=PROFILE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.thread = None
+        self.stopped = threading.Event()
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = None
+        self.seconds = None
+
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, seconds):
+        if self.running():
+            raise RuntimeError("Sampling profiler is already running")
+        self.seconds = max(0.1, min(seconds, PROFILE_MAX_SECONDS))
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = time.time()
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def _run(self):
+        me = threading.get_ident()
+        deadline = time.monotonic() + self.seconds
+        while time.monotonic() < deadline and not self.stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != me:
+                    self.stacks[_collapse(frame, names.get(ident, str(ident)))] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def report(self, top=25):
+        busy = Counter()
+        for stack, count in self.stacks.items():
+            leaf = stack.rsplit(";", 1)[-1]
+            if leaf not in IDLE_FRAMES:
+                busy[leaf] += count
+        return {
+            "running": self.running(),
+            "started_at": self.started_at,
+            "seconds": self.seconds,
+            "interval": self.interval,
+            "samples": self.samples,
+            "top": [{"function": function, "samples": count,
+                     "percent": round(100 * count / self.samples, 1) if self.samples else 0.0}
+                    for function, count in busy.most_common(top)],
+        }
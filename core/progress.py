@@ -0,0 +1,68 @@
+import json
+import asyncio
+
+# Events after which nothing more will be published for a job
+TERMINAL_EVENTS = ("zip_ready", "captions_ready", "failed")
+POLL_INTERVAL = 0.5
+HEARTBEAT_INTERVAL = 15
+
+
+class ProgressBus:
+    """Publishes per-stage job events and lets clients follow them.
+
+    Events are persisted in the job store so a client connected to any worker
+    sees the same stream. Subscribers in the publishing process are woken
+    immediately; everyone else picks events up on the next poll of the store.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.waiters = {}
+
+    async def publish(self, file_id, event, **data):
+        await self.store.append_event(file_id, dict(data, event=event))
+        waiter = self.waiters.pop(file_id, None)
+        if waiter:
+            waiter.set()
+
+    def publisher(self, file_id):
+        """Bind `publish` to a job, for passing down as an `on_progress` callback."""
+        async def on_progress(event, **data):
+            await self.publish(file_id, event, **data)
+        return on_progress
+
+    async def _wait(self, file_id, timeout):
+        waiter = self.waiters.setdefault(file_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(waiter.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def subscribe(self, file_id, last_seq=0):
+        """Yield (seq, event) pairs after `last_seq` until a terminal event.
+
+        Yields (None, None) as a heartbeat when nothing happened for a while,
+        so idle connections are kept open through proxies.
+        """
+        idle = 0.0
+        while True:
+            events = await self.store.events_since(file_id, last_seq)
+            for seq, event in events:
+                last_seq = seq
+                yield seq, event
+                if event["event"] in TERMINAL_EVENTS:
+                    return
+            if events:
+                idle = 0.0
+            elif idle >= HEARTBEAT_INTERVAL:
+                idle = 0.0
+                yield None, None
+            await self._wait(file_id, POLL_INTERVAL)
+            idle += POLL_INTERVAL
+
+
+def format_sse(seq, event):
+    """Encode an event in Server-Sent Events wire format."""
+    if event is None:
+        return ": keep-alive\n\n"
+    return f"id: {seq}\nevent: {event['event']}\ndata: {json.dumps(event)}\n\n"
@@ -0,0 +1,254 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import threading
+from utils import log
+
+# Job store configuration
+JOB_STORE = os.getenv("JOB_STORE", "sqlite")  # "sqlite" or "memory"
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "jobs.db")
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", 24 * 3600))
+EVICT_INTERVAL_SECONDS = 60
+
+# Job states
+QUEUED = "queued"
+PROCESSING = "processing"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+class JobStore:
+    """Interface for job state shared between workers.
+
+    Jobs are plain dicts. Every method is async so backends that hit disk or
+    the network never block the event loop.
+    """
+
+    async def create(self, file_id, **fields):
+        raise NotImplementedError
+
+    async def get(self, file_id):
+        raise NotImplementedError
+
+    async def update(self, file_id, **fields):
+        raise NotImplementedError
+
+    async def transition(self, file_id, from_states, to_state, **fields):
+        """Atomically move a job from one of `from_states` to `to_state`.
+
+        Returns True if this caller won the transition, False if the job does
+        not exist or is in some other state.
+        """
+        raise NotImplementedError
+
+    async def evict_expired(self):
+        """Drop jobs not updated within the TTL. Returns the number evicted."""
+        raise NotImplementedError
+
+    async def append_event(self, file_id, event):
+        """Append a progress event to the job's log. Returns its sequence number."""
+        raise NotImplementedError
+
+    async def events_since(self, file_id, seq):
+        """Return [(seq, event), ...] appended after `seq`, oldest first."""
+        raise NotImplementedError
+
+
+class MemoryJobStore(JobStore):
+    """Single-process store, useful for tests and `--workers 1` deployments."""
+
+    def __init__(self, ttl=JOB_TTL_SECONDS):
+        self.ttl = ttl
+        self.jobs = {}
+        self.events = {}
+        self.last_evict = time.time()
+
+    async def create(self, file_id, **fields):
+        self.jobs[file_id] = dict(fields, file_id=file_id, updated_at=time.time())
+        if time.time() - self.last_evict > EVICT_INTERVAL_SECONDS:
+            await self.evict_expired()
+
+    async def get(self, file_id):
+        job = self.jobs.get(file_id)
+        return dict(job) if job else None
+
+    async def update(self, file_id, **fields):
+        if file_id in self.jobs:
+            self.jobs[file_id].update(fields, updated_at=time.time())
+
+    async def transition(self, file_id, from_states, to_state, **fields):
+        job = self.jobs.get(file_id)
+        if not job or job["status"] not in from_states:
+            return False
+        job.update(fields, status=to_state, updated_at=time.time())
+        return True
+
+    async def evict_expired(self):
+        cutoff = time.time() - self.ttl
+        expired = [fid for fid, job in self.jobs.items() if job["updated_at"] < cutoff]
+        for fid in expired:
+            del self.jobs[fid]
+            self.events.pop(fid, None)
+        self.last_evict = time.time()
+        return len(expired)
+
+    async def append_event(self, file_id, event):
+        events = self.events.setdefault(file_id, [])
+        events.append(event)
+        return len(events)
+
+    async def events_since(self, file_id, seq):
+        events = self.events.get(file_id, [])
+        return list(enumerate(events[seq:], seq + 1))
+
+
+class SqliteJobStore(JobStore):
+    """SQLite (WAL mode) store shared by every worker process on the host.
+
+    Status lives in its own column so transitions are a single conditional
+    UPDATE; everything else is kept as a JSON blob.
+    """
+
+    def __init__(self, path=JOB_DB_PATH, ttl=JOB_TTL_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self.local = threading.local()
+        self.last_evict = 0
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " file_id TEXT PRIMARY KEY,"
+                " status TEXT NOT NULL,"
+                " data TEXT NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_updated_at ON jobs (updated_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS events ("
+                " file_id TEXT NOT NULL,"
+                " seq INTEGER NOT NULL,"
+                " data TEXT NOT NULL,"
+                " PRIMARY KEY (file_id, seq))"
+            )
+
+    def _conn(self):
+        # One connection per thread; asyncio.to_thread reuses pool threads
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn = _Transaction(conn)
+            self.local.conn = conn
+        return conn
+
+    def _create(self, file_id, fields):
+        status = fields.pop("status", QUEUED)
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs (file_id, status, data, updated_at) VALUES (?, ?, ?, ?)",
+                (file_id, status, json.dumps(fields), time.time()),
+            )
+
+    def _get(self, file_id):
+        with self._conn() as conn:
+            row = conn.execute("SELECT status, data FROM jobs WHERE file_id = ?", (file_id,)).fetchone()
+        if row is None:
+            return None
+        job = json.loads(row[1])
+        job.update(file_id=file_id, status=row[0])
+        return job
+
+    def _update(self, file_id, fields, from_states=None):
+        with self._conn() as conn:
+            # BEGIN IMMEDIATE takes the write lock up front so the read-modify-write is atomic
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT status, data FROM jobs WHERE file_id = ?", (file_id,)).fetchone()
+            if row is None or (from_states is not None and row[0] not in from_states):
+                conn.execute("ROLLBACK")
+                return False
+            status = fields.pop("status", row[0])
+            data = json.loads(row[1])
+            data.update(fields)
+            conn.execute(
+                "UPDATE jobs SET status = ?, data = ?, updated_at = ? WHERE file_id = ?",
+                (status, json.dumps(data), time.time(), file_id),
+            )
+            conn.execute("COMMIT")
+        return True
+
+    def _evict_expired(self):
+        with self._conn() as conn:
+            cursor = conn.execute("DELETE FROM jobs WHERE updated_at < ?", (time.time() - self.ttl,))
+            conn.execute("DELETE FROM events WHERE file_id NOT IN (SELECT file_id FROM jobs)")
+        self.last_evict = time.time()
+        return cursor.rowcount
+
+    def _append_event(self, file_id, event):
+        with self._conn() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            seq = conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) + 1 FROM events WHERE file_id = ?", (file_id,)
+            ).fetchone()[0]
+            conn.execute("INSERT INTO events (file_id, seq, data) VALUES (?, ?, ?)", (file_id, seq, json.dumps(event)))
+            conn.execute("COMMIT")
+        return seq
+
+    def _events_since(self, file_id, seq):
+        with self._conn() as conn:
+            rows = conn.execute(
+                "SELECT seq, data FROM events WHERE file_id = ? AND seq > ? ORDER BY seq", (file_id, seq)
+            ).fetchall()
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    async def create(self, file_id, **fields):
+        await asyncio.to_thread(self._create, file_id, dict(fields))
+        if time.time() - self.last_evict > EVICT_INTERVAL_SECONDS:
+            evicted = await self.evict_expired()
+            if evicted:
+                log.info(f"Evicted {evicted} expired jobs")
+
+    async def get(self, file_id):
+        return await asyncio.to_thread(self._get, file_id)
+
+    async def update(self, file_id, **fields):
+        await asyncio.to_thread(self._update, file_id, dict(fields))
+
+    async def transition(self, file_id, from_states, to_state, **fields):
+        return await asyncio.to_thread(self._update, file_id, dict(fields, status=to_state), tuple(from_states))
+
+    async def evict_expired(self):
+        return await asyncio.to_thread(self._evict_expired)
+
+    async def append_event(self, file_id, event):
+        return await asyncio.to_thread(self._append_event, file_id, event)
+
+    async def events_since(self, file_id, seq):
+        return await asyncio.to_thread(self._events_since, file_id, seq)
+
+
+class _Transaction:
+    """Wraps a connection so `with conn:` doesn't close it, and any statement
+    left open by an exception gets rolled back."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self.conn.in_transaction:
+            self.conn.execute("ROLLBACK")
+        return False
+
+
+def get_job_store():
+    """Build the job store selected by the JOB_STORE environment variable."""
+    if JOB_STORE == "memory":
+        return MemoryJobStore()
+    if JOB_STORE == "sqlite":
+        return SqliteJobStore()
+    raise ValueError(f"Unknown JOB_STORE backend: {JOB_STORE}")
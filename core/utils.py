@@ -1,30 +1,61 @@
+import io
 import os
+import csv
+import json
+import time
+import hashlib
 import shutil
 import zipfile
+import posixpath
 from PIL import Image, GifImagePlugin
 from xml.etree import ElementTree
 from typing_extensions import TypedDict, List
 import logging
-import colorlog
-import httpx
 import asyncio
-
-formatter = colorlog.ColoredFormatter(
-    "%(log_color)s%(levelname)s:%(reset)s %(message)s",
-    log_colors={
-        "DEBUG": "cyan",
-        "INFO": "green",
-        "WARNING": "yellow",
-        "ERROR": "red",
-        "CRITICAL": "bold_red",
-    }
-)
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from zipstream import entry_for, bytes_entry, archive_size, write_archive
+from preflight import check_archive, plan_images, open_image, load_pil_plugins, SKIP
+import decorative
+from decorative import classify_decorative, DECORATIVE_FILTER
+from metrics import EXTRACTION_SECONDS, COMPRESSION_SECONDS, ALT_TEXT_BATCH_SECONDS, ZIP_SECONDS, image_format
+from jobtrace import JobTrace
+from alttext import get_alt_text_backend
+
+# Logging: LOG_FORMAT=json emits one JSON object per record, including the
+# structured fields of trace spans, instead of coloured text
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "color")
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {"time": record.created, "level": record.levelname, "logger": record.name,
+                 "message": record.getMessage()}
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+if LOG_FORMAT == "json":
+    formatter = JsonFormatter()
+else:
+    import colorlog
+    formatter = colorlog.ColoredFormatter(
+        "%(log_color)s%(levelname)s:%(reset)s %(message)s",
+        log_colors={
+            "DEBUG": "cyan",
+            "INFO": "green",
+            "WARNING": "yellow",
+            "ERROR": "red",
+            "CRITICAL": "bold_red",
+        }
+    )
 
 handler = logging.StreamHandler()
 handler.setFormatter(formatter)
 log = logging.getLogger()
 log.addHandler(handler)
-log.setLevel(logging.DEBUG)
+log.setLevel(LOG_LEVEL)
 
 class AltTexts(TypedDict):
     texts: List[str]
@@ -42,107 +73,265 @@ TEXT_DIR = lambda file_id: os.path.join(TEMP_DIR, file_id, "alt_texts")
 ZIP_PATH = os.path.join(ZIP_DIR, "compressed_results.zip")
 zip_path = lambda file_id: ZIP_PATH.split(".")[0]+"_"+file_id+".zip"
 temp_path = lambda file_id: os.path.join(TEMP_DIR, file_id)
+result_dir = lambda file_id: os.path.join(RESULTS_DIR, file_id)
+
+# Images per request to the gemini service. It captions them 8 to a model
+# call and streams each call's results back, so larger requests still
+# deliver their first alt texts early
+ALT_TEXT_BATCH_SIZE = int(os.getenv("ALT_TEXT_BATCH_SIZE", 8))
+# Alt-text batches allowed in flight at once when captioning overlaps compression
+ALT_TEXT_MAX_IN_FLIGHT = int(os.getenv("ALT_TEXT_MAX_IN_FLIGHT", 2))
+# Alt-text batches in flight across all jobs in this worker, shared fairly by BatchScheduler
+ALT_TEXT_CONCURRENCY = int(os.getenv("ALT_TEXT_CONCURRENCY", 4))
+ALT_TEXT_SHORTEST_FIRST = os.getenv("ALT_TEXT_SHORTEST_FIRST", "0") == "1"
+# Longest side of the copies sent for captioning in captions-only mode
+CAPTION_MAX_SIDE = int(os.getenv("CAPTION_MAX_SIDE", 768))
 
 os.makedirs(ZIP_DIR, exist_ok=True)
 os.makedirs(RESULTS_DIR, exist_ok=True)
 
-async def extract_images_from_docx(docx_file_path, file_id):
+async def extract_images_from_docx(docx_file_path, file_id, on_progress=None):
     """Extract images from DOCX while preserving their order in the document.
     
     Opens the DOCX directly from disk (instead of loading into memory) and
     processes images sequentially with limited concurrency to stay within
-    memory limits.
+    memory limits. `on_progress(event, **data)` is awaited as each stage
+    completes.
     """
     extracted_images = []
-    image_rels = {}  # Map relationship IDs to image files
-    image_order = []  # Store the order of images as they appear
-    
+    async for image in iter_images_from_docx(docx_file_path, file_id, on_progress):
+        # Skip images that failed processing
+        if image["path"]:
+            extracted_images.append(image["path"])
+    return sorted(extracted_images)
+
+async def iter_images_from_docx(docx_file_path, file_id, on_progress=None, captions_only=False, trace=None):
+    """Yield each image as soon as it is compressed, in document order.
+
+    Yields dicts with `index`, `media_name` (name inside the DOCX) and `path`
+    (the compressed file, or None if processing failed). Later images keep
+    compressing in the background while the consumer handles earlier ones.
+    With `captions_only`, `path` is a small caption-sized JPEG instead of the
+    deliverable encode.
+
+    The archive and every image header are checked against the pre-flight
+    budgets first: BudgetExceeded is raised before anything is unpacked, and
+    images over budget are yielded with `path` None and a `skipped` reason.
+    Images that look decorative are not compressed either; they come through
+    with `path` None and a `decorative` reason.
+
+    Extraction and every image's processing are recorded as spans on `trace`.
+    """
+    trace = trace or JobTrace(file_id)
     # Create directories for this file ID
     temp_dir = os.path.join(TEMP_DIR, file_id)
     os.makedirs(temp_dir, exist_ok=True)
     os.makedirs(IMAGE_DIR(file_id), exist_ok=True)
-    os.makedirs(TEXT_DIR(file_id), exist_ok=True)
     
     log.info("Extracting images from DOCX...")
-    # Open zip directly from file path — avoids loading entire DOCX into memory
-    with zipfile.ZipFile(docx_file_path, "r") as docx_zip:
-        # First, get the relationship mappings
-        try:
-            rels_content = docx_zip.read('word/_rels/document.xml.rels')
-            rels_tree = ElementTree.fromstring(rels_content)
-
-            # Map relationship IDs to image filenames
-            for rel in rels_tree.findall('.//{http://schemas.openxmlformats.org/package/2006/relationships}Relationship'):
-                rid = rel.get('Id')
-                target = rel.get('Target')
-                if 'media/' in target:
-                    image_rels[rid] = target.split('/')[-1]
-        except Exception as e:
-            log.error(f"Error reading relationships: {e}")
-
-        # Read the main document to get image order
-        try:
-            doc_content = docx_zip.read('word/document.xml')
-            doc_tree = ElementTree.fromstring(doc_content)
+    # Zip and XML work is all blocking, so it runs in a thread, off the event loop
+    image_order, plan, extraction = await asyncio.to_thread(unpack_docx, docx_file_path, temp_dir, trace)
+    EXTRACTION_SECONDS.observe(extraction["duration"])
 
-            namespace = {'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main',
-                        'a': 'http://schemas.openxmlformats.org/drawingml/2006/main',
-                        'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'}
+    if on_progress:
+        await on_progress("images_found", count=len(image_order), skipped=extraction["skipped"])
 
-            for img in doc_tree.findall('.//a:blip', namespace):
-                rid = img.get('{http://schemas.openxmlformats.org/officeDocument/2006/relationships}embed')
-                if rid in image_rels:
-                    image_order.append(image_rels[rid])
-        except Exception as e:
-            log.error(f"Error reading document structure: {e}")
+    # Zip file is now closed — DOCX no longer in memory.
+    # Process images with limited concurrency to cap memory usage.
+    # Semaphore limits how many PIL images are decompressed in memory at once.
+    semaphore = asyncio.Semaphore(2)
 
-        # Free XML trees now that we have the image order
-        del doc_content, doc_tree
+    async def process_with_limit(idx, img_name):
+        if plan[idx - 1]["action"] == SKIP:
+            return None, None
+        decorative = None
+        queued = time.perf_counter()
+        async with semaphore:
+            with trace.span("process_image", index=idx, media_name=img_name, format=image_format(img_name),
+                            waited=round(time.perf_counter() - queued, 6)) as span:
+                if DECORATIVE_FILTER:
+                    decorative = await check_decorative(temp_dir, img_name, idx)
+                if decorative:
+                    span["decorative"] = decorative
+                    compressed_path = None
+                else:
+                    compressed_path = await process_image(temp_dir, img_name, idx, file_id, captions_only,
+                                                          frames=plan[idx - 1]["frames"], span=span)
+                span["ok"] = compressed_path is not None
+        if on_progress:
+            await on_progress("image_compressed", index=idx, image_name=img_name,
+                              ok=compressed_path is not None, decorative=decorative is not None)
+        return compressed_path, decorative
+
+    tasks = [asyncio.create_task(process_with_limit(idx, img_name))
+             for idx, img_name in enumerate(image_order, 1)]
+    try:
+        # Awaiting in creation order yields in document order while the
+        # semaphore keeps at most two images decoded at once.
+        for idx, (img_name, task) in enumerate(zip(image_order, tasks), 1):
+            path, decorative = await task
+            image = {"index": idx, "media_name": img_name, "path": path}
+            if plan[idx - 1]["action"] == SKIP:
+                image["skipped"] = plan[idx - 1]["reason"]
+            if decorative:
+                image["decorative"] = decorative
+            yield image
+    finally:
+        # Consumer stopped early (error or client went away) — stop compressing
+        for task in tasks:
+            task.cancel()
 
-        if not image_order:
-            image_order = [name.split('/')[-1] for name in docx_zip.namelist()
-                          if name.startswith('word/media/')]
+def unpack_docx(docx_file_path, temp_dir, trace):
+    """Pre-flight the DOCX, find its images in document order and write each
+    to `temp_dir` as temp_<index>_<name>. Blocking; run it in a thread.
 
-        # First, extract all raw image files from zip to disk (fast, low memory)
-        for img_name in image_order:
+    Returns the image names, the pre-flight plan and the extraction span.
+    """
+    # Open zip directly from file path — avoids loading entire DOCX into memory
+    with trace.span("extraction") as extraction, zipfile.ZipFile(docx_file_path, "r") as docx_zip:
+        extraction["input_bytes"] = os.path.getsize(docx_file_path)
+        check_archive(docx_zip)
+        media_paths = find_images_in_docx(docx_zip)
+        image_order = [posixpath.basename(path) for path in media_paths]
+        plan = plan_images(docx_zip, media_paths)
+
+        # Extract raw image files from zip to disk (streamed, low memory).
+        # Files are keyed by position so an image used twice is processed twice.
+        for idx, (media_path, img_name) in enumerate(zip(media_paths, image_order), 1):
+            if plan[idx - 1]["action"] == SKIP:
+                continue
             try:
-                img_data = docx_zip.read(f'word/media/{img_name}')
-                temp_file = os.path.join(temp_dir, f"temp_{img_name}")
-                with open(temp_file, "wb") as f:
-                    f.write(img_data)
-                del img_data  # Free raw bytes immediately
+                temp_file = os.path.join(temp_dir, f"temp_{idx:03d}_{img_name}")
+                with docx_zip.open(media_path) as src, open(temp_file, "wb") as f:
+                    shutil.copyfileobj(src, f, 1024 * 1024)
             except Exception as e:
                 log.error(f"Error extracting image {img_name}: {e}")
+        extraction["images"] = len(image_order)
+        extraction["skipped"] = sum(1 for entry in plan if entry["action"] == SKIP)
+    return image_order, plan, extraction
+
+# Namespaces used when scanning document parts for images
+REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+R_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+BLIP_TAG = "{http://schemas.openxmlformats.org/drawingml/2006/main}blip"
+VML_IMAGE_TAG = "{urn:schemas-microsoft-com:vml}imagedata"
+# Parts are scanned body first, then headers, footers and notes
+PART_ORDER = ("document", "header", "footer", "footnotes", "endnotes", "comments")
+
+def _part_sort_key(part):
+    """Sort document parts by kind, then numerically (header2 before header10)."""
+    name = posixpath.basename(part).split(".")[0]
+    kind = name.rstrip("0123456789")
+    number = name[len(kind):]
+    rank = PART_ORDER.index(kind) if kind in PART_ORDER else len(PART_ORDER)
+    return rank, kind, int(number) if number else 0
+
+def _iter_elements(source, tags):
+    """Stream (tag, attributes) for matching elements without building the tree.
+
+    Each element is detached from its parent as soon as it ends, so memory
+    stays flat no matter how large the part is.
+    """
+    stack = []
+    for event, elem in ElementTree.iterparse(source, events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            continue
+        stack.pop()
+        if elem.tag in tags:
+            yield elem.tag, dict(elem.attrib)
+        elem.clear()
+        # The parser reads ahead, so later siblings may already be attached;
+        # earlier ones are gone, which leaves this element first in its parent
+        if stack and len(stack[-1]) and stack[-1][0] is elem:
+            del stack[-1][0]
+
+def _read_image_rels(docx_zip, rels_path, part_dir):
+    """Map relationship IDs in one .rels file to media paths inside the zip."""
+    image_rels = {}
+    with docx_zip.open(rels_path) as rels:
+        for _, attrs in _iter_elements(rels, {f"{{{REL_NS}}}Relationship"}):
+            target = attrs.get("Target", "")
+            if attrs.get("TargetMode") == "External" or "media/" not in target:
+                continue
+            if target.startswith("/"):
+                # An absolute target is relative to the package root
+                image_rels[attrs["Id"]] = posixpath.normpath(target.lstrip("/"))
+            else:
+                image_rels[attrs["Id"]] = posixpath.normpath(posixpath.join(part_dir, target))
+    return image_rels
 
-    # Zip file is now closed — DOCX no longer in memory.
-    # Process images with limited concurrency to cap memory usage.
-    # Semaphore limits how many PIL images are decompressed in memory at once.
-    semaphore = asyncio.Semaphore(2)
+def find_images_in_docx(docx_zip):
+    """List the zip paths of every image in document order.
 
-    async def process_with_limit(idx, img_name):
-        async with semaphore:
-            return await process_image(temp_dir, img_name, idx, file_id)
+    Covers the body and every other part with its own relationships (headers,
+    footers, footnotes, ...), scanning each with a streaming parser. Falls back
+    to all of word/media/ if no references could be read.
+    """
+    names = set(docx_zip.namelist())
+    parts = []
+    for name in names:
+        directory, rels_name = posixpath.split(name)
+        if directory == "word/_rels" and rels_name.endswith(".rels"):
+            part = posixpath.join("word", rels_name[:-len(".rels")])
+            if part in names:
+                parts.append((part, name))
+    parts.sort(key=lambda part: _part_sort_key(part[0]))
+
+    media_paths = []
+    for part, rels_path in parts:
+        try:
+            image_rels = _read_image_rels(docx_zip, rels_path, "word")
+            if not image_rels:
+                continue
+            with docx_zip.open(part) as source:
+                for tag, attrs in _iter_elements(source, {BLIP_TAG, VML_IMAGE_TAG}):
+                    rid = attrs.get(f"{{{R_NS}}}embed" if tag == BLIP_TAG else f"{{{R_NS}}}id")
+                    if rid in image_rels and image_rels[rid] in names:
+                        media_paths.append(image_rels[rid])
+        except Exception as e:
+            log.error(f"Error reading images from {part}: {e}")
 
-    tasks = []
-    for idx, img_name in enumerate(image_order, 1):
-        tasks.append(process_with_limit(idx, img_name))
+    if not media_paths:
+        media_paths = sorted(name for name in names if name.startswith("word/media/"))
+    return media_paths
 
-    extracted_images = await asyncio.gather(*tasks)
-        
-    # Filter out None values from extracted_images (failed processing)
-    extracted_images = [img for img in extracted_images if img]
-    return sorted(extracted_images)
+async def check_decorative(temp_dir, img_name, idx):
+    """Classify an extracted image from a thumbnail; its temp file is dropped if decorative."""
+    temp_file = os.path.join(temp_dir, f"temp_{idx:03d}_{img_name}")
+    try:
+        reason = await asyncio.to_thread(classify_decorative, temp_file)
+    except Exception as e:
+        # Unreadable here means unreadable for compression too; let that path report it
+        log.debug(f"Could not classify {img_name}: {e}")
+        return None
+    if reason:
+        os.remove(temp_file)
+    return reason
 
-async def process_image(temp_dir, img_name, idx, file_id):
+async def process_image(temp_dir, img_name, idx, file_id, captions_only=False, frames=None, span=None):
     """Process a single image: compress and save. Runs under a semaphore to limit
-    concurrent PIL operations and keep memory bounded."""
+    concurrent PIL operations and keep memory bounded. `frames` is the GIF frame
+    count from the pre-flight check, if known. Input and output sizes and the
+    number of encode attempts are recorded on the trace `span`, if given."""
+    span = {} if span is None else span
     try:
-        temp_file = os.path.join(temp_dir, f"temp_{img_name}")
+        temp_file = os.path.join(temp_dir, f"temp_{idx:03d}_{img_name}")
         if not os.path.exists(temp_file):
             log.error(f"Temp file not found: {temp_file}")
             return None
+        span["input_bytes"] = os.path.getsize(temp_file)
 
         base_name = f"{idx:03d}"
+        if captions_only:
+            # Only the alt-text model sees this copy, so skip the deliverable encodes
+            caption_path = os.path.join(IMAGE_DIR(file_id), f"caption_{base_name}.jpg")
+            with COMPRESSION_SECONDS.labels("caption").time():
+                await asyncio.to_thread(make_caption_copy, temp_file, caption_path)
+            os.remove(temp_file)
+            span.update(attempts=1, output_bytes=os.path.getsize(caption_path))
+            return caption_path
+
         if img_name.lower().endswith(("jpeg", "jpg")):
             compressed_path = os.path.join(IMAGE_DIR(file_id), f"compressed_{base_name}.jpg")
         elif img_name.lower().endswith("png"):
@@ -153,14 +342,15 @@ async def process_image(temp_dir, img_name, idx, file_id):
             compressed_path = os.path.join(IMAGE_DIR(file_id), f"compressed_{base_name}.jpg")  # Default to JPG
 
         # Run compression in a thread pool to not block the event loop
+        compression_started = time.perf_counter()
         if img_name.lower().endswith(("jpeg", "jpg", "png")):
-            await asyncio.to_thread(compress_image, temp_file, compressed_path, 95)
+            await asyncio.to_thread(compress_image, temp_file, compressed_path, 95, stats=span)
         elif img_name.lower().endswith("gif"):
-            await asyncio.to_thread(compress_gif, temp_file, compressed_path, 500)
+            await asyncio.to_thread(compress_gif, temp_file, compressed_path, 500, n_frames=frames, stats=span)
         else:
             # Handle other formats
             try:
-                img = Image.open(temp_file)
+                img = open_image(temp_file)
                 try:
                     # If the image has a palette mode (P), convert it to RGB
                     if img.mode == 'P':
@@ -172,11 +362,15 @@ async def process_image(temp_dir, img_name, idx, file_id):
                         img = Image.alpha_composite(background, img).convert("RGB")  # Merge and remove transparency
 
                     img.save(compressed_path, "JPEG", quality=95)
+                    span["attempts"] = 1
                 finally:
                     img.close()
             except Exception as e:
                 log.error(f"Error converting unknown format: {e}")
                 return None
+        COMPRESSION_SECONDS.labels(image_format(img_name)).observe(time.perf_counter() - compression_started)
+        if os.path.exists(compressed_path):
+            span["output_bytes"] = os.path.getsize(compressed_path)
 
         if os.path.exists(temp_file):
             os.remove(temp_file)
@@ -187,10 +381,11 @@ async def process_image(temp_dir, img_name, idx, file_id):
         log.error(f"Error processing image {img_name}: {e}")
         return None
 
-def compress_image(image_path, output_path, max_size_kb):
-    """Compress an image (JPG/PNG) to a max size in KB."""
-    log.debug(f"Compressing image: {image_path}...")
-    image = Image.open(image_path)
+def compress_image(image_path, output_path, max_size_kb, stats=None):
+    """Compress an image (JPG/PNG) to a max size in KB. The number of encodes
+    and the final quality are recorded in `stats`, if given."""
+    image = open_image(image_path)
+    attempts = 0
     try:
         if image.mode == "RGBA":
             image = image.convert("RGB")
@@ -198,29 +393,56 @@ def compress_image(image_path, output_path, max_size_kb):
         quality = 95
         while quality > 10:
             image.save(output_path, "JPEG", quality=quality)
+            attempts += 1
             if os.path.getsize(output_path) <= max_size_kb * 1024:
                 break
             quality -= 5
     finally:
         image.close()
+        if stats is not None:
+            stats.update(attempts=attempts, quality=quality)
 
-def compress_gif(image_path, output_path, max_size_kb, max_attempts=3):
-    """Compress a GIF while preserving animation."""
-    log.debug(f"Compressing GIF: {image_path}...")
-    image = Image.open(image_path)
+def make_caption_copy(image_path, output_path, max_side=CAPTION_MAX_SIDE):
+    """Save a single downscaled JPEG for captioning: one encode, first frame only."""
+    image = open_image(image_path)
+    try:
+        # Let the JPEG decoder downscale while decoding instead of after
+        image.draft("RGB", (max_side, max_side))
+        image.seek(0)
+        frame = image.convert("RGBA") if image.mode in ("P", "LA") else image
+        if frame.mode == "RGBA":
+            background = Image.new("RGB", frame.size, (255, 255, 255))
+            background.paste(frame, mask=frame.getchannel("A"))
+            frame = background
+        elif frame.mode != "RGB":
+            frame = frame.convert("RGB")
+        frame.thumbnail((max_side, max_side), Image.Resampling.BILINEAR)
+        frame.save(output_path, "JPEG", quality=80)
+    finally:
+        image.close()
+
+def compress_gif(image_path, output_path, max_size_kb, max_attempts=3, n_frames=None, stats=None):
+    """Compress a GIF while preserving animation.
+
+    Pass `n_frames` when the frame count is already known: counting them
+    means walking the whole file, and 1 keeps just the first frame. The
+    number of encode attempts and frames kept are recorded in `stats`, if given.
+    """
+    image = open_image(image_path)
+    encodes = 0
+    frames = []
     try:
         if not isinstance(image, GifImagePlugin.GifImageFile):
             log.warning(f"Skipping {image_path}: Not a valid GIF")
             return
 
         original_width, original_height = image.size
-        n_frames = image.n_frames
+        n_frames = n_frames or image.n_frames
         loop_info = image.info.get("loop", 0)
 
         # Limit frame count to avoid memory explosion on large GIFs
         max_frames = min(n_frames, 50)
 
-        frames = []
         durations = []
 
         try:
@@ -240,6 +462,7 @@ def compress_gif(image_path, output_path, max_size_kb, max_attempts=3):
         current_colors = 256
 
         while attempt < max_attempts:
+            encodes += 1
             new_width = max(50, int(original_width * scale_factor))
             new_height = max(50, int(original_height * scale_factor))
 
@@ -296,61 +519,339 @@ def compress_gif(image_path, output_path, max_size_kb, max_attempts=3):
         return False
     finally:
         image.close()
+        if stats is not None:
+            stats.update(attempts=encodes, frames=len(frames))
+
+class BatchScheduler:
+    """Shares the gemini service's concurrency fairly between jobs.
+
+    Every job queues its outgoing batches here. Free slots are handed out
+    round-robin across jobs, so a 3-image document isn't stuck behind every
+    batch of a 400-image manual, while a lone large job still gets all the
+    capacity. With `shortest_first`, the job that has been served the fewest
+    batches so far goes first — small jobs finish before they've had a chance
+    to accumulate service, which approximates shortest-job-first without
+    knowing job sizes up front.
+    """
 
-async def get_alt_texts(image_paths, file_id, batch_size=8):
+    def __init__(self, concurrency=ALT_TEXT_CONCURRENCY, shortest_first=ALT_TEXT_SHORTEST_FIRST):
+        self.concurrency = concurrency
+        self.shortest_first = shortest_first
+        self.active = 0
+        self.waiting = OrderedDict()  # file_id -> deque of futures, in round-robin order
+        self.served = {}  # file_id -> batches started, for jobs with work outstanding
+        self.in_flight = {}  # file_id -> batches currently holding a slot
+
+    @asynccontextmanager
+    async def slot(self, file_id):
+        turn = asyncio.get_running_loop().create_future()
+        self.waiting.setdefault(file_id, deque()).append(turn)
+        self.served.setdefault(file_id, 0)
+        self._dispatch()
+        try:
+            await turn
+        except asyncio.CancelledError:
+            if turn.done() and not turn.cancelled():
+                self._release(file_id)  # Granted just as we were cancelled
+            else:
+                self._forget(file_id)
+            raise
+        try:
+            yield
+        finally:
+            self._release(file_id)
+
+    def _pick(self):
+        if self.shortest_first:
+            # min() keeps the first of equals, so ties fall back to round-robin order
+            return min(self.waiting, key=lambda file_id: self.served[file_id])
+        return next(iter(self.waiting))
+
+    def _dispatch(self):
+        while self.active < self.concurrency and self.waiting:
+            file_id = self._pick()
+            queue = self.waiting[file_id]
+            turn = queue.popleft()
+            if queue:
+                self.waiting.move_to_end(file_id)  # Back of the line for its next batch
+            else:
+                del self.waiting[file_id]
+            if turn.cancelled():
+                self._forget(file_id)  # Its last waiter gave up before getting a slot
+                continue
+            self.active += 1
+            self.served[file_id] += 1
+            self.in_flight[file_id] = self.in_flight.get(file_id, 0) + 1
+            turn.set_result(None)
+
+    def _release(self, file_id):
+        self.active -= 1
+        self.in_flight[file_id] -= 1
+        self._forget(file_id)
+        self._dispatch()
+
+    def _forget(self, file_id):
+        """Drop bookkeeping for a job once it has nothing queued or running."""
+        if file_id not in self.waiting and not self.in_flight.get(file_id):
+            self.served.pop(file_id, None)
+            self.in_flight.pop(file_id, None)
+
+    def stats(self):
+        return {
+            "active": self.active,
+            "concurrency": self.concurrency,
+            "jobs_waiting": len(self.waiting),
+            "batches_waiting": sum(len(queue) for queue in self.waiting.values()),
+        }
+
+alt_text_scheduler = BatchScheduler()
+alt_text_backend = get_alt_text_backend()
+
+def warm_up():
+    """Load the dependencies the first job would otherwise wait for (Pillow's
+    decoders, numpy, the alt-text client or Gemini SDK). Blocking; run it in a
+    thread once the service is up."""
+    started = time.perf_counter()
+    try:
+        load_pil_plugins()
+        if DECORATIVE_FILTER:
+            decorative.warm_up()
+        alt_text_backend.warm_up()
+    except Exception as e:
+        log.warning(f"Warm-up failed, dependencies will load on first use: {e}")
+        return
+    log.info(f"Warm-up done in {time.perf_counter() - started:.2f}s")
+
+async def get_alt_texts(image_paths, file_id, batch_size=ALT_TEXT_BATCH_SIZE, on_progress=None):
     """Send images to the gemini service in batches to avoid loading all into memory at once."""
     log.debug("Processing images for alt text...")
     all_alt_texts = {}
+
+    async def images():
+        for idx, path in enumerate(image_paths, 1):
+            yield {"index": idx, "media_name": os.path.basename(path), "path": path}
+
+    # One batch in flight at a time, as this helper has always sent them. The
+    # service takes concurrent batches; run_job overlaps up to ALT_TEXT_MAX_IN_FLIGHT
+    async for batch in iter_alt_texts(images(), file_id, batch_size, max_in_flight=1, on_progress=on_progress):
+        for image in batch:
+            if image["alt_text"] is not None:
+                all_alt_texts[os.path.basename(image["path"])] = image["alt_text"]
     
-    # Using httpx for async HTTP requests with NO timeout
-    # This allows the gemini service to take as long as it needs
-    async with httpx.AsyncClient(timeout=None) as client:
-        for i in range(0, len(image_paths), batch_size):
-            batch = image_paths[i:i + batch_size]
-            files_data = []
-            for path in batch:
-                with open(path, "rb") as img_file:
-                    img_content = img_file.read()
-                    files_data.append(("files", (os.path.basename(path), img_content, "image/jpeg")))
-            
+    log.info(f"Successfully received {len(all_alt_texts)} alt texts total")
+    return all_alt_texts
+
+async def iter_alt_texts(images, file_id, batch_size=ALT_TEXT_BATCH_SIZE, max_in_flight=ALT_TEXT_MAX_IN_FLIGHT,
+                         on_progress=None, trace=None):
+    """Caption images from an async iterable as they arrive, yielding each batch in order.
+
+    `images` yields dicts as produced by `iter_images_from_docx`. A batch is
+    sent as soon as `batch_size` images have arrived, so captioning overlaps
+    with compression. Up to `max_in_flight` batches run concurrently, and
+    results are released strictly in document order — a fast batch waits for
+    the slower ones ahead of it, so reordering is bounded by `max_in_flight`.
+
+    Each yielded image dict gains `size` (bytes sent) and `alt_text`. Images
+    whose processing failed (`path` is None) pass through with `alt_text` None;
+    decorative ones get an empty alt text and don't take up room in a batch.
+    Each batch sent is recorded as a span on `trace`.
+    """
+    slots = asyncio.Semaphore(max_in_flight)
+    pending = asyncio.Queue()  # Batch tasks in document order; None marks the end
+
+    async def produce():
+        batch = []
+        batch_no = 0
+        sendable = 0
+        try:
+            async for image in images:
+                batch.append(image)
+                # Only images that will be sent count towards a full batch;
+                # a run of unsent ones is passed on without waiting
+                if image["path"]:
+                    sendable += 1
+                if sendable == batch_size or (not sendable and len(batch) == batch_size):
+                    batch_no += 1
+                    await slots.acquire()
+                    pending.put_nowait(asyncio.create_task(_send_batch(batch, batch_no, file_id, on_progress, trace)))
+                    batch = []
+                    sendable = 0
+            if batch:
+                batch_no += 1
+                await slots.acquire()
+                pending.put_nowait(asyncio.create_task(_send_batch(batch, batch_no, file_id, on_progress, trace)))
+            pending.put_nowait(None)
+        except Exception as e:
+            pending.put_nowait(e)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            item = await pending.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            batch = await item
+            slots.release()
+            yield batch
+    finally:
+        producer.cancel()
+        while not pending.empty():
+            item = pending.get_nowait()
+            if isinstance(item, asyncio.Task):
+                item.cancel()
+
+def _upload_name(image):
+    """Filename an image is sent under; the gemini service keys its alt texts by it.
+    Images may set `upload_name` when their file names aren't unique within a batch."""
+    return image.get("upload_name") or os.path.basename(image["path"])
+
+def _read_batch(batch):
+    """Load a batch's images as (name, bytes) pairs, recording each one's `size`."""
+    files_data = []
+    for image in batch:
+        if image["path"]:
+            with open(image["path"], "rb") as img_file:
+                img_content = img_file.read()
+            image["size"] = len(img_content)
+            files_data.append((_upload_name(image), img_content))
+    return files_data
+
+async def _send_batch(batch, batch_no, file_id, on_progress=None, trace=None):
+    """Caption one batch through the alt-text backend and attach the returned alt texts."""
+    trace = trace or JobTrace(file_id)
+    for image in batch:
+        image["size"] = None
+        image["alt_text"] = "" if image.get("decorative") else None
+    if not any(image["path"] for image in batch):
+        return batch
+
+    queued = time.perf_counter()
+    # Wait for this job's turn before reading any image bytes into memory
+    async with alt_text_scheduler.slot(file_id):
+        with trace.span("alt_text_batch", batch=batch_no, waited=round(time.perf_counter() - queued, 6)) as span:
+            files_data = await asyncio.to_thread(_read_batch, batch)
+            span.update(images=len(files_data), bytes_sent=sum(image["size"] or 0 for image in batch))
+
+            sent_at = time.perf_counter()
             try:
-                log.info(f"Sending batch {i // batch_size + 1} ({len(batch)} images) to gemini service...")
-                response = await client.post("https://altgenerator.onrender.com/generate-alt-texts", files=files_data)
-                response.raise_for_status()
-                batch_texts = response.json()
-                all_alt_texts.update(batch_texts)
-                log.info(f"Batch {i // batch_size + 1} complete: received {len(batch_texts)} alt texts")
-            except httpx.HTTPStatusError as e:
-                log.error(f"HTTP error getting alt texts: {e.response.status_code} - {e.response.text}")
-                raise Exception(f"Gemini service returned error: {e.response.status_code}") from e
+                log.debug(f"Sending batch {batch_no} ({len(files_data)} images) to gemini service...")
+                batch_texts = {}
+                by_name = {_upload_name(image): image for image in batch if image["path"]}
+                # Alt texts are attached as they stream in, not when the whole batch is done
+                async for name, alt_text in alt_text_backend.stream(files_data):
+                    batch_texts[name] = alt_text
+                    if name in by_name:
+                        by_name[name]["alt_text"] = alt_text
+                        if on_progress:
+                            await on_progress("image_captioned", index=by_name[name]["index"], image_name=name)
+                ALT_TEXT_BATCH_SECONDS.labels("ok").observe(time.perf_counter() - sent_at)
+                log.info(f"Batch {batch_no} complete: received {len(batch_texts)} alt texts")
             except Exception as e:
+                ALT_TEXT_BATCH_SECONDS.labels("error").observe(time.perf_counter() - sent_at)
                 log.error(f"Error getting alt texts: {e}")
                 raise Exception(f"Failed to get alt texts from gemini service: {str(e)}") from e
             finally:
                 # Free the batch data immediately
                 del files_data
-    
-    log.info(f"Successfully received {len(all_alt_texts)} alt texts total")
-    return all_alt_texts
 
-async def create_zip(file_id):
-    log.debug("Creating ZIP file...")
-    # Run ZIP creation in a thread pool to not block the event loop
-    return await asyncio.to_thread(_create_zip_sync, file_id)
-
-def _create_zip_sync(file_id):
-    """Synchronous version of create_zip for running in a thread pool"""
-    with zipfile.ZipFile(zip_path(file_id), "w", zipfile.ZIP_DEFLATED) as zipf:
-        for folder_func in [IMAGE_DIR, TEXT_DIR]:
-            folder = folder_func(file_id)
-            if os.path.exists(folder):
-                for root, _, files in os.walk(folder):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        zipf.write(file_path, os.path.relpath(file_path, os.path.join(TEMP_DIR, file_id)))
+    if on_progress:
+        await on_progress("alt_text_batch", batch=batch_no, count=len(batch_texts))
+    return batch
+
+def _create_zip_sync(file_id, manifest, txt_files=False):
+    """Write the job's result to zip_path(file_id), blocking; used by the benchmarks.
+
+    Writes the same layout the download endpoint streams: media STORED,
+    the alt-text manifest deflated.
+    """
+    entries = _folder_entries(temp_path(file_id), "compressed_images") + _manifest_entries(manifest, txt_files)
+    write_archive(entries, time.time(), zip_path(file_id))
     log.debug(f"ZIP file created: {zip_path(file_id)}")
     return zip_path(file_id)
 
+def _folder_entries(base_dir, folder):
+    """Archive entries for every file under `base_dir/folder`, named relative to `base_dir`."""
+    entries = []
+    for root, _, files in os.walk(os.path.join(base_dir, folder)):
+        for file in sorted(files):
+            file_path = os.path.join(root, file)
+            entries.append(entry_for(os.path.relpath(file_path, base_dir), file_path))
+    return entries
+
+def _manifest_entries(manifest, txt_files=False):
+    """In-memory archive entries for the alt-text manifest (and optional per-image .txt files)."""
+    csv_buffer = io.StringIO()
+    writer = csv.DictWriter(csv_buffer, fieldnames=["index", "media_name", "image_name", "size", "alt_text", "status"])
+    writer.writeheader()
+    writer.writerows(manifest)
+
+    entries = [
+        bytes_entry("alt_texts.json", json.dumps(manifest, indent=2, ensure_ascii=False).encode("utf-8")),
+        bytes_entry("alt_texts.csv", csv_buffer.getvalue().encode("utf-8")),
+    ]
+    if txt_files:
+        for row in manifest:
+            if row["alt_text"] is not None and row["image_name"]:
+                txt_name = f"alt_texts/{os.path.splitext(row['image_name'])[0]}.txt"
+                entries.append(bytes_entry(txt_name, row["alt_text"].encode("utf-8")))
+    return entries
+
+async def publish_results(file_id, manifest, txt_files=False, trace=None, trace_file=False):
+    """Index a finished job's results; with `trace_file`, the job's trace so
+    far goes into the archive as trace.json."""
+    trace = trace or JobTrace(file_id)
+    with ZIP_SECONDS.time(), trace.span("zip") as span:
+        extra = [bytes_entry("trace.json", json.dumps(trace.to_dict(), indent=2).encode("utf-8"))] if trace_file else []
+        index = await asyncio.to_thread(_publish_results_sync, file_id, manifest, txt_files, extra)
+        span.update(entries=len(index["entries"]), archive_bytes=archive_size(index["entries"]))
+    return index
+
+def _publish_results_sync(file_id, manifest, txt_files=False, extra_entries=()):
+    """Move a finished job's images into RESULTS_DIR and index the archive.
+
+    No ZIP is written: the download endpoint streams it from the index, with
+    images read from disk and the (already deflated) manifest kept in the index.
+    """
+    target = result_dir(file_id)
+    os.makedirs(target, exist_ok=True)
+    os.replace(IMAGE_DIR(file_id), os.path.join(target, "compressed_images"))
+
+    entries = _folder_entries(target, "compressed_images")
+    for entry in entries:
+        entry["path"] = os.path.relpath(entry["path"], target)
+    entries += _manifest_entries(manifest, txt_files)
+    entries += extra_entries
+
+    index = {
+        "filename": os.path.basename(zip_path(file_id)),
+        "timestamp": time.time(),
+        "entries": entries,
+    }
+    index_file = os.path.join(target, "archive.json")
+    with open(index_file + ".tmp", "w") as f:
+        json.dump(index, f)
+    os.replace(index_file + ".tmp", index_file)  # Readers never see a partial index
+    return index
+
+def load_archive_index(file_id):
+    """Read a published result's archive index, or None if it isn't ready."""
+    target = result_dir(file_id)
+    try:
+        with open(os.path.join(target, "archive.json")) as f:
+            index = json.load(f)
+    except FileNotFoundError:
+        return None
+    for entry in index["entries"]:
+        if "path" in entry:
+            entry["path"] = os.path.join(target, entry["path"])
+    index["size"] = archive_size(index["entries"])
+    # The archive bytes are fully determined by the entries and timestamp
+    fingerprint = json.dumps([index["timestamp"]] + [(e["name"], e["crc"], e["size"]) for e in index["entries"]])
+    index["etag"] = '"' + hashlib.sha1(fingerprint.encode("utf-8")).hexdigest() + '"'
+    return index
+
 async def clean_dir(dir):
     try:
         if os.path.exists(dir):
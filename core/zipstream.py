@@ -0,0 +1,150 @@
+import zlib
+import time
+import base64
+import struct
+
+# Minimal ZIP writer that streams an archive from a precomputed entry list.
+#
+# Every entry carries its CRC and sizes up front, so local headers never need
+# data descriptors and the total archive size is known before the first byte
+# is sent. Media that is already compressed (JPEG/GIF) is STORED and read
+# straight from disk; small text entries are deflated once, in memory, when
+# the entry is created.
+
+STORED = 0
+DEFLATED = 8
+CHUNK_SIZE = 64 * 1024
+
+# Formats that don't shrink under deflate
+STORED_EXTENSIONS = (".jpg", ".jpeg", ".gif", ".png", ".webp")
+
+_LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+_CENTRAL_HEADER = struct.Struct("<4s4B4HL2L5H2L")
+_END_RECORD = struct.Struct("<4s4H2LH")
+_UTF8_FLAG = 0x800
+_MAX_SIZE = 0xFFFFFFFF  # No ZIP64 support; results are far below 4 GB
+
+
+def file_entry(arcname, path):
+    """Entry for a file on disk, STORED. Reads the file once to compute its CRC."""
+    crc = 0
+    size = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+    return {"name": arcname, "path": path, "method": STORED, "crc": crc,
+            "size": size, "compressed_size": size}
+
+
+def bytes_entry(arcname, data, compress=True):
+    """Entry for in-memory data, deflated unless `compress` is False or
+    deflating wouldn't make it smaller.
+
+    The payload is kept base64-encoded so entry lists can be saved as JSON.
+    """
+    payload = data
+    if compress:
+        deflater = zlib.compressobj(6, zlib.DEFLATED, -15)
+        payload = deflater.compress(data) + deflater.flush()
+        if len(payload) >= len(data):
+            payload = data
+            compress = False
+    return {"name": arcname, "data": base64.b64encode(payload).decode("ascii"),
+            "method": DEFLATED if compress else STORED, "crc": zlib.crc32(data),
+            "size": len(data), "compressed_size": len(payload)}
+
+
+def entry_for(arcname, path):
+    """STORED file entry for media, deflated in-memory entry for everything else."""
+    if arcname.lower().endswith(STORED_EXTENSIONS):
+        return file_entry(arcname, path)
+    with open(path, "rb") as f:
+        return bytes_entry(arcname, f.read())
+
+
+def archive_size(entries):
+    """Exact byte length of the archive `iter_archive` will produce."""
+    size = _END_RECORD.size
+    for entry in entries:
+        name_len = len(entry["name"].encode("utf-8"))
+        size += _LOCAL_HEADER.size + name_len + entry["compressed_size"]
+        size += _CENTRAL_HEADER.size + name_len
+    if size > _MAX_SIZE or len(entries) > 0xFFFF:
+        raise ValueError("Archive too large for a non-ZIP64 ZIP file")
+    return size
+
+
+def _dos_time(timestamp):
+    t = time.localtime(timestamp)
+    dos_date = (max(t.tm_year, 1980) - 1980) << 9 | t.tm_mon << 5 | t.tm_mday
+    dos_time = t.tm_hour << 11 | t.tm_min << 5 | t.tm_sec // 2
+    return dos_time, dos_date
+
+
+def _segments(entries, timestamp):
+    """Yield the archive as (length, bytes) or (length, path) pieces, in order."""
+    dos_time, dos_date = _dos_time(timestamp)
+    central = []
+    offset = 0
+    for entry in entries:
+        name = entry["name"].encode("utf-8")
+        header = _LOCAL_HEADER.pack(
+            b"PK\x03\x04", 20, 0, _UTF8_FLAG, entry["method"], dos_time, dos_date,
+            entry["crc"], entry["compressed_size"], entry["size"], len(name), 0,
+        ) + name
+        yield len(header), header
+        if "path" in entry:
+            yield entry["compressed_size"], entry["path"]
+        else:
+            yield entry["compressed_size"], base64.b64decode(entry["data"])
+
+        central.append(_CENTRAL_HEADER.pack(
+            b"PK\x01\x02", 20, 3, 20, 0, _UTF8_FLAG, entry["method"], dos_time, dos_date,
+            entry["crc"], entry["compressed_size"], entry["size"], len(name), 0, 0, 0, 0,
+            0o644 << 16, offset,
+        ) + name)
+        offset += len(header) + entry["compressed_size"]
+
+    directory = b"".join(central)
+    yield len(directory), directory
+    end = _END_RECORD.pack(b"PK\x05\x06", 0, 0, len(entries), len(entries), len(directory), offset, 0)
+    yield len(end), end
+
+
+def iter_archive(entries, timestamp, start=0, end=None):
+    """Generate the ZIP archive in chunks without building it in memory or on disk.
+
+    `start`/`end` select a byte range (end exclusive) so interrupted
+    downloads can resume; file pieces outside the range are never read.
+    """
+    position = 0
+    for length, piece in _segments(entries, timestamp):
+        piece_start = position
+        position += length
+        if position <= start:
+            continue
+        if end is not None and piece_start >= end:
+            break
+        lo = max(start - piece_start, 0)
+        hi = length if end is None else min(end - piece_start, length)
+        if isinstance(piece, bytes):
+            yield piece[lo:hi]
+            continue
+        with open(piece, "rb") as f:
+            f.seek(lo)
+            remaining = hi - lo
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise IOError(f"{piece} changed size while streaming")
+                remaining -= len(chunk)
+                yield chunk
+
+
+def write_archive(entries, timestamp, output_path):
+    """Write the archive to disk, for callers that need a real file."""
+    with open(output_path, "wb") as f:
+        for chunk in iter_archive(entries, timestamp):
+            f.write(chunk)
+    return output_path
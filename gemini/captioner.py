@@ -0,0 +1,144 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from dotenv import load_dotenv
+from typing_extensions import TypedDict, List
+from prometheus_client import Histogram
+from usage import usage_log
+
+# The Gemini alt-text logic on its own, working on in-memory image bytes.
+# Served over HTTP by gemini.py, and importable by the core service to
+# caption in-process when both run on the same host.
+
+log = logging.getLogger("gemini")
+
+SLOW_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+GEMINI_CALL_SECONDS = Histogram(
+    "gemini_call_seconds", "Latency of one Gemini generate_content call", ["outcome"], buckets=SLOW_BUCKETS)
+
+PROMPT = ("Generate a one-line alt text for each image. Return a list, one alt text per line. Dont say anything "
+          "like 'here are the alt texts' or any other generated text from your end. DONT RETURN ANYTHING ELSE "
+          "BUT THE ALT TEXTS.")
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Access API Key
+api_key = os.getenv("API_KEY")
+
+
+class AltTexts(TypedDict):
+    texts: List[str]
+
+
+class CaptionError(str):
+    """The alt text of an image whose model call failed: "Error: <exception>".
+
+    Serialized like any other alt text, as clients of the HTTP service have
+    always received it; callers can tell it apart with isinstance().
+    """
+
+def add_to_database(alt_texts: AltTexts):
+    pass
+
+
+MODEL_NAME = "gemini-2.5-flash-lite"
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    """The Gemini model, configured on first use: importing the SDK takes seconds,
+    so it stays out of the import of this module."""
+    global _model
+    with _model_lock:
+        if _model is None:
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            _model = genai.GenerativeModel(model_name=MODEL_NAME, tools=[add_to_database])
+    return _model
+
+
+def warm_up():
+    """Load the SDK and build the model now instead of in the first request. Blocking."""
+    started = time.perf_counter()
+    try:
+        get_model()
+    except Exception as e:
+        log.warning(f"Warm-up failed, the model will load on first use: {e}")
+        return
+    log.info(f"Gemini model ready in {time.perf_counter() - started:.2f}s")
+
+
+def _generate(image_data):
+    """One blocking generate_content call for a batch of inline images."""
+    from google.generativeai.types import HarmCategory, HarmBlockThreshold
+    from google.api_core import retry
+    return get_model().generate_content(
+        contents=[
+            {"role": "user", "parts": [{"text": PROMPT}] + image_data}
+        ],
+        request_options={"timeout": 1000, 'retry': retry.Retry()},
+        safety_settings={
+            HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+            HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+        },
+        tool_config={'function_calling_config': 'ANY'}
+    )
+
+
+async def caption_images(images, batch_size=8):
+    """Caption (name, bytes) images in batches, returning alt texts by name.
+
+    A failed batch gives its images a CaptionError alt text instead of raising.
+    """
+    alt_texts = {}
+    async for batch_texts in iter_caption_batches(images, batch_size):
+        alt_texts.update(batch_texts)
+    return alt_texts
+
+
+async def iter_caption_batches(images, batch_size=8):
+    """Like `caption_images`, but yields each batch's alt texts as soon as its model call returns."""
+    for i in range(0, len(images), batch_size):
+        batch = images[i:i + batch_size]
+        alt_texts = {}
+
+        try:
+            log.info(f"🖼️ Processing batch: {batch[0][0]}...")
+
+            image_data = [{"inline_data": {"mime_type": "image/jpeg", "data": img_data}} for _, img_data in batch]
+
+            payload_bytes = sum(len(img_data) for _, img_data in batch)
+
+            # Run Gemini API call in a thread pool to not block the event loop
+            call_started = time.perf_counter()
+            try:
+                response = await asyncio.to_thread(_generate, image_data)
+            except Exception as e:
+                latency = time.perf_counter() - call_started
+                GEMINI_CALL_SECONDS.labels("error").observe(latency)
+                await asyncio.to_thread(usage_log.record, MODEL_NAME, len(batch), payload_bytes, latency,
+                                        error=str(e))
+                raise
+            latency = time.perf_counter() - call_started
+            GEMINI_CALL_SECONDS.labels("ok").observe(latency)
+            # The usage log is a file append, so it stays off the event loop too
+            await asyncio.to_thread(usage_log.record, MODEL_NAME, len(batch), payload_bytes, latency, response)
+
+            fc = response.candidates[0].content.parts[0].function_call
+            alt_text_list = type(fc).to_dict(fc)["args"]["alt_texts"]["texts"]
+
+            for (name, _), alt_text in zip(batch, alt_text_list):
+                alt_texts[name] = alt_text
+
+            log.info(f"✅ Batch processed: {alt_text_list[0]}...")
+
+        except Exception as e:
+            log.error(f"Error processing batch: {e}")
+            for name, _ in batch:
+                alt_texts[name] = CaptionError(f"Error: {str(e)}")
+
+        yield alt_texts
@@ -1,16 +1,16 @@
 from fastapi import FastAPI, UploadFile, File
-from fastapi.responses import JSONResponse
-import os
-import google.generativeai as genai
-from google.generativeai.types import HarmCategory, HarmBlockThreshold
-from dotenv import load_dotenv
-from google.api_core import retry
-from typing_extensions import TypedDict, List
-import shutil
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from typing_extensions import List
+import json
 import logging
 import colorlog
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import Histogram, Gauge, CONTENT_TYPE_LATEST, generate_latest
+from captioner import caption_images, iter_caption_batches, warm_up, CaptionError, SLOW_BUCKETS
+from usage import usage_log
 
 formatter = colorlog.ColoredFormatter(
     "%(log_color)s%(levelname)s:%(reset)s %(message)s",
@@ -29,9 +29,45 @@ log = logging.getLogger()
 log.addHandler(handler)
 log.setLevel(logging.DEBUG)
 
-os.makedirs("compressed_images", exist_ok=True)
+# Prometheus metrics, served by GET /metrics (gemini_call_seconds lives in captioner.py)
+REQUEST_SECONDS = Histogram(
+    "gemini_request_seconds", "Handling one /generate-alt-texts request", buckets=SLOW_BUCKETS)
+REQUESTS_IN_FLIGHT = Gauge("gemini_requests_in_flight", "Alt-text requests being handled")
+THREAD_POOL_SIZE = Gauge("gemini_thread_pool_size", "Threads available for blocking Gemini calls")
+THREAD_POOL_BUSY = Gauge("gemini_thread_pool_busy", "Threads currently running a blocking call")
+THREAD_POOL_QUEUED = Gauge("gemini_thread_pool_queued", "Blocking calls waiting for a free thread")
 
-app = FastAPI()
+
+class InstrumentedThreadPool(ThreadPoolExecutor):
+    """Default executor for `asyncio.to_thread` that reports how busy it is."""
+
+    def __init__(self, max_workers=None, **kwargs):
+        super().__init__(max_workers, **kwargs)
+        THREAD_POOL_SIZE.set(self._max_workers)
+
+    def submit(self, fn, /, *args, **kwargs):
+        THREAD_POOL_QUEUED.inc()
+
+        def run(*args, **kwargs):
+            THREAD_POOL_QUEUED.dec()
+            THREAD_POOL_BUSY.inc()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                THREAD_POOL_BUSY.dec()
+        return super().submit(run, *args, **kwargs)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    asyncio.get_running_loop().set_default_executor(InstrumentedThreadPool())
+    # The Gemini SDK loads lazily; start loading it now in the background,
+    # while uvicorn binds the port, instead of in the first request
+    warm_up_task = asyncio.create_task(asyncio.to_thread(warm_up))
+    yield
+    warm_up_task.cancel()
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -42,85 +78,47 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Load environment variables from .env file
-load_dotenv()
-
-# Access API Key
-api_key = os.getenv("API_KEY")
-
-
-class AltTexts(TypedDict):
-    texts: List[str]
-
-def add_to_database(alt_texts: AltTexts):
-    pass
-
-
-# Configure Gemini API
-genai.configure(api_key=api_key)
-model = genai.GenerativeModel(model_name="gemini-2.5-flash-lite", tools=[add_to_database])
-
-
-async def get_alt_texts(image_paths, batch_size=8):
-    """Processes images in batches and retrieves alt texts asynchronously."""
-    alt_texts = {}
-
-    for i in range(0, len(image_paths), batch_size):
-        batch = image_paths[i:i + batch_size]
-
-        try:
-            log.info(f"🖼️ Processing batch: {batch[0]}...")
-
-            image_data = []
-            for img_path in batch:
-                with open(img_path, "rb") as img_file:
-                    img_data = img_file.read()
-                    image_data.append({"inline_data": {"mime_type": "image/jpeg", "data": img_data}})
-
-            # Run Gemini API call in a thread pool to not block the event loop
-            response = await asyncio.to_thread(
-                model.generate_content,
-                contents=[
-                    {"role": "user", "parts": [
-                        {"text": "Generate a one-line alt text for each image. Return a list, one alt text per line. Dont say anything like 'here are the alt texts' or any other generated text from your end. DONT RETURN ANYTHING ELSE BUT THE ALT TEXTS."}
-                    ] + image_data}
-                ],
-                request_options={"timeout": 1000, 'retry': retry.Retry()},
-                safety_settings={
-                    HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-                    HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-                },
-                tool_config={'function_calling_config': 'ANY'}
-            )
-            
-            fc = response.candidates[0].content.parts[0].function_call
-            alt_text_list = type(fc).to_dict(fc)["args"]["alt_texts"]["texts"]
-
-            for img, alt_text in zip(batch, alt_text_list):
-                alt_texts[img.split('/')[-1]] = alt_text
-
-            log.info(f"✅ Batch processed: {alt_text_list[0]}...")
-
-        except Exception as e:
-            log.error(f"Error processing batch: {e}")
-            for img_path in batch:
-                alt_texts[img_path.split("/")[-1]] = f"Error: {str(e)}"
-
-    return alt_texts
-
 @app.get("/wakeup")
 async def wakeup():
     return JSONResponse(content={"status": "awake"})
 
-@app.post("/generate-alt-texts")
-async def generate_alt_texts(files: List[UploadFile] = File(...)):
-    # Save files asynchronously
-    for file in files:
-        file_content = await file.read()
-        with open(f"compressed_images/{file.filename}", "wb") as f:
-            f.write(file_content)
+@app.get("/metrics")
+async def get_metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
-    image_paths = [f"compressed_images/{file.filename}" for file in files]
-    alt_texts = await get_alt_texts(image_paths)
+@app.get("/usage")
+async def get_usage():
+    """Token usage and latency of Gemini calls since startup, overall and by images per call."""
+    return JSONResponse(content=usage_log.summary())
 
-    return JSONResponse(content=alt_texts)
\ No newline at end of file
+@app.post("/generate-alt-texts")
+async def generate_alt_texts(files: List[UploadFile] = File(...), stream: bool = False):
+    """Alt texts for the uploaded images, keyed by filename.
+
+    With `stream=true` the response is NDJSON instead: one
+    {"name": ..., "alt_text": ...} line per image, sent as each internal
+    batch completes, so callers can use the first captions while later
+    batches are still with the model. Images whose model call failed also
+    carry "error": true.
+    """
+    if not stream:
+        with REQUEST_SECONDS.time(), REQUESTS_IN_FLIGHT.track_inprogress():
+            # Images stay in memory; nothing is written to disk
+            images = [(file.filename, await file.read()) for file in files]
+            alt_texts = await caption_images(images)
+
+        return JSONResponse(content=alt_texts)
+
+    images = [(file.filename, await file.read()) for file in files]
+
+    async def ndjson():
+        # Timed until the last line is sent, like the plain response
+        with REQUEST_SECONDS.time(), REQUESTS_IN_FLIGHT.track_inprogress():
+            async for batch_texts in iter_caption_batches(images):
+                for name, alt_text in batch_texts.items():
+                    record = {"name": name, "alt_text": alt_text}
+                    if isinstance(alt_text, CaptionError):
+                        record["error"] = True
+                    yield json.dumps(record, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
\ No newline at end of file
@@ -0,0 +1,101 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from prometheus_client import Counter
+
+# Per-call accounting of Gemini token usage and latency. Every call is
+# appended as one JSON line to USAGE_LOG_PATH for offline analysis of batch
+# size and downscale settings; running aggregates are served by GET /usage.
+USAGE_LOG_PATH = os.getenv("USAGE_LOG_PATH", "usage.jsonl")
+# Calls kept in memory for latency percentiles
+USAGE_WINDOW = int(os.getenv("USAGE_WINDOW", 1000))
+
+GEMINI_TOKENS = Counter("gemini_tokens", "Tokens used by Gemini calls", ["kind"])
+
+
+def _usage_counts(response):
+    """Prompt and output token counts from a response's usage_metadata (0 if absent)."""
+    metadata = getattr(response, "usage_metadata", None)
+    return (getattr(metadata, "prompt_token_count", 0) or 0,
+            getattr(metadata, "candidates_token_count", 0) or 0)
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 3)
+
+
+class UsageLog:
+    """Records one entry per model call and keeps totals overall and by images per call."""
+
+    def __init__(self, path=USAGE_LOG_PATH, window=USAGE_WINDOW):
+        self.path = path
+        self.lock = threading.Lock()
+        self.totals = self._empty()
+        self.by_images = {}  # images per call -> totals
+        self.recent = deque(maxlen=window)  # latencies of recent successful calls
+
+    @staticmethod
+    def _empty():
+        return {"calls": 0, "errors": 0, "images": 0, "captioned_images": 0, "payload_bytes": 0,
+                "input_tokens": 0, "output_tokens": 0, "latency_seconds": 0.0}
+
+    def record(self, model, images, payload_bytes, latency, response=None, error=None):
+        input_tokens, output_tokens = _usage_counts(response)
+        entry = {
+            "time": time.time(),
+            "model": model,
+            "images": images,
+            "payload_bytes": payload_bytes,
+            "latency_seconds": round(latency, 4),
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "error": error,
+        }
+        GEMINI_TOKENS.labels("input").inc(input_tokens)
+        GEMINI_TOKENS.labels("output").inc(output_tokens)
+        with self.lock:
+            for totals in (self.totals, self.by_images.setdefault(images, self._empty())):
+                totals["calls"] += 1
+                totals["errors"] += error is not None
+                totals["images"] += images
+                totals["captioned_images"] += images if error is None else 0
+                totals["payload_bytes"] += payload_bytes
+                totals["input_tokens"] += input_tokens
+                totals["output_tokens"] += output_tokens
+                totals["latency_seconds"] += latency
+            if error is None:
+                self.recent.append(latency)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        return entry
+
+    @staticmethod
+    def _averages(totals):
+        # Failed calls report no tokens, so per-image token costs only count captioned images
+        calls, images, captioned = totals["calls"], totals["images"], totals["captioned_images"]
+        return dict(totals,
+                    latency_seconds=round(totals["latency_seconds"], 3),
+                    mean_latency_seconds=round(totals["latency_seconds"] / calls, 3) if calls else None,
+                    input_tokens_per_image=round(totals["input_tokens"] / captioned, 1) if captioned else None,
+                    output_tokens_per_image=round(totals["output_tokens"] / captioned, 1) if captioned else None,
+                    payload_bytes_per_image=round(totals["payload_bytes"] / images) if images else None)
+
+    def summary(self):
+        with self.lock:
+            recent = list(self.recent)
+            return {
+                **self._averages(self.totals),
+                "p50_latency_seconds": _percentile(recent, 0.5),
+                "p95_latency_seconds": _percentile(recent, 0.95),
+                "by_images_per_call": {str(images): self._averages(totals)
+                                       for images, totals in sorted(self.by_images.items())},
+            }
+
+
+usage_log = UsageLog()
@@ -0,0 +1,53 @@
+import os
+import sys
+import pytest
+
+# Tests import the core and gemini services' modules directly
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORE = os.path.join(ROOT, "core")
+GEMINI = os.path.join(ROOT, "gemini")
+if CORE not in sys.path:
+    sys.path.insert(0, CORE)
+if GEMINI not in sys.path:
+    sys.path.append(GEMINI)
+
+# store reads JOB_STORE once, on first import, and any test module may be first
+os.environ.setdefault("JOB_STORE", "memory")
+
+
+@pytest.fixture(scope="module")
+def core_dir(tmp_path_factory):
+    """Run the module's tests from the scratch directory the core service works in.
+
+    utils creates its folders in the current directory on import and keeps
+    using paths relative to it, so every test module works from the same one.
+    """
+    path = tmp_path_factory.getbasetemp() / "core"
+    path.mkdir(exist_ok=True)
+    with pytest.MonkeyPatch.context() as mp:
+        mp.chdir(path)
+        yield path
+
+
+@pytest.fixture(scope="module")
+def utils(core_dir):
+    import utils
+    return utils
+
+
+@pytest.fixture(scope="module")
+def store(core_dir):
+    import store
+    return store
+
+
+@pytest.fixture(scope="module")
+def main(core_dir):
+    import main
+    return main
+
+
+@pytest.fixture(scope="module")
+def janitor(core_dir):
+    import janitor
+    return janitor
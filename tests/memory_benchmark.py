@@ -0,0 +1,114 @@
+"""Peak-memory benchmark for the core service's image pipeline.
+
+    python tests/memory_benchmark.py [scenario ...] [--tracemalloc]
+
+Each scenario is a synthetic DOCX run through extraction and compression
+(`iter_images_from_docx`) in a fresh interpreter, from an empty scratch
+directory. Reports how far the process RSS rose above where the job started,
+overall and per stage; tests/test_memory.py holds it to a ceiling.
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+from synthetic_docx import make_image, build_docx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORE = os.path.join(ROOT, "core")
+
+# scenario -> images to put in the document, as (extension, bytes)
+SCENARIOS = {
+    "photo_40mp": lambda: [("jpeg", make_image((7300, 5480)))],
+    "gif_300_frames": lambda: [("gif", make_image((480, 360), "GIF", frames=300))],
+    "500_images": lambda: [("png", make_image((320, 240), "PNG", seed=i)) if i % 5 == 0 else
+                           ("jpeg", make_image((320, 240), seed=i)) for i in range(500)],
+}
+
+# Ceilings for the job's RSS growth, in MB
+CEILINGS_MB = {
+    "photo_40mp": float(os.getenv("MEMORY_CEILING_PHOTO_MB", 450)),
+    "gif_300_frames": float(os.getenv("MEMORY_CEILING_GIF_MB", 150)),
+    "500_images": float(os.getenv("MEMORY_CEILING_IMAGES_MB", 64)),
+}
+
+MB = 1024 * 1024
+
+
+def run_job(path):
+    """In the child: process the DOCX at `path` and print its memory figures as JSON."""
+    import asyncio
+    from memtrack import tracker
+    from jobtrace import JobTrace
+    from utils import iter_images_from_docx
+
+    async def job():
+        trace = JobTrace("benchmark")
+        images = ok = 0
+        async for image in iter_images_from_docx(path, "benchmark", trace=trace):
+            images += 1
+            ok += image["path"] is not None
+        trace.finish()
+        return trace.to_dict(), images, ok
+
+    tracker.start()
+    trace, images, ok = asyncio.run(job())
+    stages = {}
+    for span in trace["spans"]:
+        stages[span["name"]] = max(stages.get(span["name"], 0), span["rss_growth_bytes"])
+    memory = trace["memory"]
+    print(json.dumps({
+        "images": images,
+        "ok": ok,
+        "seconds": round(trace["duration"], 2),
+        "peak_rss_mb": round(memory["peak_rss_bytes"] / MB, 1),
+        "rss_growth_mb": round(memory["rss_growth_bytes"] / MB, 1),
+        "traced_growth_mb": round(memory["traced_growth_bytes"] / MB, 1) if "traced_growth_bytes" in memory else None,
+        "stage_growth_mb": {name: round(growth / MB, 1) for name, growth in stages.items()},
+    }))
+
+
+def measure(scenario, tracemalloc=False):
+    """Memory figures for one scenario, processed in a fresh interpreter."""
+    env = dict(os.environ, PYTHONPATH=CORE, MEMORY_TRACKING="tracemalloc" if tracemalloc else "rss",
+               LOG_LEVEL="WARNING", PYTHONDONTWRITEBYTECODE="1")
+    with tempfile.TemporaryDirectory() as scratch:
+        path = os.path.join(scratch, f"{scenario}.docx")
+        build_docx(SCENARIOS[scenario](), path)
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), "--job", path],
+                                cwd=scratch, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "job failed")
+    return dict(json.loads(result.stdout.strip().splitlines()[-1]), scenario=scenario)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("scenarios", nargs="*", help=f"{', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--tracemalloc", action="store_true", help="also trace Python allocations (slower)")
+    parser.add_argument("--job", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.job:
+        run_job(args.job)
+        return 0
+    for scenario in args.scenarios:
+        if scenario not in SCENARIOS:
+            parser.error(f"unknown scenario {scenario!r}, choose from {', '.join(SCENARIOS)}")
+
+    over = False
+    for scenario in args.scenarios or list(SCENARIOS):
+        result = measure(scenario, args.tracemalloc)
+        ceiling = CEILINGS_MB[scenario]
+        over |= result["rss_growth_mb"] > ceiling
+        print(f"{scenario}: +{result['rss_growth_mb']} MB RSS (ceiling {ceiling:.0f} MB), "
+              f"peak {result['peak_rss_mb']} MB, {result['ok']}/{result['images']} images in {result['seconds']}s")
+        if result["traced_growth_mb"] is not None:
+            print(f"  +{result['traced_growth_mb']} MB traced by tracemalloc")
+        for stage, growth in sorted(result["stage_growth_mb"].items()):
+            print(f"  {stage:16} +{growth} MB")
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""Cold-start benchmark for the core and gemini services.
+
+    python tests/startup_benchmark.py [core|gemini ...] [--runs 5]
+
+Each run imports a service's app module in a fresh interpreter under
+`python -X importtime`, from an empty scratch directory so nothing is
+written into the repo. Reports the median total import time and the
+slowest top-level imports; tests/test_startup.py holds it to a budget.
+"""
+import os
+import sys
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# service -> (directory on sys.path, module that builds the app)
+SERVICES = {
+    "core": (os.path.join(ROOT, "core"), "main"),
+    "gemini": (os.path.join(ROOT, "gemini"), "gemini"),
+}
+
+# Budgets for the median total import time, in milliseconds
+BUDGETS_MS = {
+    "core": float(os.getenv("STARTUP_BUDGET_CORE_MS", 500)),
+    "gemini": float(os.getenv("STARTUP_BUDGET_GEMINI_MS", 500)),
+}
+
+# Modules that must load lazily (on first use or in the warm-up), not on import
+LAZY_MODULES = {
+    "core": {"numpy", "httpx", "google.generativeai", "captioner"},
+    "gemini": {"google.generativeai", "google.api_core", "httpx", "numpy"},
+}
+
+
+def parse_importtime(stderr):
+    """{module: (self_us, cumulative_us, depth)} from `-X importtime` output."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return modules
+
+
+def run_once(service):
+    path, module = SERVICES[service]
+    env = dict(os.environ, PYTHONPATH=path, JOB_STORE="memory", PYTHONDONTWRITEBYTECODE="1")
+    with tempfile.TemporaryDirectory() as scratch:
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                                cwd=scratch, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "import failed")
+    return parse_importtime(result.stderr)
+
+
+def measure(service, runs=5):
+    """Median startup figures for `service` over `runs` cold interpreters."""
+    samples = [run_once(service) for _ in range(runs)]
+    module = SERVICES[service][1]
+    # The app module's cumulative time covers everything it pulls in
+    totals = [sample[module][1] / 1000 for sample in samples]
+    last = samples[-1]
+    slowest = sorted(((cumulative / 1000, name) for name, (_, cumulative, depth) in last.items()
+                      if depth == 1), reverse=True)
+    return {
+        "service": service,
+        "runs": runs,
+        "total_ms": round(statistics.median(totals), 1),
+        "min_ms": round(min(totals), 1),
+        "slowest": [(name, round(ms, 1)) for ms, name in slowest[:10]],
+        "modules": set(last),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("services", nargs="*", help="core and/or gemini (default: both)")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+    for service in args.services:
+        if service not in SERVICES:
+            parser.error(f"unknown service {service!r}, choose from {', '.join(SERVICES)}")
+
+    over = False
+    for service in args.services or list(SERVICES):
+        result = measure(service, args.runs)
+        budget = BUDGETS_MS[service]
+        over |= result["total_ms"] > budget
+        print(f"{service}: {result['total_ms']} ms median, {result['min_ms']} ms best "
+              f"over {result['runs']} runs (budget {budget:.0f} ms)")
+        for name, ms in result["slowest"]:
+            print(f"  {ms:8.1f} ms  {name}")
+        eager = sorted(result["modules"] & LAZY_MODULES[service])
+        if eager:
+            print(f"  imported eagerly: {', '.join(eager)}")
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""Synthetic DOCX files for tests and benchmarks.
+
+    python tests/synthetic_docx.py out.docx --images 50 --size 1600x1200 \
+        --formats jpeg,png,gif --duplicates 0.2 --gif-frames 30
+
+Images are generated with Pillow (gradients plus noise, so they compress
+like photos rather than flat colour) and placed in the body of a minimal
+document, one per paragraph, in order.
+"""
+import io
+import sys
+import random
+import zipfile
+import argparse
+from PIL import Image
+
+FORMATS = {"jpeg": "JPEG", "png": "PNG", "gif": "GIF"}
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+R_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+A_NS = "http://schemas.openxmlformats.org/drawingml/2006/main"
+PIC_NS = "http://schemas.openxmlformats.org/drawingml/2006/picture"
+WP_NS = "http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing"
+IMAGE_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/image"
+
+CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Default Extension="jpeg" ContentType="image/jpeg"/>
+<Default Extension="png" ContentType="image/png"/>
+<Default Extension="gif" ContentType="image/gif"/>
+<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>
+</Types>"""
+
+PACKAGE_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>
+</Relationships>"""
+
+
+def make_image(size=(640, 480), fmt="JPEG", frames=1, seed=0):
+    """Encoded bytes of a photo-like test image. `frames` > 1 makes an animated GIF."""
+    gradient = Image.linear_gradient("L").resize(size)
+    radial = Image.radial_gradient("L").resize(size)
+    noise = Image.effect_noise(size, 24 + seed % 16)
+    image = Image.merge("RGB", (gradient, radial, noise))
+    out = io.BytesIO()
+    if fmt == "GIF" and frames > 1:
+        # Each frame turns the picture a little, so no two frames are alike
+        image = image.convert("P", palette=Image.ADAPTIVE)
+        sequence = [image.rotate(360 * i / frames) for i in range(frames)]
+        sequence[0].save(out, "GIF", save_all=True, append_images=sequence[1:], duration=40, loop=0)
+    elif fmt == "JPEG":
+        image.save(out, "JPEG", quality=90)
+    else:
+        image.save(out, fmt)
+    return out.getvalue()
+
+
+def _drawing(index, rid):
+    return (f'<w:p><w:r><w:drawing><wp:inline><wp:docPr id="{index}" name="Picture {index}"/>'
+            f'<a:graphic><a:graphicData uri="{PIC_NS}"><pic:pic><pic:blipFill>'
+            f'<a:blip r:embed="{rid}"/></pic:blipFill></pic:pic></a:graphicData></a:graphic>'
+            f'</wp:inline></w:drawing></w:r></w:p>')
+
+
+def build_docx(images, path=None):
+    """A DOCX showing `images`, a list of (extension, bytes), in order.
+
+    Entries with identical bytes share one media file, as in documents where
+    Word reuses a picture. Writes to `path` if given; returns the bytes otherwise.
+    """
+    media = {}  # bytes -> media path
+    rels = []
+    body = []
+    for index, (extension, data) in enumerate(images, 1):
+        if data not in media:
+            media[data] = f"media/image{len(media) + 1}.{extension}"
+        rid = f"rId{index + 100}"
+        rels.append(f'<Relationship Id="{rid}" Type="{IMAGE_REL}" Target="{media[data]}"/>')
+        body.append(_drawing(index, rid))
+
+    document = (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                f'<w:document xmlns:w="{W_NS}" xmlns:r="{R_NS}" xmlns:a="{A_NS}" xmlns:pic="{PIC_NS}" '
+                f'xmlns:wp="{WP_NS}"><w:body>{"".join(body)}</w:body></w:document>')
+    document_rels = (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                     f'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                     f'{"".join(rels)}</Relationships>')
+
+    target = path or io.BytesIO()
+    with zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr("[Content_Types].xml", CONTENT_TYPES)
+        docx.writestr("_rels/.rels", PACKAGE_RELS)
+        docx.writestr("word/document.xml", document)
+        docx.writestr("word/_rels/document.xml.rels", document_rels)
+        for data, name in media.items():
+            # Images are already compressed, so store them like Word does
+            docx.writestr(f"word/{name}", data, zipfile.ZIP_STORED)
+    return None if path else target.getvalue()
+
+
+def synthetic_images(count, sizes=((640, 480),), formats=("jpeg",), duplicates=0.0, gif_frames=1, seed=0):
+    """`count` images as (extension, bytes) for `build_docx`.
+
+    Sizes and formats are used in turn. A `duplicates` fraction of the
+    images repeat an earlier picture, which the document then references
+    twice. GIFs get `gif_frames` frames.
+    """
+    rng = random.Random(seed)
+    images = []
+    for i in range(count):
+        if images and rng.random() < duplicates:
+            images.append(rng.choice(images))
+            continue
+        extension = formats[i % len(formats)]
+        frames = gif_frames if extension == "gif" else 1
+        images.append((extension, make_image(sizes[i % len(sizes)], FORMATS[extension], frames, seed=seed + i)))
+    return images
+
+
+def _size(value):
+    width, _, height = value.lower().partition("x")
+    return int(width), int(height or width)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("output", help="DOCX file to write")
+    parser.add_argument("--images", type=int, default=10)
+    parser.add_argument("--size", type=_size, action="append", help="WIDTHxHEIGHT, repeat to alternate sizes")
+    parser.add_argument("--formats", default="jpeg", help="comma-separated, from " + ", ".join(FORMATS))
+    parser.add_argument("--duplicates", type=float, default=0.0, help="fraction of images that repeat an earlier one")
+    parser.add_argument("--gif-frames", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    formats = [name.strip().lower() for name in args.formats.split(",")]
+    for name in formats:
+        if name not in FORMATS:
+            parser.error(f"unknown format {name!r}, choose from {', '.join(FORMATS)}")
+
+    images = synthetic_images(args.images, args.size or [(640, 480)], formats, args.duplicates,
+                              args.gif_frames, args.seed)
+    build_docx(images, args.output)
+    unique = len({data for _, data in images})
+    print(f"{args.output}: {len(images)} images ({unique} distinct)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+import re
+import sys
+import json
+import asyncio
+import functools
+from types import SimpleNamespace
+import httpx
+import pytest
+import alttext
+from alttext import HttpAltTextBackend, InProcessAltTextBackend, get_alt_text_backend
+
+IMAGES = [(f"image{i}.jpg", b"\xff\xd8 jpeg bytes") for i in range(1, 11)]
+
+
+def collect(backend, images=IMAGES):
+    async def run():
+        return [pair async for pair in backend.stream(images)]
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("name, backend", [("http", HttpAltTextBackend), ("inprocess", InProcessAltTextBackend)])
+def test_backend_is_chosen_by_environment(monkeypatch, name, backend):
+    monkeypatch.setattr(alttext, "ALT_TEXT_BACKEND", name)
+    assert type(get_alt_text_backend()) is backend
+
+
+def test_unknown_backend_is_rejected(monkeypatch):
+    monkeypatch.setattr(alttext, "ALT_TEXT_BACKEND", "grpc")
+    with pytest.raises(ValueError, match="grpc"):
+        get_alt_text_backend()
+
+
+def test_missing_captioner_fails_the_batch(tmp_path, monkeypatch):
+    """A GEMINI_DIR without captioner.py is reported when the first batch is sent, not at startup."""
+    monkeypatch.delitem(sys.modules, "captioner", raising=False)
+    monkeypatch.setattr(sys, "path", [path for path in sys.path if "gemini" not in path])
+    backend = InProcessAltTextBackend(gemini_dir=str(tmp_path))
+    with pytest.raises(ModuleNotFoundError):
+        backend.warm_up()
+    with pytest.raises(ModuleNotFoundError):
+        collect(backend)
+
+
+class FunctionCall:
+    """Stands in for the proto a Gemini function call comes back as."""
+
+    def __init__(self, texts):
+        self.texts = texts
+
+    @staticmethod
+    def to_dict(call):
+        return {"args": {"alt_texts": {"texts": call.texts}}}
+
+
+@pytest.fixture
+def captioner(monkeypatch):
+    """The real gemini captioner, with the model call replaced by `generate(image_data)`."""
+    captioner = InProcessAltTextBackend()._captioner()
+    monkeypatch.setattr(captioner.usage_log, "path", None)
+
+    def use(generate):
+        def _generate(image_data):
+            texts = generate(image_data)
+            part = SimpleNamespace(function_call=FunctionCall(texts))
+            return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))])
+        monkeypatch.setattr(captioner, "_generate", _generate)
+
+    return use
+
+
+def test_inprocess_captions_every_image(captioner):
+    captioner(lambda image_data: [f"Alt {i}" for i in range(len(image_data))])
+    alt_texts = collect(InProcessAltTextBackend())
+    assert [name for name, _ in alt_texts] == [name for name, _ in IMAGES]
+    assert [text for _, text in alt_texts] == [f"Alt {i}" for i in range(8)] + ["Alt 0", "Alt 1"]
+
+
+def test_inprocess_model_error_is_not_an_alt_text(captioner):
+    """A failed model call leaves its images without an alt text instead of failing the batch."""
+    calls = []
+
+    def generate(image_data):
+        calls.append(len(image_data))
+        if len(calls) == 2:
+            raise RuntimeError("429 quota exhausted")
+        return ["A bar chart"] * len(image_data)
+
+    captioner(generate)
+    alt_texts = asyncio.run(InProcessAltTextBackend().generate(IMAGES))
+    assert calls == [8, 2]
+    assert [alt_texts[name] for name, _ in IMAGES] == ["A bar chart"] * 8 + [None, None]
+
+
+class GeminiService:
+    """A fake gemini service behind an httpx mock transport.
+
+    Captions each uploaded image as "Alt <name>". With `streaming` it answers
+    ?stream=true with NDJSON like the real service; without, with one JSON
+    object as services did before streaming. A stream stops just before the
+    record for image `cut_at`, either cleanly or, with `reset`, as a
+    connection dropped mid-body.
+    """
+
+    def __init__(self, streaming=True, cut_at=None, reset=False):
+        self.streaming = streaming
+        self.cut_at = cut_at
+        self.reset = reset
+        self.requests = []
+
+    def __call__(self, request):
+        names = re.findall(rb'filename="([^"]+)"', request.read())
+        names = [name.decode() for name in names]
+        self.requests.append(names)
+        if not (self.streaming and request.url.params.get("stream") == "true"):
+            return httpx.Response(200, json={name: f"Alt {name}" for name in names})
+        return httpx.Response(200, headers={"content-type": "application/x-ndjson"},
+                              content=self._lines(names))
+
+    async def _lines(self, names):
+        for name in names:
+            if name == self.cut_at:
+                if self.reset:
+                    raise httpx.RemoteProtocolError("peer closed connection without sending complete message body")
+                return
+            yield (json.dumps({"name": name, "alt_text": f"Alt {name}"}) + "\n").encode()
+
+    def backend(self):
+        backend = HttpAltTextBackend(url="http://gemini/generate-alt-texts")
+        transport = httpx.MockTransport(self)
+        backend.warm_up = lambda: SimpleNamespace(AsyncClient=functools.partial(httpx.AsyncClient, transport=transport))
+        return backend
+
+
+@pytest.mark.parametrize("streaming", [True, False], ids=["ndjson", "json"])
+def test_http_backend_reads_either_answer(streaming):
+    service = GeminiService(streaming=streaming)
+    assert collect(service.backend()) == [(name, f"Alt {name}") for name, _ in IMAGES]
+
+
+@pytest.mark.parametrize("reset", [False, True], ids=["clean-end", "reset"])
+def test_http_backend_fails_a_cut_stream(reset):
+    service = GeminiService(cut_at="image4.jpg", reset=reset)
+    with pytest.raises(Exception, match="no alt text for 7 of 10" if not reset else "peer closed"):
+        collect(service.backend())
+
+
+@pytest.fixture
+def images(utils, tmp_path, monkeypatch):
+    """Seven compressed images on disk, as iter_images_from_docx yields them."""
+    def make(service):
+        monkeypatch.setattr(utils, "alt_text_backend", service.backend())
+        paths = []
+        for index in range(1, 8):
+            path = tmp_path / f"image{index}.jpg"
+            path.write_bytes(b"\xff\xd8 jpeg bytes")
+            paths.append({"index": index, "media_name": path.name, "path": str(path)})
+
+        async def iterate():
+            for image in paths:
+                yield image
+        return iterate()
+    return make
+
+
+def caption(utils, images, batches):
+    async def run():
+        async for batch in utils.iter_alt_texts(images, "job", batch_size=3):
+            batches.append(batch)
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("streaming", [True, False], ids=["ndjson", "json"])
+def test_iter_alt_texts_captions_every_image(utils, images, streaming):
+    service = GeminiService(streaming=streaming)
+    batches = []
+    caption(utils, images(service), batches)
+    assert [len(names) for names in service.requests] == [3, 3, 1]
+    assert [image["alt_text"] for batch in batches for image in batch] == [f"Alt image{i}.jpg" for i in range(1, 8)]
+
+
+@pytest.mark.parametrize("reset", [False, True], ids=["clean-end", "reset"])
+def test_iter_alt_texts_fails_when_a_stream_is_cut(utils, images, reset):
+    """A batch whose stream stops early fails the job instead of coming back partly uncaptioned."""
+    service = GeminiService(cut_at="image5.jpg", reset=reset)
+    batches = []
+    with pytest.raises(Exception, match="Failed to get alt texts"):
+        caption(utils, images(service), batches)
+    assert all(image["alt_text"] for batch in batches for image in batch)
+    assert [image["index"] for batch in batches for image in batch] == [1, 2, 3]
@@ -0,0 +1,90 @@
+"""Microbenchmarks for the core service's document and image handling.
+
+    python -m pytest tests/test_benchmarks.py --benchmark-autosave
+    python -m pytest tests/test_benchmarks.py --benchmark-compare --benchmark-compare-fail=mean:10%
+
+Inputs come from synthetic_docx, so nothing needs real documents or the
+gemini service. Skipped unless pytest-benchmark is installed.
+"""
+import os
+import uuid
+import shutil
+import asyncio
+import zipfile
+import pytest
+from synthetic_docx import make_image, build_docx, synthetic_images
+
+pytest.importorskip("pytest_benchmark")
+
+@pytest.fixture(scope="module")
+def inputs(tmp_path_factory):
+    return tmp_path_factory.mktemp("inputs")
+
+
+def write(directory, name, data):
+    path = os.path.join(directory, name)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+@pytest.mark.parametrize("count", [50, 500])
+def test_find_images_in_docx(benchmark, utils, inputs, count):
+    # Tiny images: this measures the streaming XML scan of the parts, not the media
+    path = os.path.join(inputs, f"refs_{count}.docx")
+    build_docx(synthetic_images(count, sizes=[(16, 16)], duplicates=0.5), path)
+    with zipfile.ZipFile(path) as docx:
+        media = benchmark(utils.find_images_in_docx, docx)
+    assert len(media) == count
+
+
+def test_extract_images_from_docx(benchmark, utils, inputs):
+    path = os.path.join(inputs, "mixed.docx")
+    # Formats and sizes go in turn, so every GIF is one of the small ones
+    build_docx(synthetic_images(12, sizes=[(1600, 1200), (800, 600), (320, 240)], formats=["jpeg", "png", "gif"],
+                                duplicates=0.2, gif_frames=10), path)
+
+    def extract():
+        file_id = uuid.uuid4().hex
+        try:
+            return asyncio.run(utils.extract_images_from_docx(path, file_id))
+        finally:
+            shutil.rmtree(utils.temp_path(file_id), ignore_errors=True)
+
+    images = benchmark.pedantic(extract, rounds=3, iterations=1)
+    assert len(images) == 12
+
+
+@pytest.mark.parametrize("fmt,size", [("JPEG", (3000, 2000)), ("PNG", (1600, 1200))])
+def test_compress_image(benchmark, utils, inputs, fmt, size):
+    source = write(inputs, f"photo_{size[0]}.{fmt.lower()}", make_image(size, fmt))
+    output = os.path.join(inputs, f"photo_{size[0]}_{fmt.lower()}_out.jpg")
+    stats = {}
+    benchmark(utils.compress_image, source, output, 500, stats)
+    assert os.path.getsize(output) <= 500 * 1024 or stats["quality"] <= 10
+
+
+def test_compress_gif(benchmark, utils, inputs):
+    source = write(inputs, "animation.gif", make_image((320, 240), "GIF", frames=30))
+    output = os.path.join(inputs, "animation_out.gif")
+    benchmark.pedantic(utils.compress_gif, args=(source, output, 500), kwargs={"n_frames": 30},
+                       rounds=3, iterations=1)
+    assert os.path.exists(output)
+
+
+def test_create_zip(benchmark, utils):
+    file_id = uuid.uuid4().hex
+    images = os.path.join(utils.temp_path(file_id), "compressed_images")
+    os.makedirs(images)
+    manifest = []
+    for index, (_, data) in enumerate(synthetic_images(50, sizes=[(800, 600)]), 1):
+        name = f"{index:03d}.jpg"
+        write(images, name, data)
+        manifest.append({"index": index, "media_name": f"image{index}.jpeg", "image_name": name,
+                         "size": len(data), "alt_text": f"Alt text for image {index}"})
+    try:
+        path = benchmark(utils._create_zip_sync, file_id, manifest, True)
+        with zipfile.ZipFile(path) as archive:
+            assert len(archive.namelist()) == 50 + 2 + 50
+    finally:
+        shutil.rmtree(utils.temp_path(file_id), ignore_errors=True)
@@ -0,0 +1,93 @@
+import os
+import json
+import zipfile
+import pytest
+from synthetic_docx import build_docx, synthetic_images
+
+
+@pytest.fixture
+def bulk(utils, monkeypatch):
+    import bulk
+    # A run points utils at its own scratch directory
+    monkeypatch.setattr(utils, "TEMP_DIR", utils.TEMP_DIR)
+    return bulk
+
+
+@pytest.fixture
+def backend(utils, bulk, monkeypatch):
+    """Swaps the alt-text backend for one that captions, or fails, as the test says."""
+    from alttext import AltTextBackend
+
+    class Backend(AltTextBackend):
+        fail = None  # None, "captions" (the model failed) or "batch" (the request failed)
+        calls = 0
+
+        async def stream(self, images):
+            Backend.calls += 1
+            if self.fail == "batch":
+                raise Exception("Gemini service returned error: 503")
+            for name, data in images:
+                yield name, None if self.fail == "captions" else f"A picture of {len(data)} bytes"
+
+    backend = Backend()
+    monkeypatch.setattr(utils, "alt_text_backend", backend)
+    monkeypatch.setattr(bulk, "alt_text_backend", backend)
+    return backend
+
+
+@pytest.fixture
+def sources(tmp_path):
+    source_dir = tmp_path / "in"
+    source_dir.mkdir()
+    build_docx(synthetic_images(3, sizes=[(64, 48)]), str(source_dir / "report.docx"))
+    return str(source_dir)
+
+
+def read_jsonl(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def manifest_rows(output):
+    with zipfile.ZipFile(os.path.join(output, "report.zip")) as archive:
+        return json.loads(archive.read("alt_texts.json"))
+
+
+@pytest.mark.parametrize("fail", ["captions", "batch"])
+def test_failed_captions_are_retried(bulk, backend, sources, tmp_path, fail):
+    output = str(tmp_path / "out")
+    backend.fail = fail
+    assert bulk.main([sources, "-o", output, "-w", "1"]) == 1
+    [entry] = read_jsonl(os.path.join(output, bulk.MANIFEST_FILE))
+    assert entry["status"] == "failed"
+    assert read_jsonl(os.path.join(output, bulk.CACHE_FILE)) == []
+    if fail == "captions":
+        # The ZIP is still written, with every row marked as an error
+        assert [row["status"] for row in manifest_rows(output)] == ["error"] * 3
+        assert all(row["alt_text"] is None for row in manifest_rows(output))
+
+    # Once the service is back, the re-run captions the document instead of reusing anything
+    backend.fail = None
+    assert bulk.main([sources, "-o", output, "-w", "1"]) == 0
+    assert read_jsonl(os.path.join(output, bulk.MANIFEST_FILE))[-1]["status"] == "completed"
+    rows = manifest_rows(output)
+    assert [row["status"] for row in rows] == ["ok"] * 3
+    assert all(row["alt_text"].startswith("A picture of") for row in rows)
+    assert len(read_jsonl(os.path.join(output, bulk.CACHE_FILE))) == 3
+
+
+def test_error_captions_in_old_cache_are_ignored(bulk, backend, sources, tmp_path):
+    output = tmp_path / "out"
+    output.mkdir()
+    assert bulk.main([sources, "-o", str(output), "-w", "1"]) == 0
+    digests = [entry["digest"] for entry in read_jsonl(output / bulk.CACHE_FILE)]
+    # As an earlier version would have left them after an outage
+    with open(output / bulk.CACHE_FILE, "w") as f:
+        for digest in digests:
+            f.write(json.dumps({"digest": digest, "alt_text": "Error: 503 Service Unavailable"}) + "\n")
+    (output / bulk.MANIFEST_FILE).unlink()
+
+    calls = backend.calls
+    assert bulk.main([sources, "-o", str(output), "-w", "1"]) == 0
+    assert backend.calls > calls
+    assert all(row["alt_text"].startswith("A picture of") for row in manifest_rows(str(output)))
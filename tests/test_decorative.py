@@ -0,0 +1,80 @@
+import pytest
+from PIL import Image, ImageDraw
+import decorative
+from decorative import classify_decorative
+
+
+def save(image, tmp_path, name):
+    path = tmp_path / name
+    image.save(path)
+    return str(path)
+
+
+def line_chart():
+    image = Image.new("RGB", (800, 500), "white")
+    draw = ImageDraw.Draw(image)
+    draw.line([(60, 20), (60, 460), (780, 460)], fill="black")
+    points = [(60 + i * 60, 440 - (i * 37 % 300)) for i in range(13)]
+    draw.line(points, fill="black")
+    return image
+
+
+def flowchart():
+    image = Image.new("RGB", (800, 300), "white")
+    draw = ImageDraw.Draw(image)
+    for i, label in enumerate(["Upload", "Caption", "Download"]):
+        left = 40 + i * 260
+        draw.rectangle([left, 100, left + 180, 200], outline="black")
+        draw.text((left + 50, 140), label, fill="black")
+        if i < 2:
+            draw.line([(left + 180, 150), (left + 260, 150)], fill="black")
+    return image
+
+
+def text_on_white():
+    image = Image.new("RGB", (600, 200), "white")
+    draw = ImageDraw.Draw(image)
+    draw.text((20, 90), "Quarterly results exceeded the forecast in every region.", fill="black")
+    return image
+
+
+# Sparse black-on-white images are low-entropy, but they are content
+@pytest.mark.parametrize("make", [line_chart, flowchart, text_on_white])
+def test_line_art_is_captioned(tmp_path, make):
+    assert classify_decorative(save(make(), tmp_path, f"{make.__name__}.png")) is None
+
+
+@pytest.mark.parametrize("make", [line_chart, flowchart, text_on_white])
+def test_entropy_rule_spares_line_art(tmp_path, monkeypatch, make):
+    monkeypatch.setattr(decorative, "DECORATIVE_MAX_ENTROPY", 0.5)
+    assert classify_decorative(save(make(), tmp_path, f"{make.__name__}.png")) is None
+
+
+def test_blank_and_tiny_images_are_decorative(tmp_path):
+    assert classify_decorative(save(Image.new("RGB", (400, 300), "white"), tmp_path, "blank.png")) == "uniform"
+    # A scanned blank page: faint noise, no strokes
+    noisy = Image.merge("RGB", [Image.effect_noise((400, 300), 3).point(lambda v: v + 120)] * 3)
+    assert classify_decorative(save(noisy, tmp_path, "scan.jpg")) == "uniform"
+    assert classify_decorative(save(Image.new("RGB", (600, 4), "gray"), tmp_path, "rule.png")) == "tiny"
+
+
+# At the largest reduction before CONTRAST_SIDE (4x), one-pixel strokes survive
+@pytest.mark.parametrize("make", [line_chart, flowchart, text_on_white])
+def test_line_art_is_captioned_after_reduction(tmp_path, monkeypatch, make):
+    image = make()
+    monkeypatch.setattr(decorative, "CONTRAST_SIDE", max(image.size) // 4)
+    assert classify_decorative(save(image, tmp_path, f"{make.__name__}.png")) is None
+
+
+def test_contrast_is_measured_on_a_reduced_copy(tmp_path, monkeypatch):
+    image = Image.new("RGBA", (4000, 2500), (255, 255, 255, 0))
+    ImageDraw.Draw(image).line([(0, 1250), (3999, 1250)], fill="black")
+    path = save(image, tmp_path, "wide.png")
+    sizes = []
+    measure = decorative._contrast
+    monkeypatch.setattr(decorative, "_contrast", lambda frame: sizes.append(frame.size) or measure(frame))
+    stats = decorative.image_stats(path)
+    assert (stats["width"], stats["height"]) == (4000, 2500)
+    assert max(sizes[0]) <= decorative.CONTRAST_SIDE
+    assert stats["contrast"] > decorative.DECORATIVE_MAX_CONTRAST
+    assert classify_decorative(save(image.convert("P"), tmp_path, "wide.gif")) is None
@@ -0,0 +1,102 @@
+import io
+import zipfile
+import pytest
+from synthetic_docx import W_NS, R_NS, A_NS, IMAGE_REL, CONTENT_TYPES, PACKAGE_RELS, make_image
+
+V_NS = "urn:schemas-microsoft-com:vml"
+
+
+def blip(rid):
+    return f'<w:p><w:r><w:drawing><a:graphic><a:graphicData><a:blip r:embed="{rid}"/></a:graphicData></a:graphic></w:drawing></w:r></w:p>'
+
+
+def vml(rid):
+    return f'<w:p><w:r><w:pict><v:shape><v:imagedata r:id="{rid}"/></v:shape></w:pict></w:r></w:p>'
+
+
+def part(body, root="w:document"):
+    return (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><{root} xmlns:w="{W_NS}" xmlns:r="{R_NS}" '
+            f'xmlns:a="{A_NS}" xmlns:v="{V_NS}"><w:body>{"".join(body)}</w:body></{root}>')
+
+
+def rels(targets):
+    """A .rels file for {rid: target}; targets starting with "http" are external."""
+    entries = []
+    for rid, target in targets.items():
+        mode = ' TargetMode="External"' if target.startswith("http") else ""
+        entries.append(f'<Relationship Id="{rid}" Type="{IMAGE_REL}" Target="{target}"{mode}/>')
+    return (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            f'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f'{"".join(entries)}</Relationships>')
+
+
+def docx(parts, media):
+    """A DOCX with `parts` as {name: (body, {rid: target})} under word/, and `media` file names."""
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w") as archive:
+        archive.writestr("[Content_Types].xml", CONTENT_TYPES)
+        archive.writestr("_rels/.rels", PACKAGE_RELS)
+        for name, (body, targets) in parts.items():
+            root = "w:hdr" if name.startswith("header") else "w:ftr" if name.startswith("footer") else "w:document"
+            archive.writestr(f"word/{name}", part(body, root))
+            archive.writestr(f"word/_rels/{name}.rels", rels(targets))
+        for name in media:
+            archive.writestr(f"word/media/{name}", make_image((8, 8), "PNG"))
+    return zipfile.ZipFile(out)
+
+
+def test_relative_targets_in_document_order(utils):
+    archive = docx({"document.xml": ([blip("rId2"), blip("rId1"), blip("rId2")],
+                                     {"rId1": "media/image1.png", "rId2": "media/image2.png"})},
+                   ["image1.png", "image2.png"])
+    assert utils.find_images_in_docx(archive) == ["word/media/image2.png", "word/media/image1.png",
+                                                  "word/media/image2.png"]
+
+
+@pytest.mark.parametrize("target", ["/word/media/image1.png", "../word/media/image1.png", "./media/image1.png"])
+def test_target_forms(utils, target):
+    archive = docx({"document.xml": ([blip("rId1")], {"rId1": target})}, ["image1.png"])
+    assert utils.find_images_in_docx(archive) == ["word/media/image1.png"]
+
+
+def test_absolute_targets_alongside_header_images(utils):
+    # The header's image is found, so the word/media fallback never runs: the body's must resolve too
+    archive = docx({
+        "document.xml": ([blip("rId1"), blip("rId2")],
+                         {"rId1": "/word/media/image1.png", "rId2": "/word/media/image2.png"}),
+        "header1.xml": ([blip("rId1")], {"rId1": "media/image3.png"}),
+    }, ["image1.png", "image2.png", "image3.png"])
+    assert utils.find_images_in_docx(archive) == ["word/media/image1.png", "word/media/image2.png",
+                                                  "word/media/image3.png"]
+
+
+def test_headers_and_footers_follow_the_body(utils):
+    archive = docx({
+        "footer1.xml": ([blip("rId1")], {"rId1": "media/footer.png"}),
+        "header2.xml": ([blip("rId1")], {"rId1": "media/header2.png"}),
+        "header1.xml": ([blip("rId1")], {"rId1": "media/header1.png"}),
+        "document.xml": ([blip("rId1")], {"rId1": "media/body.png"}),
+    }, ["footer.png", "header1.png", "header2.png", "body.png"])
+    assert utils.find_images_in_docx(archive) == ["word/media/body.png", "word/media/header1.png",
+                                                  "word/media/header2.png", "word/media/footer.png"]
+
+
+def test_vml_imagedata(utils):
+    archive = docx({"document.xml": ([vml("rId1"), blip("rId2")],
+                                     {"rId1": "media/legacy.png", "rId2": "media/modern.png"})},
+                   ["legacy.png", "modern.png"])
+    assert utils.find_images_in_docx(archive) == ["word/media/legacy.png", "word/media/modern.png"]
+
+
+def test_external_and_missing_targets_are_skipped(utils):
+    archive = docx({"document.xml": ([blip("rId1"), blip("rId2"), blip("rId3")],
+                                     {"rId1": "https://example.com/media/remote.png",
+                                      "rId2": "media/missing.png", "rId3": "media/image1.png"})},
+                   ["image1.png"])
+    assert utils.find_images_in_docx(archive) == ["word/media/image1.png"]
+
+
+def test_falls_back_to_media_folder(utils):
+    # No relationships point at images: every file in word/media/ is taken, by name
+    archive = docx({"document.xml": ([], {})}, ["image2.png", "image1.png"])
+    assert utils.find_images_in_docx(archive) == ["word/media/image1.png", "word/media/image2.png"]
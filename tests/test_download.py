@@ -0,0 +1,87 @@
+import os
+import uuid
+import asyncio
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from synthetic_docx import make_image
+
+
+@pytest.mark.parametrize("header,expected", [
+    (None, None),
+    ("bytes=0-99", (0, 100)),
+    ("bytes=100-", (100, 1000)),  # Open-ended
+    ("bytes=-100", (900, 1000)),  # Suffix: the last 100 bytes
+    ("bytes=-5000", (0, 1000)),  # Suffix longer than the file
+    ("bytes=900-5000", (900, 1000)),  # End past the file is clamped
+    ("bytes=0-99,200-299", None),  # Multiple ranges: sent whole
+    ("items=0-99", None),
+    ("bytes=abc-", None),
+])
+def test_parse_range(main, header, expected):
+    assert main.parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=5000-6000", "bytes=500-100", "bytes=-0"])
+def test_unsatisfiable_range(main, header):
+    with pytest.raises(HTTPException) as e:
+        main.parse_range(header, 1000)
+    assert e.value.status_code == 416
+    assert e.value.headers["Content-Range"] == "bytes */1000"
+
+
+@pytest.fixture(scope="module")
+def result(main, utils):
+    """A published result for a completed job, as /process leaves it."""
+    file_id = uuid.uuid4().hex
+    images = utils.IMAGE_DIR(file_id)
+    os.makedirs(images)
+    with open(os.path.join(images, "compressed_001.jpg"), "wb") as f:
+        f.write(make_image((320, 240)))
+    manifest = [{"index": 1, "media_name": "image1.jpeg", "image_name": "compressed_001.jpg", "size": 1,
+                 "alt_text": "A test image", "status": "ok"}]
+    utils._publish_results_sync(file_id, manifest)
+    asyncio.run(main.jobs.create(file_id, status=main.COMPLETED))
+    client = TestClient(main.app)
+    full = client.get(f"/download/{file_id}")
+    assert full.status_code == 200
+    return client, file_id, full
+
+
+def test_download_length_matches(result):
+    _, _, full = result
+    assert int(full.headers["Content-Length"]) == len(full.content)
+
+
+def test_range_download(result):
+    client, file_id, full = result
+    partial = client.get(f"/download/{file_id}", headers={"Range": "bytes=100-199"})
+    assert partial.status_code == 206
+    assert partial.content == full.content[100:200]
+    assert partial.headers["Content-Range"] == f"bytes 100-199/{len(full.content)}"
+
+
+def test_if_none_match(result):
+    client, file_id, full = result
+    etag = full.headers["ETag"]
+    assert client.get(f"/download/{file_id}", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(f"/download/{file_id}", headers={"If-None-Match": '"other", ' + etag}).status_code == 304
+    assert client.get(f"/download/{file_id}", headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_if_range(result):
+    client, file_id, full = result
+    etag = full.headers["ETag"]
+    matching = client.get(f"/download/{file_id}", headers={"Range": "bytes=-10", "If-Range": etag})
+    assert matching.status_code == 206 and matching.content == full.content[-10:]
+    # The client's copy is of another archive: resend the whole thing
+    stale = client.get(f"/download/{file_id}", headers={"Range": "bytes=-10", "If-Range": '"stale"'})
+    assert stale.status_code == 200 and stale.content == full.content
+
+
+def test_head_reports_size(result):
+    client, file_id, full = result
+    head = client.head(f"/download/{file_id}")
+    assert head.status_code == 200
+    assert head.headers["Content-Length"] == str(len(full.content))
+    assert head.headers["ETag"] == full.headers["ETag"]
@@ -0,0 +1,104 @@
+import os
+import time
+import asyncio
+import pytest
+
+TTL = 3600
+RETENTION = 600
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    """An empty uploads/results/temp_files layout the janitor sweeps."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def make(path, age, size=100):
+    """Write a file of `size` bytes last modified `age` seconds ago."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def upload(file_id, age, size=100):
+    return make(os.path.join("uploads", f"{file_id}_report.docx"), age, size)
+
+
+def result(file_id, age, size=100):
+    return make(os.path.join("results", f"compressed_results_{file_id}.zip"), age, size)
+
+
+def temp(file_id, age, size=100):
+    make(os.path.join("temp_files", file_id, "alt_texts", "image1.txt"), age, size)
+    mtime = time.time() - age
+    for path in (os.path.join("temp_files", file_id, "alt_texts"), os.path.join("temp_files", file_id)):
+        os.utime(path, (mtime, mtime))
+    return os.path.join("temp_files", file_id)
+
+
+def sweep(janitor, store, jobs, startup=False, **limits):
+    """Run one sweep against a store holding `jobs` ({file_id: status})."""
+    jobs_store = store.MemoryJobStore()
+
+    async def run():
+        for file_id, status in jobs.items():
+            await jobs_store.create(file_id, status=status)
+        limits.setdefault("ttl", TTL)
+        limits.setdefault("retention", RETENTION)
+        limits.setdefault("quota_bytes", 10 ** 9)
+        return await janitor.Janitor(jobs_store, **limits).sweep(startup)
+
+    return asyncio.run(run())
+
+
+def test_active_jobs_are_never_evicted(janitor, store, storage):
+    files = [upload("queued", 10 * TTL), upload("running", 10 * TTL), temp("running", 10 * TTL),
+             result("running", 10 * TTL)]
+    done = upload("done", 10 * TTL)
+    stats = sweep(janitor, store, {"queued": store.QUEUED, "running": store.PROCESSING, "done": store.COMPLETED},
+                  startup=True, quota_bytes=0)
+    assert all(os.path.exists(path) for path in files)
+    assert not os.path.exists(done)
+    assert stats["evicted"] == 1
+
+
+def test_expired_files_are_evicted(janitor, store, storage):
+    old, recent = upload("old", TTL + 60), upload("recent", TTL - 60)
+    stats = sweep(janitor, store, {"old": store.COMPLETED, "recent": store.COMPLETED})
+    assert not os.path.exists(old)
+    assert os.path.exists(recent)
+    assert stats == {"evicted": 1, "freed_bytes": 100, "used_bytes": 100, "expired_jobs": 0}
+
+
+def test_quota_evicts_oldest_first(janitor, store, storage):
+    paths = [upload(f"job{age}", age) for age in (300, 200, 100)]
+    stats = sweep(janitor, store, {f"job{age}": store.COMPLETED for age in (300, 200, 100)}, quota_bytes=150)
+    assert [os.path.exists(path) for path in paths] == [False, False, True]
+    assert stats["used_bytes"] == 100
+
+
+def test_results_are_kept_for_the_retention_window(janitor, store, storage):
+    stale, fresh = result("stale", RETENTION + 60), result("fresh", RETENTION - 60)
+    # Uploads of the same age are only bound by the TTL
+    kept_upload = upload("stale", RETENTION + 60)
+    sweep(janitor, store, {"stale": store.COMPLETED, "fresh": store.COMPLETED})
+    assert not os.path.exists(stale)
+    assert os.path.exists(fresh)
+    assert os.path.exists(kept_upload)
+
+
+def test_orphans_are_reclaimed_at_startup(janitor, store, storage):
+    jobs = {"crashed": store.FAILED, "done": store.COMPLETED}
+    leftover_temp, unknown_upload, unknown_result = temp("crashed", 60), upload("unknown", 60), result("unknown", 60)
+    known = upload("done", 60)
+
+    # Only the startup sweep treats them as orphans
+    assert sweep(janitor, store, jobs)["evicted"] == 0
+    stats = sweep(janitor, store, jobs, startup=True)
+    assert stats["evicted"] == 3
+    assert not any(os.path.exists(path) for path in (leftover_temp, unknown_upload, unknown_result))
+    assert os.path.exists(known)
@@ -0,0 +1,17 @@
+import pytest
+from memory_benchmark import measure, SCENARIOS, CEILINGS_MB
+
+
+@pytest.fixture(scope="module", params=list(SCENARIOS))
+def job(request):
+    return measure(request.param)
+
+
+def test_every_image_processed(job):
+    # A job that gave up early would pass any memory ceiling
+    assert job["ok"] == job["images"], job
+
+
+def test_peak_memory_within_ceiling(job):
+    ceiling = CEILINGS_MB[job["scenario"]]
+    assert job["rss_growth_mb"] <= ceiling, f"+{job['rss_growth_mb']} MB, by stage: {job['stage_growth_mb']}"
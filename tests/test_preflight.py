@@ -0,0 +1,194 @@
+import io
+import os
+import sys
+import asyncio
+import subprocess
+import zipfile
+import pytest
+from PIL import Image, UnidentifiedImageError
+from fastapi.testclient import TestClient
+from synthetic_docx import build_docx, make_image, synthetic_images
+import preflight
+from preflight import BudgetExceeded, check_archive, gif_header, plan_images, OK, STILL, SKIP
+
+MB = 1024 * 1024
+
+
+def archive(members, compression=zipfile.ZIP_DEFLATED):
+    """A zip of {name: bytes}, opened for reading."""
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w", compression) as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return zipfile.ZipFile(out)
+
+
+def test_compression_ratio_limit():
+    with pytest.raises(BudgetExceeded, match="expands"):
+        check_archive(archive({"word/document.xml": b"\0" * (4 * MB)}))
+
+
+def test_small_members_may_compress_well():
+    # Under RATIO_MIN_BYTES, however repetitive: ordinary XML parts look like this
+    assert check_archive(archive({"word/document.xml": b"<w:p/>" * 100_000})) == 600_000
+
+
+def test_total_uncompressed_limit(monkeypatch):
+    monkeypatch.setattr(preflight, "MAX_UNCOMPRESSED_MB", 1)
+    members = {f"word/media/image{i}.png": os.urandom(MB // 2) for i in range(3)}
+    with pytest.raises(BudgetExceeded, match="over the 1 MB limit"):
+        check_archive(archive(members, zipfile.ZIP_STORED))
+
+
+def test_pillow_limit_is_set_at_startup_only(monkeypatch):
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 123)
+    monkeypatch.setattr(preflight, "MAX_IMAGE_PIXELS", 456)
+    assert Image.MAX_IMAGE_PIXELS == 123
+    preflight.apply_limits()
+    assert Image.MAX_IMAGE_PIXELS == 456
+
+
+def gif(frames=1, size=(16, 12)):
+    return make_image(size, "GIF", frames=frames)
+
+
+@pytest.mark.parametrize("frames", [1, 5])
+def test_gif_header(frames):
+    assert gif_header(io.BytesIO(gif(frames))) == (16, 12, frames)
+
+
+def test_gif_frame_count_stops_past_budget():
+    assert gif_header(io.BytesIO(gif(10)), max_frames=3) == (16, 12, 4)
+
+
+@pytest.mark.parametrize("data", [b"", b"GIF89a\x10\x00", b"\x89PNG\r\n\x1a\n" + b"\0" * 20])
+def test_not_a_gif(data):
+    with pytest.raises(ValueError):
+        gif_header(io.BytesIO(data))
+
+
+@pytest.mark.parametrize("cut", [13, 20, 40, -20, -1])
+def test_truncated_gif_counts_what_is_there(cut):
+    width, height, frames = gif_header(io.BytesIO(gif(5)[:cut]))
+    assert (width, height) == (16, 12)
+    assert 0 <= frames <= 5
+
+
+def docx_zip(images):
+    return zipfile.ZipFile(io.BytesIO(build_docx(images)))
+
+
+def test_plan(monkeypatch):
+    monkeypatch.setattr(preflight, "MAX_IMAGE_PIXELS", 100 * 100)
+    monkeypatch.setattr(preflight, "MAX_GIF_FRAMES", 3)
+    images = [("jpeg", make_image((64, 48))), ("png", make_image((200, 100), "PNG")),
+              ("gif", gif(5)), ("gif", gif(2, (20, 20))), ("jpeg", make_image((64, 48)))]
+    docx = docx_zip(images)
+    media = [f"word/media/image{i}.{ext}" for i, (ext, _) in enumerate(images, 1)]
+    media[-1] = media[0]  # The same picture twice
+    plan = plan_images(docx, media)
+    assert [entry["action"] for entry in plan] == [OK, SKIP, STILL, OK, OK]
+    assert plan[1]["reason"] == "over the 10000 pixel limit"
+    assert plan[2] == {"action": STILL, "frames": 1, "reason": "over the 3 frame limit"}
+    assert plan[3]["frames"] == 2
+
+
+def test_unreadable_headers_are_left_to_processing():
+    docx = archive({"word/media/image1.png": b"not an image", "word/media/image2.gif": b"GIF8"})
+    plan = plan_images(docx, ["word/media/image1.png", "word/media/image2.gif"])
+    assert plan == [{"action": OK, "frames": None, "reason": None}] * 2
+
+
+def test_too_many_images(monkeypatch):
+    monkeypatch.setattr(preflight, "MAX_IMAGES", 2)
+    with pytest.raises(BudgetExceeded, match="3 images, over the 2 image limit"):
+        plan_images(docx_zip([("jpeg", make_image((8, 8)))] * 3), ["word/media/image1.jpeg"] * 3)
+
+
+@pytest.fixture
+def client(main):
+    return TestClient(main.app)
+
+
+def upload(client, data, name="report.docx"):
+    return client.post("/upload/", files={"file": (name, data)})
+
+
+def test_upload_of_non_zip(client):
+    response = upload(client, b"%PDF-1.7 not a document")
+    assert response.status_code == 400
+
+
+def test_upload_of_zip_bomb(client):
+    bomb = io.BytesIO()
+    with zipfile.ZipFile(bomb, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("word/document.xml", b"\0" * (8 * MB))
+    response = upload(client, bomb.getvalue())
+    assert response.status_code == 413
+    assert "expands" in response.json()["detail"]
+
+
+def test_process_with_too_many_images(main, client, monkeypatch):
+    monkeypatch.setattr(preflight, "MAX_IMAGES", 2)
+    file_id = upload(client, build_docx(synthetic_images(3, sizes=[(8, 8)]))).json()["file_id"]
+    response = client.post(f"/process/{file_id}")
+    assert response.status_code == 413
+    assert client.get(f"/status/{file_id}").json()["status"] == main.FAILED
+
+
+def test_skipped_images_are_reported(utils, monkeypatch):
+    monkeypatch.setattr(preflight, "MAX_IMAGE_PIXELS", 100 * 100)
+    path = "skipped.docx"
+    build_docx([("jpeg", make_image((64, 48))), ("png", make_image((200, 100), "PNG"))], path)
+
+    async def collect():
+        return [image async for image in utils.iter_images_from_docx(path, "preflight-skip")]
+
+    first, second = asyncio.run(collect())
+    assert first["path"] and not first.get("skipped")
+    assert second["path"] is None and second["skipped"] == "over the 10000 pixel limit"
+
+
+def encoded(fmt):
+    out = io.BytesIO()
+    Image.new("RGB", (32, 24), "teal").save(out, fmt)
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("fmt", ["PPM", "ICO", "TGA"])
+def test_other_formats_are_unreadable(fmt):
+    with pytest.raises(UnidentifiedImageError):
+        preflight.open_image(io.BytesIO(encoded(fmt)))
+    assert preflight.image_header(archive({"word/media/image1.bin": encoded(fmt)}), "word/media/image1.bin") is None
+
+
+@pytest.mark.parametrize("fmt", ["JPEG", "PNG", "GIF", "BMP", "TIFF", "WEBP"])
+def test_allowed_formats_open(fmt):
+    with preflight.open_image(io.BytesIO(encoded(fmt))) as image:
+        assert image.format == fmt and image.size == (32, 24)
+
+
+def test_unknown_format_loads_no_other_decoders(tmp_path):
+    # In a fresh interpreter, since anything earlier in this one may have loaded them
+    path = tmp_path / "image.psd"
+    path.write_bytes(b"8BPS" + b"\0" * 64)
+    script = ("import sys, preflight\n"
+              "try:\n    preflight.open_image(sys.argv[1])\nexcept Exception as e:\n    print(type(e).__name__)\n"
+              "print(sorted(m for m in sys.modules if m.startswith('PIL.') and m.endswith('ImagePlugin')))")
+    result = subprocess.run([sys.executable, "-c", script, str(path)], capture_output=True, text=True, check=True,
+                            env=dict(os.environ, PYTHONPATH=os.path.dirname(preflight.__file__)))
+    error, plugins = result.stdout.splitlines()
+    assert error == "UnidentifiedImageError"
+    assert "PIL.PsdImagePlugin" not in plugins
+
+
+def test_unreadable_format_is_reported_as_failed(utils):
+    path = "ppm.docx"
+    build_docx([("ppm", encoded("PPM")), ("png", make_image((64, 48), "PNG"))], path)
+
+    async def collect():
+        return [image async for image in utils.iter_images_from_docx(path, "preflight-ppm")]
+
+    unreadable, png = asyncio.run(collect())
+    assert unreadable["path"] is None and not unreadable.get("skipped")
+    assert png["path"]
@@ -0,0 +1,126 @@
+import os
+import json
+import uuid
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from synthetic_docx import build_docx, synthetic_images
+
+
+def queued_job(main, images=()):
+    file_id = uuid.uuid4().hex
+    file_path = f"{file_id}.docx"
+    if images:
+        build_docx(images, file_path)
+    asyncio.run(main.jobs.create(file_id, status=main.QUEUED, file_path=file_path))
+    return file_id
+
+
+@pytest.fixture
+def captioner(main, monkeypatch):
+    """Caption every image locally instead of calling the gemini service."""
+    async def iter_alt_texts(images, file_id, on_progress=None, trace=None):
+        async for image in images:
+            image["size"] = os.path.getsize(image["path"]) if image["path"] else 0
+            image["alt_text"] = f"Image {image['index']}" if image["path"] else None
+            yield [image]
+
+    monkeypatch.setattr(main, "iter_alt_texts", iter_alt_texts)
+
+
+@pytest.mark.parametrize("error", [RuntimeError("store is down"), asyncio.CancelledError()], ids=["error", "cancelled"])
+def test_stream_ends_when_job_crashes(main, monkeypatch, error):
+    """A job that dies outside run_job's own error handling still closes the stream with a failed line."""
+    async def crash(ticket, file_id, file_path, on_record=None, **options):
+        async with ticket:
+            await on_record({"index": 1, "alt_text": "first image"})
+            raise error
+
+    monkeypatch.setattr(main, "run_job_in_background", crash)
+    response = TestClient(main.app).post(f"/process/{queued_job(main)}?stream=true")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[0] == {"index": 1, "alt_text": "first image"}
+    assert lines[-1]["status"] == main.FAILED
+    assert len(lines) == 2
+
+
+@pytest.mark.parametrize("captions_only", [False, True], ids=["zip", "captions_only"])
+def test_records_name_images(main, captioner, captions_only):
+    file_id = queued_job(main, synthetic_images(2, sizes=[(64, 48)], formats=["jpeg", "png"]))
+    response = TestClient(main.app).post(f"/process/{file_id}?stream=true&captions_only={str(captions_only).lower()}")
+    records = [json.loads(line) for line in response.text.splitlines()][:-1]
+    assert [record["media_name"] for record in records] == ["image1.jpeg", "image2.png"]
+    if captions_only:
+        # Nothing is delivered, so there is no ZIP name to give, and no temporary one
+        assert [record["image_name"] for record in records] == [None, None]
+    else:
+        assert [record["image_name"] for record in records] == ["compressed_001.jpg", "compressed_002.jpg"]
+
+
+@pytest.fixture
+def admission(main, monkeypatch):
+    """One run slot and one queue place, so tests can fill the worker."""
+    from admission import AdmissionController
+    controller = AdmissionController(max_jobs=1, max_queue=1)
+    monkeypatch.setattr(main, "admission", controller)
+    return controller
+
+
+def test_job_stays_queued_while_waiting(main, admission):
+    file_id = queued_job(main)
+
+    async def run():
+        running = admission.reserve()
+        await running.__aenter__()  # Another job holds the only slot
+        request = asyncio.create_task(main.process_file(file_id, None))
+        await asyncio.sleep(0.01)
+        assert admission.waiting == 1
+        assert (await main.jobs.get(file_id))["status"] == main.QUEUED
+        # The client goes away before the job ever starts
+        request.cancel()
+        await asyncio.gather(request, return_exceptions=True)
+        await running.__aexit__(None, None, None)
+        return await main.jobs.get(file_id)
+
+    assert asyncio.run(run())["status"] == main.QUEUED
+    assert admission.waiting == 0 and admission.running == 0
+
+
+def test_saturated_worker_turns_jobs_away(main, admission):
+    client = TestClient(main.app)
+    assert client.get("/load").status_code == 200
+    tickets = [admission.reserve(), admission.reserve()]
+    load = client.get("/load")
+    assert load.status_code == 503
+    assert load.json()["waiting"] == 2
+
+    file_id = queued_job(main)
+    response = client.post(f"/process/{file_id}")
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert asyncio.run(main.jobs.get(file_id))["status"] == main.QUEUED
+    assert admission.stats()["rejected"] == 1
+
+    for ticket in tickets:
+        ticket.cancel()
+    assert client.get("/load").status_code == 200
+
+
+def test_claim_lost_while_waiting(main, admission):
+    file_id = queued_job(main)
+
+    async def run():
+        running = admission.reserve()
+        await running.__aenter__()
+        request = asyncio.create_task(main.process_file(file_id, None))
+        await asyncio.sleep(0.01)
+        # Another worker starts the job first
+        assert await main.jobs.transition(file_id, [main.QUEUED], main.PROCESSING)
+        await running.__aexit__(None, None, None)
+        with pytest.raises(main.HTTPException) as e:
+            await request
+        return e.value
+
+    error = asyncio.run(run())
+    assert error.status_code == 409
+    assert admission.running == 0 and admission.waiting == 0
@@ -0,0 +1,24 @@
+import asyncio
+from synthetic_docx import synthetic_images, build_docx
+
+
+def test_profiled_job_covers_thread_pool_work(utils, tmp_path):
+    import metrics
+    import profiling
+
+    path = str(tmp_path / "doc.docx")
+    build_docx(synthetic_images(3, sizes=[(640, 480)]), path)
+
+    async def job():
+        # As in the service: blocking work goes through the instrumented pool
+        asyncio.get_running_loop().set_default_executor(metrics.InstrumentedThreadPool())
+        async with profiling.profile_job("job", str(tmp_path / "profile")) as profile:
+            images = [image async for image in utils.iter_images_from_docx(path, "job")]
+        return profile, images
+
+    profile, images = asyncio.run(job())
+    assert profile is not None
+    assert all(image["path"] for image in images)
+    with open(tmp_path / "profile" / profiling.PROFILE_TEXT_FILE) as f:
+        text = f.read()
+    assert "compress_image" in text
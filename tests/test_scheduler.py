@@ -0,0 +1,50 @@
+import asyncio
+import pytest
+
+
+async def hold(scheduler, file_id, started, release):
+    async with scheduler.slot(file_id):
+        started.append(file_id)
+        await release.wait()
+
+
+@pytest.mark.parametrize("shortest_first,order", [
+    (False, ["big", "big", "small", "big"]),  # Turns alternate between jobs
+    (True, ["big", "small", "big", "big"]),  # "small" has been served least
+])
+def test_dispatch_order(utils, shortest_first, order):
+    async def run():
+        scheduler = utils.BatchScheduler(concurrency=1, shortest_first=shortest_first)
+        started, release = [], asyncio.Event()
+        # "big" queues three batches before "small" queues one, all behind big's first
+        tasks = [asyncio.create_task(hold(scheduler, file_id, started, release))
+                 for file_id in ["big", "big", "big", "small"]]
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(*tasks)
+        return started, scheduler
+
+    started, scheduler = asyncio.run(run())
+    assert started == order
+    assert scheduler.served == {} and scheduler.in_flight == {} and not scheduler.waiting
+
+
+def test_cancelled_waiter_is_forgotten(utils):
+    async def run():
+        scheduler = utils.BatchScheduler(concurrency=1)
+        started, release = [], asyncio.Event()
+        running = asyncio.create_task(hold(scheduler, "running", started, release))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(hold(scheduler, "cancelled", started, release))
+        await asyncio.sleep(0)
+        assert "cancelled" in scheduler.served
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        release.set()
+        await running
+        return started, scheduler
+
+    started, scheduler = asyncio.run(run())
+    assert started == ["running"]
+    assert scheduler.served == {} and scheduler.in_flight == {} and not scheduler.waiting
+    assert scheduler.active == 0
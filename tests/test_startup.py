@@ -0,0 +1,20 @@
+import pytest
+from startup_benchmark import measure, SERVICES, BUDGETS_MS, LAZY_MODULES
+
+
+@pytest.fixture(scope="module", params=list(SERVICES))
+def startup(request):
+    try:
+        return measure(request.param, runs=3)
+    except RuntimeError as e:
+        pytest.skip(f"{request.param} can't be imported here: {e}")
+
+
+def test_heavy_dependencies_load_lazily(startup):
+    eager = startup["modules"] & LAZY_MODULES[startup["service"]]
+    assert not eager, f"imported at startup: {sorted(eager)}"
+
+
+def test_startup_within_budget(startup):
+    budget = BUDGETS_MS[startup["service"]]
+    assert startup["total_ms"] <= budget, f"{startup['total_ms']} ms, slowest: {startup['slowest']}"
@@ -0,0 +1,67 @@
+import time
+import asyncio
+import threading
+import pytest
+
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / "jobs.db")
+
+
+def test_sqlite_transition_has_one_winner(store, db):
+    """Two stores on one database, as in two workers: only one may start the job."""
+    first, second = store.SqliteJobStore(db), store.SqliteJobStore(db)
+
+    for attempt in range(20):
+        file_id = f"job{attempt}"
+        asyncio.run(first.create(file_id, status=store.QUEUED))
+        barrier = threading.Barrier(2)
+        wins = []
+
+        def claim(jobs):
+            barrier.wait()
+            wins.append(jobs._update(file_id, {"status": store.PROCESSING}, (store.QUEUED,)))
+
+        threads = [threading.Thread(target=claim, args=(jobs,)) for jobs in (first, second)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(wins) == [False, True]
+        assert asyncio.run(second.get(file_id))["status"] == store.PROCESSING
+
+
+def test_sqlite_transition_keeps_fields(store, db):
+    jobs = store.SqliteJobStore(db)
+
+    async def run():
+        await jobs.create("job", status=store.QUEUED, filename="a.docx")
+        assert await jobs.transition("job", [store.QUEUED], store.PROCESSING, progress=0)
+        assert not await jobs.transition("job", [store.QUEUED], store.PROCESSING)
+        assert not await jobs.transition("missing", [store.QUEUED], store.PROCESSING)
+        return await jobs.get("job")
+
+    assert asyncio.run(run()) == {"file_id": "job", "status": store.PROCESSING, "filename": "a.docx", "progress": 0}
+
+
+@pytest.mark.parametrize("backend", ["SqliteJobStore", "MemoryJobStore"])
+def test_evict_expired(store, db, backend, monkeypatch):
+    jobs = store.SqliteJobStore(db, ttl=60) if backend == "SqliteJobStore" else store.MemoryJobStore(ttl=60)
+    start = time.time()
+
+    async def run():
+        await jobs.create("old", status=store.COMPLETED)
+        await jobs.append_event("old", {"status": "processing"})
+        monkeypatch.setattr(time, "time", lambda: start + 30)
+        await jobs.create("recent", status=store.COMPLETED)
+        await jobs.append_event("recent", {"status": "processing"})
+        # Past the TTL for "old", not for "recent"
+        monkeypatch.setattr(time, "time", lambda: start + 75)
+        assert await jobs.evict_expired() == 1
+        assert await jobs.get("old") is None
+        assert await jobs.events_since("old", 0) == []
+        assert (await jobs.get("recent"))["status"] == store.COMPLETED
+        assert await jobs.events_since("recent", 0) == [(1, {"status": "processing"})]
+
+    asyncio.run(run())
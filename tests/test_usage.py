@@ -0,0 +1,88 @@
+import json
+from types import SimpleNamespace
+import pytest
+from usage import UsageLog
+
+
+def response(input_tokens, output_tokens):
+    return SimpleNamespace(usage_metadata=SimpleNamespace(prompt_token_count=input_tokens,
+                                                          candidates_token_count=output_tokens))
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    return tmp_path / "usage.jsonl"
+
+
+def test_every_call_is_appended(log_path):
+    usage = UsageLog(path=str(log_path))
+    usage.record("model", 8, 4000, 1.23456, response(1200, 80))
+    usage.record("model", 2, 1000, 0.5, error="429 quota exhausted")
+    first, second = [json.loads(line) for line in log_path.read_text().splitlines()]
+    assert {key: first[key] for key in ("model", "images", "payload_bytes", "latency_seconds",
+                                        "input_tokens", "output_tokens", "error")} == {
+        "model": "model", "images": 8, "payload_bytes": 4000, "latency_seconds": 1.2346,
+        "input_tokens": 1200, "output_tokens": 80, "error": None}
+    assert (second["images"], second["input_tokens"], second["error"]) == (2, 0, "429 quota exhausted")
+    # A new log over the same file appends instead of truncating
+    UsageLog(path=str(log_path)).record("model", 1, 100, 0.1, response(10, 1))
+    assert len(log_path.read_text().splitlines()) == 3
+
+
+def test_totals_and_cost_per_image(log_path):
+    usage = UsageLog(path=str(log_path))
+    usage.record("model", 8, 8000, 2.0, response(2000, 160))
+    usage.record("model", 8, 8000, 4.0, response(2400, 160))
+    usage.record("model", 4, 4000, 6.0, error="timeout")
+    summary = usage.summary()
+    assert {key: summary[key] for key in ("calls", "errors", "images", "captioned_images", "payload_bytes",
+                                          "input_tokens", "output_tokens", "latency_seconds")} == {
+        "calls": 3, "errors": 1, "images": 20, "captioned_images": 16, "payload_bytes": 20000,
+        "input_tokens": 4400, "output_tokens": 320, "latency_seconds": 12.0}
+    assert summary["mean_latency_seconds"] == 4.0
+    # Token costs only count images that were captioned; payload counts every image sent
+    assert summary["input_tokens_per_image"] == 275.0
+    assert summary["output_tokens_per_image"] == 20.0
+    assert summary["payload_bytes_per_image"] == 1000
+
+
+def test_percentiles_cover_the_recent_window(log_path):
+    usage = UsageLog(path=str(log_path), window=10)
+    for latency in range(1, 21):
+        usage.record("model", 8, 8000, float(latency), response(100, 10))
+    # Failed calls don't count towards the latency percentiles
+    usage.record("model", 8, 8000, 300.0, error="timeout")
+    summary = usage.summary()
+    assert summary["p50_latency_seconds"] == 16.0
+    assert summary["p95_latency_seconds"] == 20.0
+    assert summary["calls"] == 21
+
+
+def test_breakdown_by_images_per_call(log_path):
+    usage = UsageLog(path=str(log_path))
+    usage.record("model", 8, 8000, 2.0, response(2000, 160))
+    usage.record("model", 2, 2000, 1.0, response(600, 40))
+    usage.record("model", 8, 8000, 4.0, error="timeout")
+    by_images = usage.summary()["by_images_per_call"]
+    assert list(by_images) == ["2", "8"]
+    assert (by_images["2"]["calls"], by_images["2"]["input_tokens_per_image"]) == (1, 300.0)
+    assert (by_images["8"]["calls"], by_images["8"]["errors"], by_images["8"]["input_tokens_per_image"]) == (2, 1, 250.0)
+    assert by_images["8"]["mean_latency_seconds"] == 3.0
+
+
+@pytest.mark.parametrize("result", [SimpleNamespace(), SimpleNamespace(usage_metadata=None),
+                                    response(None, None)], ids=["no-attribute", "none", "empty"])
+def test_missing_usage_metadata_counts_no_tokens(log_path, result):
+    usage = UsageLog(path=str(log_path))
+    entry = usage.record("model", 4, 4000, 1.0, result)
+    assert (entry["input_tokens"], entry["output_tokens"]) == (0, 0)
+    summary = usage.summary()
+    assert (summary["captioned_images"], summary["input_tokens_per_image"]) == (4, 0.0)
+
+
+def test_empty_log(log_path):
+    summary = UsageLog(path=str(log_path)).summary()
+    assert summary["calls"] == 0
+    assert summary["mean_latency_seconds"] is summary["p50_latency_seconds"] is summary["input_tokens_per_image"] is None
+    assert summary["by_images_per_call"] == {}
+    assert not log_path.exists()
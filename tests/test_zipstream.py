@@ -0,0 +1,62 @@
+import io
+import zipfile
+import pytest
+from synthetic_docx import make_image
+from zipstream import entry_for, bytes_entry, archive_size, iter_archive, write_archive, _segments
+
+TIMESTAMP = 1_700_000_000
+
+
+@pytest.fixture
+def entries(tmp_path):
+    photo = tmp_path / "001.jpg"
+    photo.write_bytes(make_image((320, 240)))
+    chart = tmp_path / "002.png"
+    chart.write_bytes(make_image((200, 100), "PNG"))
+    notes = tmp_path / "notes.txt"
+    notes.write_text("line\n" * 2000)
+    return [
+        entry_for("compressed_images/001.jpg", str(photo)),
+        entry_for("compressed_images/002.png", str(chart)),
+        entry_for("notes.txt", str(notes)),
+        bytes_entry("alt_texts.json", b'[{"alt_text": "A chart"}]' * 50),
+        bytes_entry("alt_texts/été.txt", "Café on a summer day".encode("utf-8")),
+        bytes_entry("empty.txt", b"", compress=False),
+    ]
+
+
+def archive(entries):
+    return b"".join(iter_archive(entries, TIMESTAMP))
+
+
+def test_written_archive_is_valid(entries, tmp_path):
+    path = tmp_path / "out.zip"
+    write_archive(entries, TIMESTAMP, str(path))
+    with zipfile.ZipFile(path) as result:
+        assert result.testzip() is None
+        assert result.namelist() == [entry["name"] for entry in entries]
+        assert result.read("notes.txt") == (tmp_path / "notes.txt").read_bytes()
+        assert result.read("alt_texts/été.txt").decode("utf-8") == "Café on a summer day"
+    assert path.read_bytes() == archive(entries)
+
+
+def test_size_is_known_up_front(entries):
+    assert archive_size(entries) == len(archive(entries))
+    assert archive_size([]) == len(archive([]))
+    with zipfile.ZipFile(io.BytesIO(archive([]))) as result:
+        assert result.namelist() == []
+
+
+def test_ranges_match_full_archive(entries):
+    full = archive(entries)
+    size = len(full)
+    # Every boundary between headers and file data, and a byte either side of it
+    boundaries = [0]
+    for length, _ in _segments(entries, TIMESTAMP):
+        boundaries.append(boundaries[-1] + length)
+    offsets = sorted({min(max(edge + delta, 0), size) for edge in boundaries for delta in (-1, 0, 1)})
+    for start in offsets:
+        for end in offsets:
+            if start < end:
+                assert b"".join(iter_archive(entries, TIMESTAMP, start, end)) == full[start:end], (start, end)
+        assert b"".join(iter_archive(entries, TIMESTAMP, start)) == full[start:]